@@ -1,3 +1,15 @@
 from django.contrib import admin
+from .models import MissenseJob, ResultCacheEntry
 
 # Register your models here.
+
+@admin.register(MissenseJob)
+class MissenseJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'input_name', 'variants_done', 'variants_total', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('stage_timings',)
+
+
+@admin.register(ResultCacheEntry)
+class ResultCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'size_bytes', 'hits', 'created_at', 'last_access')
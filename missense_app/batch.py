@@ -0,0 +1,322 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.utils.text import get_valid_filename
+from .compression import SUFFIXES, open_file, strip_suffix
+from .instrumentation import PipelineStats
+from .peptide_processor import (process_mutations, output_files, OUTPUT_FILES, COUNTS_FILE, PeptideDeduplicator,
+                                PreviewWriter)
+from .reference import load_reference
+
+# Arquivo (JSON Lines) com os arquivos já concluídos, gravado no diretório de saída
+CHECKPOINT_FILE = '.missense-checkpoint.jsonl'
+STATS_FILE = 'stats.json'
+
+# Envio de vários arquivos pelo formulário: entradas em <job>/inputs, saídas de cada
+# arquivo em <job>/outputs/<nome>, registros de emissões (para a base unificada) em
+# <job>/emissions, base unificada em <job>/ e tudo junto no zip
+BATCH_INPUTS_DIR = 'inputs'
+BATCH_OUTPUTS_DIR = 'outputs'
+BATCH_EMISSIONS_DIR = 'emissions'
+ARCHIVE_FILE = 'results.zip'
+
+
+def expand_inputs(padroes):
+    """
+    Expande caminhos e globs (inclusive '**') em uma lista ordenada de arquivos, sem
+    repetições. Retorna (arquivos, padrões que não corresponderam a nenhum arquivo).
+    """
+    arquivos = []
+    vistos = set()
+    sem_arquivos = []
+    for padrao in padroes:
+        encontrados = sorted(glob.glob(padrao, recursive=True)) if glob.has_magic(padrao) else [padrao]
+        encontrados = [os.path.abspath(caminho) for caminho in encontrados if os.path.isfile(caminho)]
+        if not encontrados:
+            sem_arquivos.append(padrao)
+        for caminho in encontrados:
+            if caminho not in vistos:
+                vistos.add(caminho)
+                arquivos.append(caminho)
+    return arquivos, sem_arquivos
+
+
+def output_names(arquivos):
+    """
+    Nome do diretório de saída de cada entrada: o nome do arquivo sem extensões
+    ('coorte1.tsv.gz' -> 'coorte1'). Nomes repetidos recebem um sufixo derivado do
+    caminho completo, estável entre execuções.
+    """
+    bases = {caminho: os.path.splitext(strip_suffix(os.path.basename(caminho)))[0] for caminho in arquivos}
+    repetidos = {base for base in bases.values() if list(bases.values()).count(base) > 1}
+    nomes = {}
+    for caminho, base in bases.items():
+        if base in repetidos:
+            base = f"{base}-{hashlib.sha1(caminho.encode('utf-8')).hexdigest()[:8]}"
+        nomes[caminho] = base
+    return nomes
+
+
+def _fingerprint(caminho):
+    st = os.stat(caminho)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+class Checkpoint:
+    """
+    Registro dos arquivos concluídos. Cada conclusão é acrescentada como uma linha e
+    gravada em disco na hora, então uma execução interrompida perde no máximo o
+    arquivo em andamento. Um arquivo modificado desde a conclusão, ou concluído com
+    outras opções (options: referência, compressão, digestão, deduplicação), é
+    reprocessado.
+    """
+
+    def __init__(self, path, options=None):
+        self.path = path
+        self.options = options or {}
+        self.concluidos = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for lin in f:
+                    try:
+                        registro = json.loads(lin)
+                    except ValueError:
+                        continue  # Linha incompleta de uma execução interrompida
+                    self.concluidos[registro['input']] = registro
+
+    def is_done(self, caminho, destino):
+        registro = self.concluidos.get(caminho)
+        return (registro is not None and registro['fingerprint'] == _fingerprint(caminho)
+                and registro.get('options') == self.options
+                and registro['output'] == destino and os.path.isdir(destino))
+
+    def mark_done(self, caminho, destino, stats):
+        registro = {'input': caminho, 'fingerprint': _fingerprint(caminho), 'options': self.options,
+                    'output': destino, 'stats': stats}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(registro) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.concluidos[caminho] = registro
+
+
+def ignore_interrupts():
+    """Inicializador dos processos do lote: o Ctrl-C é tratado só pelo processo principal."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process_file(proteinas, entrada, destino, backend=None, workers=1, compression=None, rules=None,
+                 deduplicate=None, emissions=None):
+    """
+    Processa um arquivo de variantes para destino/ (dbsaida, dbpepmutref, dbfinal,
+    dbpepcounts com a deduplicação e stats.json). As saídas são gravadas em um diretório temporário e renomeadas no
+    fim, para que um destino existente esteja sempre completo. emissions é repassado a process_mutations.
+    Retorna as estatísticas.
+    """
+    tmp = f'{destino}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        inicio = time.perf_counter()
+        sufixo = SUFFIXES[compression] if compression else ''
+        caminhos = [os.path.join(tmp, nome + sufixo) for nome in OUTPUT_FILES]
+        results = process_mutations(proteinas, entrada, *caminhos, backend=backend, workers=workers,
+                                    compression=compression, rules=rules, deduplicate=deduplicate,
+                                    emissions=emissions)
+        stats = dict(results['stats'], seconds=round(time.perf_counter() - inicio, 4))
+        with open(os.path.join(tmp, STATS_FILE), 'w') as f:
+            json.dump(stats, f, indent=2)
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(tmp, destino)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return stats
+
+
+def batch_input_name(indice, nome):
+    """Nome de uma entrada do envio em lote: a ordem do formulário seguida do nome saneado."""
+    return os.path.join(BATCH_INPUTS_DIR, f'{indice:03d}-{get_valid_filename(os.path.basename(nome)) or "input"}')
+
+
+def _protein_ranges(f):
+    """
+    {NP: [(início, fim), ...]} dos trechos de cada proteína em um arquivo binário
+    aberto, com o NP no primeiro campo de cada linha (com ou sem '>'), na ordem do
+    arquivo.
+    """
+    trechos = {}
+    atual, inicio, posicao = None, 0, 0
+    for lin in f:
+        id_ = lin[:lin.find(b'\t')].lstrip(b'>').decode('utf-8')
+        if id_ != atual:
+            if atual is not None:
+                trechos.setdefault(atual, []).append((inicio, posicao))
+            atual, inicio = id_, posicao
+        posicao += len(lin)
+    if atual is not None:
+        trechos.setdefault(atual, []).append((inicio, posicao))
+    return trechos
+
+
+def _read_ranges(f, trechos):
+    for inicio, fim in trechos:
+        f.seek(inicio)
+        yield f.read(fim - inicio).decode('utf-8')
+
+
+def merge_outputs(partes, caminhos, compression=None, deduplicate=False, dbpepcounts=None, tmp_dir=None):
+    """
+    Base unificada de várias execuções, como se as entradas tivessem sido
+    processadas juntas (concatenadas na ordem de partes): um registro por proteína
+    no dbfinal, na ordem da primeira aparição, com os peptídeos das execuções em
+    ordem, e o dbpepmutref agrupado da mesma forma. partes é a lista de
+    (dbpepmutref, registro de emissões) de cada execução; caminhos, os destinos
+    (dbsaida, dbpepmutref, dbfinal). Com deduplicate as emissões passam por um
+    PeptideDeduplicator e as contagens vão para dbpepcounts. Retorna a prévia de
+    cada saída e o número de peptídeos distintos (None sem deduplicação).
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='missense-merge-', dir=tmp_dir)
+    abertos = []
+    try:
+        # dbpepmutref (talvez comprimido) copiado sem compressão, para a leitura por trechos
+        fontes = []
+        for n, (relacao, emissoes) in enumerate(partes):
+            copia = os.path.join(tmp_dir, f'relation-{n:05d}.txt')
+            with open_file(relacao, 'rb') as origem, open(copia, 'wb') as destino:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+            arquivos = (open(copia, 'rb'), open(emissoes, 'rb'))
+            abertos.extend(arquivos)
+            fontes.append([(f, _protein_ranges(f)) for f in arquivos])
+        ordem = dict.fromkeys(id_ for fonte in fontes for _, trechos in fonte for id_ in trechos)
+
+        saidas = [PreviewWriter(f) for f in (open_file(caminho, 'w', compression) for caminho in caminhos)]
+        try:
+            dbsaida, dbrelacao, dbfinal = saidas
+            dedup = PeptideDeduplicator(dbsaida, dbfinal, tmp_dir) if deduplicate else None
+            for id_ in ordem:
+                aberto = False
+                for (relacao, trechos_relacao), (emissoes, trechos_emissoes) in fontes:
+                    for texto in _read_ranges(relacao, trechos_relacao.get(id_, ())):
+                        dbrelacao.write(texto)
+                    for texto in _read_ranges(emissoes, trechos_emissoes.get(id_, ())):
+                        for lin in texto.splitlines():
+                            _, origem, peptideo = lin.split('\t')
+                            if dedup is not None:
+                                dedup.add(id_, origem, peptideo)
+                                continue
+                            dbsaida.write(f">{id_}\n{peptideo}\n")
+                            if not aberto:
+                                dbfinal.write(f">{id_}\n")
+                                aberto = True
+                            dbfinal.write(peptideo)
+                if aberto:
+                    dbfinal.write("\n")
+            previas = {}
+            if dedup is not None:
+                dedup.close()
+                contagens = PreviewWriter(open_file(dbpepcounts, 'w', compression))
+                try:
+                    dedup.write_counts(contagens)
+                finally:
+                    contagens.close()
+                previas[COUNTS_FILE.split('.')[0]] = contagens.preview
+        finally:
+            for saida in saidas:
+                saida.close()
+        for nome, saida in zip(OUTPUT_FILES, saidas):
+            previas[nome.split('.')[0]] = saida.preview
+        return previas, len(dedup) if dedup is not None else None
+    finally:
+        for f in abertos:
+            f.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run_batch_pipeline(temp_dir, progress=None):
+    """
+    Processa as entradas de <temp_dir>/inputs ao mesmo tempo, em até
+    MISSENSE_BATCH_CONCURRENCY processos que herdam (fork) a referência já carregada,
+    de modo que o tempo total acompanha o maior arquivo. Grava as saídas de cada
+    arquivo em outputs/<nome>, a base unificada (junção por proteína na ordem do
+    envio, com a deduplicação de MISSENSE_DEDUPLICATE; ver merge_outputs) em
+    temp_dir e tudo em results.zip. progress('batch', arquivos concluídos, total)
+    recebe o andamento. Retorna a prévia da base unificada, as estatísticas somadas
+    e, em 'files', o resultado de cada arquivo.
+    """
+    pasta_entradas = os.path.join(temp_dir, BATCH_INPUTS_DIR)
+    entradas = sorted(os.path.join(pasta_entradas, nome) for nome in os.listdir(pasta_entradas))
+    nomes = output_names(entradas)
+    fasta = str(settings.MISSENSE_REFERENCE_FASTA)
+    backend = settings.MISSENSE_REFERENCE_BACKEND
+    compression = settings.MISSENSE_OUTPUT_COMPRESSION
+    if progress:
+        progress('reference', 0, 0)
+    load_reference(fasta, backend)
+
+    arquivos = {entrada: {'name': os.path.basename(entrada)[4:], 'output': nomes[entrada]} for entrada in entradas}
+    stats = PipelineStats()
+    feitos = 0
+    if progress:
+        progress('batch', 0, len(entradas))
+    processos = max(1, min(len(entradas), settings.MISSENSE_BATCH_CONCURRENCY))
+    deduplicate = settings.MISSENSE_DEDUPLICATE
+    pasta_emissoes = os.path.join(temp_dir, BATCH_EMISSIONS_DIR)
+    os.makedirs(pasta_emissoes, exist_ok=True)
+    emissoes = {entrada: os.path.join(pasta_emissoes, f'{nomes[entrada]}.txt') for entrada in entradas}
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = {executor.submit(process_file, fasta, entrada,
+                                   os.path.join(temp_dir, BATCH_OUTPUTS_DIR, nomes[entrada]), backend, 1,
+                                   compression, deduplicate=deduplicate, emissions=emissoes[entrada]): entrada
+                   for entrada in entradas}
+        for futuro in as_completed(futuros):
+            arquivo = arquivos[futuros[futuro]]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                arquivo['error'] = str(e)
+            else:
+                stats.merge(resultado)
+                arquivo['variants'] = resultado['counters'].get('variants_read', 0)
+                arquivo['seconds'] = resultado['seconds']
+            feitos += 1
+            if progress:
+                progress('batch', feitos, len(entradas))
+    concluidos = [entrada for entrada in entradas if 'error' not in arquivos[entrada]]
+    if not concluidos:
+        raise Exception('; '.join(f"{a['name']}: {a['error']}" for a in arquivos.values()))
+
+    # Base unificada: junta por proteína as saídas dos arquivos, na ordem do envio
+    nomes_saidas = output_files(compression, deduplicate)
+    sufixo = SUFFIXES[compression] if compression else ''
+    partes = [(os.path.join(temp_dir, BATCH_OUTPUTS_DIR, nomes[entrada], OUTPUT_FILES[1] + sufixo), emissoes[entrada])
+              for entrada in concluidos]
+    results, distintos = merge_outputs(partes, [os.path.join(temp_dir, nome + sufixo) for nome in OUTPUT_FILES],
+                                       compression, deduplicate, os.path.join(temp_dir, COUNTS_FILE + sufixo),
+                                       tmp_dir=temp_dir)
+    shutil.rmtree(pasta_emissoes, ignore_errors=True)
+    if distintos is not None:
+        stats.counters['unique_peptides'] = distintos
+    for nome in nomes_saidas:
+        stats.bytes_written[nome.split('.')[0]] = os.path.getsize(os.path.join(temp_dir, nome))
+
+    # Saídas já comprimidas entram no zip sem nova compressão
+    metodo = zipfile.ZIP_STORED if compression else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(os.path.join(temp_dir, ARCHIVE_FILE), 'w', metodo) as zf:
+        for nome in nomes_saidas:
+            zf.write(os.path.join(temp_dir, nome), os.path.join('merged', nome))
+        for entrada in concluidos:
+            pasta = os.path.join(temp_dir, BATCH_OUTPUTS_DIR, nomes[entrada])
+            for nome in sorted(os.listdir(pasta)):
+                zf.write(os.path.join(pasta, nome), os.path.join(nomes[entrada], nome))
+
+    results['stats'] = stats.as_dict()
+    results['files'] = [arquivos[entrada] for entrada in entradas]
+    return results
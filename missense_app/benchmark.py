@@ -0,0 +1,288 @@
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from .peptide_processor import process_mutations, OUTPUT_FILES, AMINO
+
+AMINOACIDOS = 'ACDEFGHIKLMNPQRSTVWY'
+# 'A' -> 'Ala', ... (metade das variantes geradas usa códigos de três letras)
+TRES_LETRAS = {um.upper(): tres for tres, um in AMINO.items() if len(tres) == 3 and tres != 'Ter'}
+
+# Cenários sintéticos: número de proteínas da referência e de linhas de variantes
+SCENARIOS = {
+    'tiny': {'proteins': 2000, 'variants': 1000},
+    'small': {'proteins': 5000, 'variants': 100000},
+    'medium': {'proteins': 20000, 'variants': 1000000},
+    'proteome': {'proteins': 90000, 'variants': 10000000},
+}
+
+# Intervalo (s) da amostragem de memória durante a execução
+RSS_INTERVAL = 0.02
+# Parâmetros gravados com cada resultado: só resultados com os mesmos valores são comparáveis
+SCENARIO_PARAMS = ('proteins', 'variants', 'seed', 'backend', 'workers')
+
+
+def generate_reference(path, n_proteins, seed=0):
+    """
+    Gera um FASTA sintético no formato RefSeq ('>gi|...|ref|NP_xxx.1|'). Os tamanhos
+    seguem aproximadamente o proteoma humano, com algumas proteínas muito longas
+    (~35 mil resíduos, como a titina). Retorna {NP: sequência}.
+    """
+    rnd = random.Random(seed)
+    sequencias = {}
+    with open(path, 'w') as f:
+        for i in range(n_proteins):
+            idnp = f'NP_{i:09d}'
+            if i % 5000 == 4999:
+                n = rnd.randint(30000, 36000)
+            else:
+                n = min(int(rnd.lognormvariate(6.0, 0.7)) + 20, 8000)
+            seq = ''.join(rnd.choices(AMINOACIDOS, k=n))
+            f.write(f'>gi|{100000 + i}|ref|{idnp}.1| synthetic protein {i}\n')
+            for j in range(0, n, 80):
+                f.write(seq[j:j + 80] + '\n')
+            sequencias[idnp] = seq
+    return sequencias
+
+
+def generate_variants(path, sequencias, n_variants, seed=0):
+    """
+    Gera um arquivo de variantes agrupado por proteína (como as exportações do dbSNP),
+    com trocas comuns, stop-gain (Ter) e trocas que criam sítios K/R, em códigos de
+    uma e três letras, além de ~1% de linhas inválidas.
+    """
+    rnd = random.Random(seed + 1)
+    ids = list(sequencias)
+    # Cada proteína recebe um bloco contíguo de variantes
+    blocos = {}
+    for _ in range(n_variants):
+        idnp = rnd.choice(ids)
+        blocos[idnp] = blocos.get(idnp, 0) + 1
+    snp = 0
+    with open(path, 'w') as f:
+        for idnp, total in blocos.items():
+            seq = sequencias[idnp]
+            linhas = []
+            for _ in range(total):
+                snp += 1
+                sorteio = rnd.random()
+                if sorteio < 0.01:
+                    linhas.append(f'{idnp}\trs{snp}\tA\tnotanumber\tV')
+                    continue
+                pos = rnd.randint(1, len(seq))
+                ref = seq[pos - 1]
+                if sorteio < 0.06:
+                    alt = 'Ter'
+                elif sorteio < 0.26:
+                    alt = rnd.choice('KR')
+                else:
+                    alt = rnd.choice(AMINOACIDOS)
+                if rnd.random() < 0.5:
+                    ref = TRES_LETRAS[ref]
+                    alt = TRES_LETRAS.get(alt, alt)
+                linhas.append(f'{idnp}.1\trs{snp}\t{ref}\t{pos}\t{alt}')
+            f.write('\n'.join(linhas) + '\n')
+    return path
+
+
+def _statm_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _rss_bytes():
+    """
+    Memória residente atual do processo somada à dos seus processos filhos (os
+    workers do modo paralelo; Linux); None se não for possível medir.
+    """
+    total = _statm_rss('self')
+    if total is None:
+        return None
+    for filho in multiprocessing.active_children():
+        total += _statm_rss(filho.pid) or 0
+    return total
+
+
+def _peak_rss_bytes():
+    """
+    Picos de memória residente (processo, workers): o dos workers é o do maior
+    processo filho já encerrado (RUSAGE_CHILDREN). None se não for possível medir.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss é em KB no Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+
+class StageMonitor:
+    """
+    Callback de andamento para process_mutations que mede a duração e o pico de
+    memória residente (do processo e dos workers) de cada etapa ('reference',
+    'parsing', 'digestion').
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._etapa = None
+        self._inicio = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fechar(time.perf_counter())
+        self._parar.set()
+        self._thread.join()
+
+    def _amostrar(self):
+        while not self._parar.wait(RSS_INTERVAL):
+            self._medir()
+
+    def _medir(self):
+        etapa = self._etapa
+        rss = _rss_bytes()
+        if etapa is not None and rss is not None:
+            dados = self.stages[etapa]
+            dados['peak_rss'] = max(dados['peak_rss'], rss)
+
+    def _fechar(self, agora):
+        if self._etapa is not None:
+            self._medir()
+            self.stages[self._etapa]['seconds'] += agora - self._inicio
+            self._etapa = None
+
+    def __call__(self, etapa, feitas, total):
+        if etapa == self._etapa:
+            return
+        agora = time.perf_counter()
+        self._fechar(agora)
+        self.stages.setdefault(etapa, {'seconds': 0.0, 'peak_rss': 0})
+        self._etapa = etapa
+        self._inicio = agora
+        self._medir()
+
+
+def _outputs_digest(caminhos):
+    digest = hashlib.sha256()
+    for caminho in caminhos:
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(bloco)
+    return digest.hexdigest()
+
+
+def prepare_scenario(name, proteins, variants, workdir, seed=0):
+    """Gera a referência e o arquivo de variantes do cenário em workdir/name. Retorna (fasta, variantes)."""
+    pasta = os.path.join(workdir, name)
+    os.makedirs(pasta, exist_ok=True)
+    fasta = os.path.join(pasta, 'reference.fasta')
+    entrada = os.path.join(pasta, 'variants.txt')
+    sequencias = generate_reference(fasta, proteins, seed)
+    generate_variants(entrada, sequencias, variants, seed)
+    return fasta, entrada
+
+
+def run_scenario(fasta, entrada, variants, backend=None, workers=None):
+    """
+    Mede uma execução de process_mutations (referência ainda não carregada no processo).
+    Retorna um dicionário com vazão, pico de memória por etapa e o sha256 das saídas.
+    O pico total (peak_rss) soma o do processo ao do maior worker (peak_rss_workers),
+    para que o modo paralelo não pareça usar só a memória do processo principal.
+    """
+    pasta = os.path.dirname(entrada)
+    saidas = [os.path.join(pasta, nome) for nome in OUTPUT_FILES]
+
+    inicio = time.perf_counter()
+    with StageMonitor() as monitor:
+        process_mutations(fasta, entrada, *saidas, backend=backend, workers=workers, progress=monitor)
+    duracao = time.perf_counter() - inicio
+    pico, pico_workers = _peak_rss_bytes()
+
+    tamanho = os.path.getsize(entrada)
+    return {
+        'backend': backend or settings.MISSENSE_REFERENCE_BACKEND,
+        'workers': workers or settings.MISSENSE_WORKERS,
+        'variants': variants,
+        'input_bytes': tamanho,
+        'seconds': round(duracao, 4),
+        'variants_per_sec': round(variants / duracao, 1),
+        'mb_per_sec': round(tamanho / duracao / 1e6, 3),
+        'peak_rss': pico + pico_workers if pico is not None else None,
+        'peak_rss_workers': pico_workers,
+        'stages': {etapa: {'seconds': round(dados['seconds'], 4), 'peak_rss': dados['peak_rss']}
+                   for etapa, dados in monitor.stages.items()},
+        'output_bytes': sum(os.path.getsize(caminho) for caminho in saidas),
+        'output_sha256': _outputs_digest(saidas),
+    }
+
+
+def scenario_params(proteins, variants, seed=0, backend=None, workers=None):
+    """Parâmetros de uma medição (SCENARIO_PARAMS), com backend e workers resolvidos pelas configurações."""
+    return {'proteins': proteins, 'variants': variants, 'seed': seed,
+            'backend': backend or settings.MISSENSE_REFERENCE_BACKEND, 'workers': workers or settings.MISSENSE_WORKERS}
+
+
+def mismatched_params(params, baseline):
+    """Parâmetros em que a medição difere do baseline ('nome: baseline -> atual'); vazio se comparáveis."""
+    return [f'{nome}: {baseline.get(nome)!r} -> {params[nome]!r}' for nome in SCENARIO_PARAMS
+            if baseline.get(nome) != params[nome]]
+
+
+def _em_processo_novo(funcao, *args, **kwargs):
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(funcao, *args, **kwargs).result()
+
+
+def run_isolated(name, proteins, variants, workdir=None, seed=0, repeat=1, **kwargs):
+    """
+    Gera os dados e mede o cenário, cada passo em um processo novo, para que o pico
+    de memória não dependa da geração, dos cenários anteriores nem de um proteoma
+    já carregado neste processo. Com repeat > 1 a medição é repetida e fica a mais
+    rápida, o que reduz o ruído da máquina. Sem workdir os dados gerados são apagados no fim.
+    """
+    proprio = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='missense-bench-')
+    try:
+        fasta, entrada = _em_processo_novo(prepare_scenario, name, proteins, variants, workdir, seed)
+        resultado = min((_em_processo_novo(run_scenario, fasta, entrada, variants, **kwargs)
+                         for _ in range(max(1, repeat))), key=lambda r: r['seconds'])
+        resultado['proteins'] = proteins
+        resultado['seed'] = seed
+        return resultado
+    finally:
+        if proprio:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(resultado, baseline, tolerance):
+    """
+    Compara um resultado com o baseline guardado. Retorna a lista de regressões:
+    saídas diferentes, vazão abaixo de (1 - tolerance) ou pico de memória acima de
+    (1 + tolerance) do baseline.
+    """
+    regressoes = []
+    if resultado['output_sha256'] != baseline.get('output_sha256'):
+        regressoes.append('as saídas mudaram (sha256 diferente do baseline)')
+    referencia = baseline.get('variants_per_sec')
+    if referencia and resultado['variants_per_sec'] < referencia * (1 - tolerance):
+        regressoes.append(f"variantes/s {resultado['variants_per_sec']:.0f} < baseline {referencia:.0f}")
+    referencia = baseline.get('peak_rss')
+    if referencia and resultado['peak_rss'] and resultado['peak_rss'] > referencia * (1 + tolerance):
+        regressoes.append(f"pico de RSS {resultado['peak_rss'] / 2 ** 20:.0f} MB > "
+                          f"baseline {referencia / 2 ** 20:.0f} MB")
+    return regressoes
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from .models import ResultCacheEntry
+from .peptide_processor import output_files
+from .compression import open_file
+from .reference import load_reference
+from .proteases import LEGACY_RULES, digestion_rules
+
+# Muda quando a lógica do pipeline altera a saída, invalidando entradas antigas
+PIPELINE_VERSION = '1'
+PREVIEW_FILE = 'preview.json'
+
+
+def cache_dir(key):
+    return os.path.join(settings.MEDIA_ROOT, 'cache', key)
+
+
+def reference_version(proteinas=None):
+    """Versão (sha256) do FASTA de referência em uso."""
+    proteinas = proteinas or settings.MISSENSE_REFERENCE_FASTA
+    return load_reference(proteinas, settings.MISSENSE_REFERENCE_BACKEND).version
+
+
+def output_options(compression, rules, deduplicate):
+    """Opções que mudam os arquivos gerados (vazio para as da versão original), em um dicionário serializável."""
+    options = {}
+    if compression:
+        options['output_compression'] = compression
+    if rules != LEGACY_RULES:
+        options['digestion'] = rules._asdict()
+    if deduplicate:
+        options['deduplicate'] = True
+    return options
+
+
+def pipeline_options():
+    """Opções configuradas que mudam os arquivos gerados e por isso fazem parte da chave."""
+    return output_options(settings.MISSENSE_OUTPUT_COMPRESSION, digestion_rules(), settings.MISSENSE_DEDUPLICATE)
+
+
+def input_key(input_file, ref_version, options=None):
+    """
+    Chave do cache: sha256 da entrada normalizada (linhas sem espaços nas pontas,
+    sem '\\r' e sem linhas vazias), da versão da referência e das opções do pipeline.
+    Uma entrada comprimida tem a mesma chave da versão sem compressão.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{PIPELINE_VERSION}\n{ref_version}\n{json.dumps(options or {}, sort_keys=True)}\n'.encode('utf-8'))
+    with open_file(input_file, 'r') as f:
+        for lin in f:
+            lin = lin.strip().replace('\r', '')
+            if lin:
+                digest.update(lin.encode('utf-8'))
+                digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _link_or_copy(origem, destino):
+    # Hardlink: cache e diretório do job compartilham o mesmo arquivo em disco
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copyfile(origem, destino)
+
+
+def lookup(key):
+    """Retorna a entrada do cache (atualizando o último acesso) ou None."""
+    entry = ResultCacheEntry.objects.filter(pk=key).first()
+    if entry is None:
+        return None
+    pasta = cache_dir(key)
+    if not all(os.path.exists(os.path.join(pasta, nome)) for nome in output_files() + (PREVIEW_FILE,)):
+        entry.delete()
+        shutil.rmtree(pasta, ignore_errors=True)
+        return None
+    entry.hits += 1
+    entry.last_access = timezone.now()
+    entry.save(update_fields=['hits', 'last_access'])
+    return entry
+
+
+def restore(key, temp_dir):
+    """Copia (hardlink) as saídas em cache para temp_dir e retorna a prévia."""
+    pasta = cache_dir(key)
+    for nome in output_files():
+        destino = os.path.join(temp_dir, nome)
+        if os.path.exists(destino):
+            os.remove(destino)
+        _link_or_copy(os.path.join(pasta, nome), destino)
+    with open(os.path.join(pasta, PREVIEW_FILE), 'r') as f:
+        return json.load(f)
+
+
+def store(key, ref_version, temp_dir, results):
+    """Guarda as saídas de temp_dir no cache e aplica o limite de tamanho (LRU)."""
+    max_bytes = settings.MISSENSE_RESULT_CACHE_MAX_BYTES
+    if max_bytes <= 0 or ResultCacheEntry.objects.filter(pk=key).exists():
+        return None
+    
+    pasta = cache_dir(key)
+    tmp = f'{pasta}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(tmp)
+    try:
+        tamanho = 0
+        for nome in output_files():
+            _link_or_copy(os.path.join(temp_dir, nome), os.path.join(tmp, nome))
+            tamanho += os.path.getsize(os.path.join(tmp, nome))
+        with open(os.path.join(tmp, PREVIEW_FILE), 'w') as f:
+            json.dump(results, f)
+        if tamanho > max_bytes:
+            return None
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.replace(tmp, pasta)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    
+    entry, _ = ResultCacheEntry.objects.get_or_create(
+        pk=key, defaults={'reference_version': ref_version, 'size_bytes': tamanho, 'last_access': timezone.now()})
+    evict(max_bytes)
+    return entry
+
+
+def evict(max_bytes):
+    """Remove as entradas usadas há mais tempo até o cache caber em max_bytes. Retorna quantas saíram."""
+    total = ResultCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    removidas = 0
+    for entry in ResultCacheEntry.objects.order_by('last_access').iterator():
+        if total <= max_bytes:
+            break
+        shutil.rmtree(cache_dir(entry.key), ignore_errors=True)
+        total -= entry.size_bytes
+        entry.delete()
+        removidas += 1
+    return removidas
@@ -0,0 +1,96 @@
+import bz2
+import gzip
+import os
+
+# Formatos de compressão aceitos nas entradas, na referência e nas saídas
+GZIP = 'gzip'
+BZIP2 = 'bz2'
+ZSTD = 'zstd'
+
+SUFFIXES = {GZIP: '.gz', BZIP2: '.bz2', ZSTD: '.zst'}
+CONTENT_TYPES = {GZIP: 'application/gzip', BZIP2: 'application/x-bzip2', ZSTD: 'application/zstd'}
+
+_MAGIC = ((b'\x1f\x8b', GZIP), (b'BZh', BZIP2), (b'\x28\xb5\x2f\xfd', ZSTD))
+
+# Razão de expansão assumida ao estimar o tamanho descomprimido de uma entrada
+EXPANSION_ESTIMATE = 8
+
+
+def detect_compression(path):
+    """Identifica a compressão do arquivo pelos primeiros bytes. Retorna None para arquivo sem compressão."""
+    with open(path, 'rb') as f:
+        inicio = f.read(4)
+    for magic, compression in _MAGIC:
+        if inicio.startswith(magic):
+            return compression
+    return None
+
+
+def compression_from_name(name):
+    """Compressão indicada pela extensão do nome (ex.: 'variantes.txt.gz' -> 'gzip')."""
+    extensao = os.path.splitext(name)[1].lower()
+    for compression, sufixo in SUFFIXES.items():
+        if extensao == sufixo:
+            return compression
+    return None
+
+
+def strip_suffix(name):
+    """Remove a extensão de compressão do nome, se houver."""
+    if compression_from_name(name):
+        return os.path.splitext(name)[0]
+    return name
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Arquivos .zst exigem o pacote 'zstandard' (pip install zstandard)")
+    return zstandard
+
+
+def is_available(compression):
+    """Se a compressão pode ser lida e gravada aqui (zstd depende do pacote opcional 'zstandard')."""
+    if compression != ZSTD:
+        return True
+    try:
+        _zstandard()
+    except ValueError:
+        return False
+    return True
+
+
+def available_suffixes():
+    """SUFFIXES só com as compressões disponíveis (ver is_available)."""
+    return {compression: sufixo for compression, sufixo in SUFFIXES.items() if is_available(compression)}
+
+
+def open_file(path, mode='r', compression=None):
+    """
+    Abre um arquivo comprimido ou não com a interface de open(). Na leitura a
+    compressão é detectada pelo conteúdo; na escrita usa a compressão informada
+    (None grava o arquivo sem compressão). Modos sem 'b' são modos de texto.
+    """
+    if 'r' in mode and compression is None:
+        compression = detect_compression(path)
+    if compression is None:
+        return open(path, mode)
+    if 'b' not in mode and 't' not in mode:
+        mode += 't'
+    if compression == GZIP:
+        # Nível 6: bem mais rápido que o padrão (9) com tamanho quase igual
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == BZIP2:
+        return bz2.open(path, mode)
+    if compression == ZSTD:
+        return _zstandard().open(path, mode)
+    raise ValueError(f"Compressão desconhecida: {compression}")
+
+
+def estimated_size(path):
+    """Tamanho (estimado, se comprimido) do conteúdo descomprimido do arquivo."""
+    tamanho = os.path.getsize(path)
+    if detect_compression(path) is None:
+        return tamanho
+    return tamanho * EXPANSION_ESTIMATE
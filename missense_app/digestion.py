@@ -0,0 +1,148 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# Regra de clivagem tríptica usada pelo pipeline (C-terminal a R/K, sem regra da prolina)
+TRYPTIC = re.compile(r'([^RK]+(R|K|$))')
+TRYPTIC_IGNORECASE = re.compile(r'([^RK]+(R|K|$))', re.IGNORECASE)
+_SITIO = re.compile(r'[RK]')
+
+
+class ProteinDigest:
+    """
+    Proteína de referência com os sítios de clivagem pré-calculados: R/K da digestão
+    histórica ou, com protease, os sítios da enzima (ver proteases.Protease).
+
+    Os sítios são calculados uma vez por proteína (ou recebidos já prontos do
+    proteoma vetorizado, ver proteome.EncodedProteome); cada variante depois só
+    precisa de duas buscas binárias para achar a janela entre os sítios vizinhos,
+    com ou sem clivagens perdidas.
+    """
+
+    def __init__(self, seq, protease=None, sites=None, has_lower=None):
+        self.seq = seq
+        self.protease = protease
+        if sites is not None:
+            self.sites = sites
+        elif protease is None:
+            self.sites = [m.start() for m in _SITIO.finditer(seq)]
+        else:
+            self.sites = protease.sites(seq)
+        # Sequências com minúsculas confundem a marcação do resíduo mutado; nesses casos
+        # a proteína mutada é montada por inteiro, como no algoritmo original.
+        self.has_lower = seq != seq.upper() if has_lower is None else has_lower
+
+    def __len__(self):
+        return len(self.seq)
+
+    def window(self, pos):
+        """
+        Limites [inicio, fim) do peptídeo tríptico que contém a posição pos (0-based)
+        depois da substituição. O resíduo mutado nunca é sítio de clivagem (fica em
+        minúscula), então um R/K de referência nessa posição deixa de clivar.
+        """
+        sites = self.sites
+        i = bisect_left(sites, pos)
+        inicio = sites[i - 1] + 1 if i > 0 else 0
+        if i < len(sites) and sites[i] == pos:
+            i += 1
+        fim = sites[i] + 1 if i < len(sites) else len(self.seq)
+        return inicio, fim
+
+    def mutate(self, pos, alt):
+        return MutatedProtein(self, pos, alt)
+
+    def cleavage_peptides(self, pos, alt, missed, min_len, max_len):
+        """
+        Limites [inicio, fim) dos peptídeos da enzima que contêm a posição pos (0-based)
+        depois da troca por alt, com até missed clivagens perdidas e tamanho entre
+        min_len e max_len, ordenados por clivagens perdidas e início.
+
+        O resíduo novo pode criar ou eliminar sítios (inclusive o anterior, pela regra
+        da prolina). Com alt 'z' (stop) a proteína termina em pos: são devolvidos os
+        peptídeos do novo C-terminal, se ele não coincidir com um sítio de referência.
+        """
+        seq, sites, protease = self.seq, self.sites, self.protease
+        n = len(seq)
+        # Sítios de referência fora do alcance da troca (pos - 1 e pos são recalculados)
+        i = bisect_left(sites, pos - 1)
+        j = bisect_right(sites, pos)
+        esquerda = sites[max(0, i - missed - 1):i]
+        if i - missed - 1 <= 0:
+            esquerda = [-1] + esquerda
+
+        if alt == 'z':
+            if pos == 0 or (i < len(sites) and sites[i] == pos - 1):
+                return []
+            fim = pos
+            return [(esquerda[k] + 1, fim) for k in range(len(esquerda) - 1, -1, -1)
+                    if len(esquerda) - 1 - k <= missed and min_len <= fim - esquerda[k] - 1 <= max_len]
+
+        if pos > 0 and protease.cleaves_after(seq[pos - 1], alt):
+            esquerda.append(pos - 1)
+        direita = []
+        if pos < n - 1 and protease.cleaves_after(alt, seq[pos + 1]):
+            direita.append(pos)
+        direita += sites[j:j + missed + 1]
+        if (not direita or direita[-1] != n - 1) and j + missed + 1 >= len(sites):
+            direita.append(n - 1)
+
+        peptideos = []
+        for a in range(len(esquerda) - 1, -1, -1):
+            for b in range(len(direita)):
+                perdidas = (len(esquerda) - 1 - a) + b
+                inicio, fim = esquerda[a] + 1, direita[b] + 1
+                if perdidas <= missed and min_len <= fim - inicio <= max_len:
+                    peptideos.append((perdidas, inicio, fim))
+        peptideos.sort()
+        return [(inicio, fim) for _, inicio, fim in peptideos]
+
+
+class MutatedProtein:
+    """
+    Proteína de referência com um resíduo substituído, sem materializar a sequência inteira.
+
+    Reproduz o que o pipeline fazia sobre a string completa (finditer tríptico e
+    str.find), mas trabalhando só na janela ao redor da mutação.
+    """
+
+    def __init__(self, digest, pos, alt):
+        self.digest = digest
+        self.pos = pos
+        self.alt = alt
+        self._full = None
+        if digest.has_lower:
+            seq = digest.seq
+            self._full = seq[:pos] + alt + seq[pos + 1:]
+
+    def tryptic_peptides(self):
+        """
+        Peptídeos trípticos candidatos a conter a mutação. No caminho local é só o
+        peptídeo da janela; no caminho completo são todos os peptídeos da proteína.
+        """
+        if self._full is not None:
+            return [match.group(1) for match in TRYPTIC.finditer(self._full)]
+        seq = self.digest.seq
+        inicio, fim = self.digest.window(self.pos)
+        return [seq[inicio:self.pos] + self.alt + seq[self.pos + 1:fim]]
+
+    def find(self, sub):
+        """Equivalente a str.find sobre a proteína mutada."""
+        if self._full is not None:
+            return self._full.find(sub)
+        seq, pos, alt = self.digest.seq, self.pos, self.alt
+        tam = len(sub)
+        k = sub.find(alt)
+        if k >= 0:
+            # O único resíduo minúsculo da proteína está em pos, então a ocorrência
+            # (se existir) tem que alinhar sub[k] com ele.
+            inicio = pos - k
+            if inicio < 0 or inicio + tam > len(seq):
+                return -1
+            if seq[inicio:pos] == sub[:k] and seq[pos + 1:inicio + tam] == sub[k + 1:]:
+                return inicio
+            return -1
+        # Sem o resíduo mutado: primeira ocorrência na referência que não cubra pos
+        i = seq.find(sub)
+        while i != -1 and i <= pos < i + tam:
+            i = seq.find(sub, i + 1)
+        return i
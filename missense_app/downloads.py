@@ -0,0 +1,166 @@
+import os
+import re
+import zlib
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+# Tamanho dos blocos lidos do disco e enviados ao cliente
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _iter_file(path, start=0, length=None):
+    """Lê o arquivo em blocos a partir de start (até length bytes), sem carregá-lo inteiro."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        restante = length
+        while restante is None or restante > 0:
+            bloco = f.read(CHUNK_SIZE if restante is None else min(CHUNK_SIZE, restante))
+            if not bloco:
+                break
+            if restante is not None:
+                restante -= len(bloco)
+            yield bloco
+
+
+def _iter_gzip(path):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloco in _iter_file(path):
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+def _parse_range(header, size):
+    """
+    Interpreta um cabeçalho Range de intervalo único. Retorna (inicio, fim) inclusivo,
+    None se o cabeçalho deve ser ignorado ou False se o intervalo não é satisfazível.
+    """
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    inicio, fim = match.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # Sufixo: os últimos N bytes
+        n = int(fim)
+        if n == 0:
+            return False
+        return max(0, size - n), size - 1
+    inicio = int(inicio)
+    fim = int(fim) if fim else size - 1
+    if inicio >= size or fim < inicio:
+        return False
+    return inicio, min(fim, size - 1)
+
+
+def _accepts_gzip(header):
+    """
+    Se o Accept-Encoding aceita gzip: o token gzip (ou x-gzip) com q > 0 ou, sem ele,
+    o coringa * com q > 0. 'gzip;q=0' recusa explicitamente.
+    """
+    pesos = {}
+    for item in header.split(','):
+        token, *parametros = (parte.strip() for parte in item.split(';'))
+        if not token:
+            continue
+        q = 1.0
+        for parametro in parametros:
+            nome, _, valor = parametro.partition('=')
+            if nome.strip().lower() == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        pesos[token.lower()] = q
+    for token in ('gzip', 'x-gzip', '*'):
+        if token in pesos:
+            return pesos[token] > 0
+    return False
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    data = parse_http_date_safe(if_range)
+    return data is not None and data >= last_modified
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+
+
+def file_download_response(request, path, filename, content_type='text/plain'):
+    """
+    Resposta de download em streaming para um arquivo gerado.
+
+    Suporta requisições condicionais (ETag/Last-Modified), Range de intervalo único
+    (retomada de downloads) e compressão gzip sob demanda quando o cliente aceita e
+    não pediu um intervalo. A memória usada não depende do tamanho do arquivo.
+    """
+    st = os.stat(path)
+    size = st.st_size
+    last_modified = int(st.st_mtime)
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    range_header = request.headers.get('Range')
+    # Só texto é comprimido na hora; arquivos já comprimidos vão como estão
+    negociavel = settings.MISSENSE_DOWNLOAD_GZIP and content_type.startswith('text/')
+    usar_gzip = (negociavel and not range_header and size > 0
+                 and _accepts_gzip(request.headers.get('Accept-Encoding', '')))
+    # A representação comprimida tem um ETag próprio (fraco)
+    gzip_etag = f'W/"{st.st_mtime_ns:x}-{size:x}-gzip"'
+
+    response = get_conditional_response(request, etag=gzip_etag if usar_gzip else etag, last_modified=last_modified)
+    if response is None:
+        response = _download_response(request, path, filename, content_type, st, etag, gzip_etag, usar_gzip)
+    # Caches compartilhados guardam uma cópia por Accept-Encoding quando a resposta pode variar
+    if negociavel:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _download_response(request, path, filename, content_type, st, etag, gzip_etag, usar_gzip):
+    """Resposta de uma requisição não condicional: intervalo, gzip ou o arquivo inteiro."""
+    size = st.st_size
+    last_modified = int(st.st_mtime)
+    range_header = request.headers.get('Range')
+
+    disposition = f'attachment; filename="{filename}"'
+    if range_header and _if_range_matches(request, etag, last_modified):
+        intervalo = _parse_range(range_header, size)
+        if intervalo is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if intervalo is not None:
+            inicio, fim = intervalo
+            response = StreamingHttpResponse(_iter_file(path, inicio, fim - inicio + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {inicio}-{fim}/{size}'
+            response['Content-Length'] = str(fim - inicio + 1)
+            response['Accept-Ranges'] = 'bytes'
+            response['Content-Disposition'] = disposition
+            _set_validators(response, etag, last_modified)
+            return response
+
+    if usar_gzip:
+        response = StreamingHttpResponse(_iter_gzip(path), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Disposition'] = disposition
+        _set_validators(response, gzip_etag, last_modified)
+        return response
+
+    response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+    response.block_size = CHUNK_SIZE
+    response['Accept-Ranges'] = 'bytes'
+    _set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import reverse
+from .models import MissenseJob
+from .compression import open_file
+from .peptide_processor import PREVIEW_LINES
+
+# Saídas cuja prévia é enviada enquanto o job roda
+PREVIEW_TYPES = ('dbpepmutref', 'dbsaida', 'dbfinal')
+
+
+def sse_event(evento, dados):
+    """Formata um evento Server-Sent Events com dados em JSON."""
+    return f"event: {evento}\ndata: {json.dumps(dados)}\n\n"
+
+
+def read_preview(caminho, max_lines=PREVIEW_LINES):
+    """
+    Primeiras linhas completas de uma saída ainda em gravação. O arquivo pode não
+    existir ou (se comprimido) estar truncado no meio de um bloco: nesses casos
+    retorna o que foi possível ler.
+    """
+    linhas = []
+    try:
+        with open_file(caminho, 'r') as f:
+            for lin in f:
+                if not lin.endswith('\n') or len(linhas) >= max_lines:
+                    break
+                linhas.append(lin)
+    except (OSError, EOFError, ValueError):
+        pass
+    return ''.join(linhas)
+
+
+class EtaEstimator:
+    """Tempo restante da digestão pela taxa de variantes observada desde a primeira amostra."""
+
+    def __init__(self):
+        self._inicio = None
+
+    def observe(self, job, agora):
+        if job.status != MissenseJob.STATUS_RUNNING or job.stage != 'digestion' or not job.variants_total:
+            self._inicio = None
+            return None
+        if self._inicio is None:
+            self._inicio = (agora, job.variants_done)
+            return None
+        t0, feitas0 = self._inicio
+        taxa = (job.variants_done - feitas0) / (agora - t0) if agora > t0 else 0
+        if taxa <= 0:
+            return None
+        return round((job.variants_total - job.variants_done) / taxa, 1)
+
+
+class JobEventStream:
+    """
+    Eventos de andamento de um job: 'progress' (etapa, variantes, fração e ETA),
+    'preview' (primeiras linhas de cada saída, assim que são gravadas) e, no fim,
+    'done' ou 'failed' com o endereço da página de resultados. Só envia o que
+    mudou desde a consulta anterior; sem mudanças, um comentário mantém a conexão.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.finished = False
+        self._eta = EtaEstimator()
+        self._ultimo = None
+        self._previas = {}
+        self._ultimo_envio = time.monotonic()
+
+    def poll(self):
+        """Consulta o job e retorna os eventos pendentes (texto pronto para enviar)."""
+        agora = time.monotonic()
+        job = MissenseJob.objects.filter(pk=self.job_id).first()
+        if job is None:
+            self.finished = True
+            return sse_event('failed', {'error': 'Job not found.'})
+        result_url = f"{reverse('missense')}?job={job.id}"
+        eventos = []
+        progresso = {
+            'status': job.status,
+            'stage': job.stage,
+            'variants_done': job.variants_done,
+            'variants_total': job.variants_total,
+            'progress': round(job.progress, 4),
+            'eta_seconds': self._eta.observe(job, agora),
+        }
+        if progresso != self._ultimo:
+            self._ultimo = progresso
+            eventos.append(sse_event('progress', progresso))
+        if job.status == MissenseJob.STATUS_RUNNING:
+            for file_type in PREVIEW_TYPES:
+                if len(self._previas.get(file_type, '').splitlines()) >= PREVIEW_LINES:
+                    continue
+                previa = read_preview(job.output_path(file_type))
+                if previa and previa != self._previas.get(file_type):
+                    self._previas[file_type] = previa
+                    eventos.append(sse_event('preview', {'file': file_type, 'lines': previa}))
+        if job.status == MissenseJob.STATUS_DONE:
+            self.finished = True
+            eventos.append(sse_event('done', {'result_url': result_url}))
+        elif job.status == MissenseJob.STATUS_FAILED:
+            self.finished = True
+            eventos.append(sse_event('failed', {'error': job.error, 'result_url': result_url}))
+        if eventos:
+            self._ultimo_envio = agora
+        elif agora - self._ultimo_envio >= settings.MISSENSE_SSE_HEARTBEAT:
+            self._ultimo_envio = agora
+            eventos.append(': keepalive\n\n')
+        return ''.join(eventos)
+
+
+def _expirou(inicio):
+    return time.monotonic() - inicio >= settings.MISSENSE_SSE_TIMEOUT
+
+
+def job_events(job_id):
+    """
+    Gerador síncrono (WSGI): ocupa uma thread por conexão. Depois de
+    MISSENSE_SSE_TIMEOUT segundos a resposta termina e o navegador reconecta.
+    """
+    stream = JobEventStream(job_id)
+    inicio = time.monotonic()
+    yield f"retry: {settings.MISSENSE_SSE_RETRY_MS}\n\n"
+    while True:
+        eventos = stream.poll()
+        if eventos:
+            yield eventos
+        if stream.finished or _expirou(inicio):
+            return
+        time.sleep(settings.MISSENSE_SSE_INTERVAL)
+
+
+async def ajob_events(job_id):
+    """
+    Gerador assíncrono (ASGI): entre consultas a conexão só espera no loop de
+    eventos, sem thread dedicada. A consulta ao banco roda via sync_to_async.
+    """
+    stream = JobEventStream(job_id)
+    poll = sync_to_async(stream.poll)
+    inicio = time.monotonic()
+    yield f"retry: {settings.MISSENSE_SSE_RETRY_MS}\n\n"
+    while True:
+        eventos = await poll()
+        if eventos:
+            yield eventos
+        if stream.finished or _expirou(inicio):
+            return
+        await asyncio.sleep(settings.MISSENSE_SSE_INTERVAL)
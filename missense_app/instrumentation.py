@@ -0,0 +1,146 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Modos de profiling de um job (MISSENSE_PROFILE ou parâmetro 'profile' da submissão)
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_SAMPLING = 'sampling'
+PROFILE_MODES = (PROFILE_CPROFILE, PROFILE_SAMPLING)
+
+# Arquivos gravados no diretório do job por cada modo
+PROFILE_FILES = {PROFILE_CPROFILE: 'profile.pstats', PROFILE_SAMPLING: 'profile.folded'}
+
+# Intervalo (s) entre amostras do profiler por amostragem
+SAMPLING_INTERVAL = 0.005
+
+# Motivos de descarte de uma linha ou variante
+SKIP_MALFORMED_LINE = 'malformed_line'
+SKIP_INVALID_POSITION = 'invalid_position'
+SKIP_UNKNOWN_PROTEIN = 'unknown_protein'
+SKIP_POSITION_OUT_OF_RANGE = 'position_out_of_range'
+SKIP_UNKNOWN_AMINO_ACID = 'unknown_amino_acid'
+
+
+class PipelineStats:
+    """
+    Instrumentação de uma execução de process_mutations: duração de cada etapa e
+    contadores (variantes lidas, descartadas por motivo, peptídeos emitidos e bytes
+    gravados). Os contadores dos shards paralelos são somados com merge(). Em
+    rejected ficam, por motivo, as primeiras linhas descartadas na leitura
+    ([número da linha, texto]).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = Counter()
+        self.skipped = Counter()
+        self.rejected = {}
+        self.bytes_written = {}
+
+    @contextmanager
+    def stage(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[nome] = self.stages.get(nome, 0.0) + time.perf_counter() - inicio
+
+    def skip(self, motivo, n=1, exemplos=()):
+        self.skipped[motivo] += n
+        if exemplos:
+            self.rejected.setdefault(motivo, []).extend(list(exemplo) for exemplo in exemplos)
+
+    def merge(self, dados):
+        """Soma os contadores de outro PipelineStats (ou do seu as_dict())."""
+        if isinstance(dados, PipelineStats):
+            dados = dados.as_dict()
+        self.counters.update(dados.get('counters', {}))
+        self.skipped.update(dados.get('skipped', {}))
+        for motivo, exemplos in dados.get('rejected', {}).items():
+            self.rejected.setdefault(motivo, []).extend(exemplos)
+
+    def as_dict(self):
+        return {
+            'stages': {nome: round(segundos, 4) for nome, segundos in self.stages.items()},
+            'counters': dict(self.counters),
+            'skipped': dict(self.skipped),
+            'rejected': {motivo: list(exemplos) for motivo, exemplos in self.rejected.items()},
+            'bytes_written': dict(self.bytes_written),
+        }
+
+    def log(self, logger, descricao=''):
+        dados = self.as_dict()
+        logger.info('process_mutations %s stages=%s counters=%s skipped=%s bytes_written=%s', descricao,
+                    dados['stages'], dados['counters'], dados['skipped'], dados['bytes_written'])
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem sem dependências: uma thread lê a pilha da thread
+    perfilada a cada SAMPLING_INTERVAL e conta as pilhas no formato "folded"
+    (uma linha 'f1;f2;f3 N' por pilha), aceito pelas ferramentas de flame graph.
+    """
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._alvo = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._alvo = threading.get_ident()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _amostrar(self):
+        while not self._parar.wait(self.interval):
+            frame = sys._current_frames().get(self._alvo)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+                frame = frame.f_back
+            if pilha:
+                self.samples[';'.join(reversed(pilha))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for pilha, n in self.samples.most_common():
+                f.write(f'{pilha} {n}\n')
+
+
+@contextmanager
+def profiling(modo, pasta):
+    """
+    Perfila o bloco e grava o resultado em pasta (profile.pstats ou profile.folded).
+    Com modo vazio não faz nada. No modo paralelo só o processo principal é perfilado.
+    """
+    if not modo:
+        yield None
+        return
+    if modo not in PROFILE_MODES:
+        raise ValueError(f"Modo de profiling desconhecido: {modo} (use {' ou '.join(PROFILE_MODES)})")
+    caminho = os.path.join(pasta, PROFILE_FILES[modo])
+    profiler = cProfile.Profile() if modo == PROFILE_CPROFILE else SamplingProfiler()
+    if modo == PROFILE_CPROFILE:
+        profiler.enable()
+    else:
+        profiler.start()
+    try:
+        yield caminho
+    finally:
+        if modo == PROFILE_CPROFILE:
+            profiler.disable()
+            profiler.dump_stats(caminho)
+        else:
+            profiler.stop()
+            profiler.dump(caminho)
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import MissenseJob
+from .peptide_processor import job_dir, save_input, run_pipeline
+from .batch import batch_input_name, run_batch_pipeline
+from .instrumentation import profiling
+from . import cache, storage
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo (s) entre gravações de andamento no banco
+PROGRESS_INTERVAL = 1.0
+
+
+def submit_job(input_data, input_type='text', input_name='', profile=''):
+    """
+    Grava a entrada no diretório do processamento e enfileira o job. A consulta ao
+    cache de resultados (hash da entrada inteira e versão da referência) fica com o
+    worker, fora da requisição: ver run_job. Retorna o MissenseJob.
+    """
+    job = MissenseJob(input_name=input_name[:255], profile=profile)
+    save_input(input_data, input_type, job_dir(job.id))
+    job.save()
+    return job
+
+
+def submit_batch(arquivos, profile=''):
+    """
+    Enfileira um único job com vários arquivos enviados juntos. Eles são processados
+    ao mesmo tempo pelo worker (batch.run_batch_pipeline), sem passar pelo cache de
+    resultados. Retorna o MissenseJob.
+    """
+    job = MissenseJob(input_name=f'{len(arquivos)} files', input_files=[arquivo.name for arquivo in arquivos],
+                      profile=profile)
+    for indice, arquivo in enumerate(arquivos):
+        save_input(arquivo, 'file', job.temp_dir, batch_input_name(indice, arquivo.name))
+    job.save()
+    return job
+
+
+def _restore_from_cache(job):
+    """
+    Conclui o job com as saídas do cache, se houver. Retorna True em caso de acerto;
+    uma entrada que some entre a consulta e a cópia (removida pelo limite do cache)
+    conta como ausente, e o job é processado normalmente.
+    """
+    if cache.lookup(job.cache_key) is None:
+        return False
+    try:
+        results = cache.restore(job.cache_key, job.temp_dir)
+    except (OSError, ValueError):
+        logger.warning("Entrada %s do cache indisponível; processando o job %s", job.cache_key, job.id,
+                       exc_info=True)
+        return False
+    with open(results_path(job), 'w') as f:
+        json.dump(results, f)
+    agora = timezone.now()
+    job.status = MissenseJob.STATUS_DONE
+    job.from_cache = True
+    job.stage = ''
+    job.started_at = job.started_at or agora
+    job.finished_at = agora
+    storage.record_usage(job)
+    return True
+
+
+def claim_next_job():
+    """Marca o job mais antigo da fila como 'running' e o retorna (None se a fila estiver vazia)."""
+    while True:
+        with transaction.atomic():
+            job = MissenseJob.objects.filter(status=MissenseJob.STATUS_QUEUED).order_by('created_at').first()
+            if job is None:
+                return None
+            # Atualização condicional: outro worker pode ter pegado o mesmo job
+            agora = timezone.now()
+            claimed = MissenseJob.objects.filter(pk=job.pk, status=MissenseJob.STATUS_QUEUED).update(
+                status=MissenseJob.STATUS_RUNNING, started_at=agora, heartbeat_at=agora, attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def reclaim_stale_jobs():
+    """
+    Jobs 'running' sem andamento gravado há mais de MISSENSE_JOB_STALE_SECONDS (worker
+    encerrado no meio do processamento) voltam para a fila, do zero; os que já foram
+    pegos MISSENSE_JOB_MAX_ATTEMPTS vezes falham, para que uma entrada que derruba o
+    worker não seja reprocessada para sempre. Retorna (reenfileirados, falhos).
+    """
+    agora = timezone.now()
+    limite = agora - timedelta(seconds=settings.MISSENSE_JOB_STALE_SECONDS)
+    orfaos = MissenseJob.objects.filter(status=MissenseJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=limite) | Q(heartbeat_at__isnull=True, started_at__lt=limite) |
+        Q(heartbeat_at__isnull=True, started_at__isnull=True))
+    with transaction.atomic():
+        falhos = orfaos.filter(attempts__gte=settings.MISSENSE_JOB_MAX_ATTEMPTS).update(
+            status=MissenseJob.STATUS_FAILED, stage='', finished_at=agora,
+            error='The worker stopped while processing this job.')
+        reenfileirados = orfaos.update(
+            status=MissenseJob.STATUS_QUEUED, stage='', variants_done=0, variants_total=0, stage_timings={},
+            started_at=None, heartbeat_at=None)
+    return reenfileirados, falhos
+
+
+class JobProgress:
+    """Callback de andamento para process_mutations que grava etapa, contagens e tempos no job."""
+
+    def __init__(self, job):
+        self.job = job
+        self._etapa = None
+        self._inicio_etapa = time.perf_counter()
+        self._ultima_gravacao = 0.0
+
+    def _fechar_etapa(self):
+        if self._etapa is not None:
+            duracao = time.perf_counter() - self._inicio_etapa
+            self.job.stage_timings[self._etapa] = round(self.job.stage_timings.get(self._etapa, 0) + duracao, 4)
+
+    def __call__(self, etapa, feitas, total):
+        agora = time.perf_counter()
+        mudou = etapa != self._etapa
+        if mudou:
+            self._fechar_etapa()
+            self._etapa = etapa
+            self._inicio_etapa = agora
+        self.job.stage = etapa
+        self.job.variants_done = feitas
+        self.job.variants_total = total
+        if mudou or agora - self._ultima_gravacao >= PROGRESS_INTERVAL:
+            self._ultima_gravacao = agora
+            # Cada gravação de andamento também é o sinal de vida do worker (ver reclaim_stale_jobs)
+            self.job.heartbeat_at = timezone.now()
+            self.job.save(update_fields=['stage', 'variants_done', 'variants_total', 'stage_timings', 'heartbeat_at'])
+
+    def finish(self):
+        self._fechar_etapa()
+        self._etapa = None
+
+
+def results_path(job):
+    return os.path.join(job.temp_dir, 'preview.json')
+
+
+def load_results(job):
+    """Prévia das saídas de um job concluído (gravada ao lado das saídas, não no banco)."""
+    with open(results_path(job), 'r') as f:
+        return json.load(f)
+
+
+def run_job(job):
+    """Executa o pipeline de um job já marcado como 'running' e registra o resultado."""
+    progresso = JobProgress(job)
+    try:
+        if job.is_batch:
+            # Vários arquivos enviados juntos: processados em paralelo, sem cache de resultados
+            with profiling(job.profile or settings.MISSENSE_PROFILE, job.temp_dir):
+                results = run_batch_pipeline(job.temp_dir, progress=progresso)
+        else:
+            # Se o mesmo conteúdo já foi processado com a referência e as opções atuais,
+            # o job é concluído com as saídas do cache. Com profile ('cprofile' ou
+            # 'sampling') ele sempre é executado, para que o perfil seja gravado.
+            progresso('cache', 0, 0)
+            versao = cache.reference_version()
+            job.cache_key = cache.input_key(os.path.join(job.temp_dir, 'input.txt'), versao,
+                                            cache.pipeline_options())
+            if not job.profile and _restore_from_cache(job):
+                # Fecha a etapa 'cache' (chave e cópia das saídas) nos tempos do job
+                progresso.finish()
+                job.save()
+                return job
+            results = run_pipeline(job.temp_dir, progress=progresso, profile=job.profile)
+        progresso.finish()
+        with open(results_path(job), 'w') as f:
+            json.dump(results, f)
+        if not job.is_batch:
+            try:
+                cache.store(job.cache_key, versao, job.temp_dir, results)
+            except Exception:
+                # Falha ao guardar no cache não invalida um processamento concluído
+                logger.exception("Falha ao guardar o job %s no cache de resultados", job.id)
+        job.status = MissenseJob.STATUS_DONE
+        job.stage = ''
+    except Exception as e:
+        progresso.finish()
+        job.status = MissenseJob.STATUS_FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    storage.record_usage(job)
+    job.save()
+    return job
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import json
+import os
+from missense_app.benchmark import SCENARIOS, run_isolated, compare, mismatched_params, scenario_params
+
+class Command(BaseCommand):
+    help = 'Mede o desempenho de process_mutations com proteomas e variantes sintéticos (sem rede)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Cenários a executar ({', '.join(SCENARIOS)}; padrão: tiny e small)")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'data', 'benchmark_baseline.json'),
+                            help='Arquivo JSON com os resultados de referência')
+        parser.add_argument('--save-baseline', action='store_true', help='Gravar os resultados como novo baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Regressão tolerada em relação ao baseline (fração, padrão 0.2)')
+        parser.add_argument('--backend', default=None, help='Backend da referência (padrão: MISSENSE_REFERENCE_BACKEND)')
+        parser.add_argument('--workers', type=int, default=None, help='Processos de trabalho (padrão: MISSENSE_WORKERS)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Execuções por cenário; vale a mais rápida (padrão 3)')
+        parser.add_argument('--seed', type=int, default=0, help='Semente dos dados sintéticos')
+        parser.add_argument('--workdir', default=None, help='Diretório para os dados gerados (mantidos ao final)')
+        parser.add_argument('--json', default=None, help='Gravar os resultados neste arquivo JSON')
+    
+    def handle(self, *args, **options):
+        nomes = options['scenarios'] or ['tiny', 'small']
+        desconhecidos = [nome for nome in nomes if nome not in SCENARIOS]
+        if desconhecidos:
+            raise CommandError(f"Cenários desconhecidos: {', '.join(desconhecidos)}")
+        
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], 'r') as f:
+                baseline = json.load(f)
+        elif not options['save_baseline']:
+            raise CommandError(f"Baseline {options['baseline']} não encontrado; use --save-baseline para gravar um")
+        
+        # Sem baseline com os mesmos dados e parâmetros a comparação não tem sentido: erro antes de medir
+        parametros = {nome: scenario_params(SCENARIOS[nome]['proteins'], SCENARIOS[nome]['variants'], options['seed'],
+                                            options['backend'], options['workers']) for nome in nomes}
+        if not options['save_baseline']:
+            problemas = []
+            for nome in nomes:
+                if nome not in baseline:
+                    problemas.append(f'{nome}: sem resultado no baseline')
+                else:
+                    problemas += [f'{nome}: {diferenca}' for diferenca in mismatched_params(parametros[nome], baseline[nome])]
+            if problemas:
+                raise CommandError(f"Baseline {options['baseline']} não comparável ({'; '.join(problemas)}); "
+                                   'use --save-baseline para gravar um novo')
+        
+        resultados = {}
+        regressoes = []
+        for nome in nomes:
+            cenario = SCENARIOS[nome]
+            self.stdout.write(f"{nome}: {cenario['proteins']} proteínas, {cenario['variants']} variantes...")
+            resultado = run_isolated(nome, cenario['proteins'], cenario['variants'], workdir=options['workdir'],
+                                     seed=options['seed'], repeat=options['repeat'], backend=parametros[nome]['backend'],
+                                     workers=parametros[nome]['workers'])
+            resultados[nome] = resultado
+            
+            self.stdout.write(f"  {resultado['seconds']:.2f}s  {resultado['variants_per_sec']:.0f} variantes/s  "
+                              f"{resultado['mb_per_sec']:.2f} MB/s  pico RSS {(resultado['peak_rss'] or 0) / 2 ** 20:.0f} MB")
+            for etapa, dados in resultado['stages'].items():
+                self.stdout.write(f"    {etapa:<10} {dados['seconds']:.2f}s  pico RSS {dados['peak_rss'] / 2 ** 20:.0f} MB")
+            
+            if not options['save_baseline']:
+                for problema in compare(resultado, baseline[nome], options['tolerance']):
+                    regressoes.append(f'{nome}: {problema}')
+                    self.stdout.write(self.style.ERROR(f'  regressão: {problema}'))
+        
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(resultados, f, indent=2)
+        
+        if options['save_baseline']:
+            baseline.update(resultados)
+            os.makedirs(os.path.dirname(os.path.abspath(options['baseline'])), exist_ok=True)
+            with open(options['baseline'], 'w') as f:
+                json.dump(baseline, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline gravado em {options['baseline']}"))
+        elif regressoes:
+            raise CommandError(f'{len(regressoes)} regressão(ões) em relação ao baseline')
+        else:
+            self.stdout.write(self.style.SUCCESS('Sem regressões em relação ao baseline'))
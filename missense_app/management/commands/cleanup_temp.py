@@ -1,35 +1,47 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 import os
-import shutil
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
+from missense_app import storage
 
 class Command(BaseCommand):
-    help = 'Limpa arquivos temporários gerados pelo processamento de peptídeos'
-    
+    help = 'Limpa os diretórios temporários dos processamentos de peptídeos (idade e cota de disco)'
+
     def add_arguments(self, parser):
-        parser.add_argument('--days', type=int, default=1,help='Remover arquivos mais antigos que este número de dias')
-    
+        parser.add_argument('--days', type=float, default=1,
+                            help='Remover jobs não acessados (e diretórios sem job) há mais que este número de dias')
+        parser.add_argument('--quota', type=int, default=None,
+                            help='Cota em bytes de media/temp (padrão: MISSENSE_TEMP_QUOTA_BYTES; 0 desliga)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Repetir a limpeza a cada --interval segundos, como varredura em segundo plano')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Intervalo (s) entre varreduras com --loop (padrão: MISSENSE_TEMP_SWEEP_INTERVAL)')
+
     def handle(self, *args, **options):
-        days = options['days']
-        cut_off_date = datetime.now() - timedelta(days=days)
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
-        
+        temp_dir = storage.temp_root()
         if not os.path.exists(temp_dir):
             self.stdout.write(self.style.WARNING(f'Diretório {temp_dir} não encontrado'))
             return
-        
-        count = 0
-        for item in os.listdir(temp_dir):
-            item_path = os.path.join(temp_dir, item)
-            
-            if os.path.isdir(item_path):
-                try:
-                    mod_time = datetime.fromtimestamp(os.path.getmtime(item_path))
-                    if mod_time < cut_off_date:
-                        shutil.rmtree(item_path)
-                        count += 1
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'Erro ao remover {item_path}: {str(e)}'))
-        
-        self.stdout.write(self.style.SUCCESS(f'Removidos {count} diretórios temporários mais antigos que {days} dias'))
\ No newline at end of file
+
+        intervalo = options['interval'] or settings.MISSENSE_TEMP_SWEEP_INTERVAL
+        while True:
+            self.cleanup(options['days'], options['quota'])
+            if not options['loop']:
+                return
+            time.sleep(intervalo)
+
+    def cleanup(self, days, quota):
+        max_age = timedelta(days=days) if days > 0 else None
+        try:
+            # Jobs: pelo índice (tamanho e último acesso), sem percorrer o disco
+            removidos, liberados = storage.sweep(quota, max_age)
+            # Diretórios sem job: só o primeiro nível de media/temp
+            orfaos = storage.remove_orphans(max_age or timedelta(days=1))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erro na limpeza de {storage.temp_root()}: {str(e)}'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Removidos {removidos} jobs ({liberados} bytes) e {orfaos} diretórios sem job; '
+            f'em uso: {storage.usage()} bytes'))
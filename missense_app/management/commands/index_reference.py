@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import time
+from missense_app.reference import build_fasta_index, build_reference_store
+
+class Command(BaseCommand):
+    help = 'Gera o índice de offsets (.fai) do FASTA de referência e, opcionalmente, o arquivo compilado (.store)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--fasta', default=None, help='FASTA de referência (padrão: MISSENSE_REFERENCE_FASTA)')
+        parser.add_argument('--store', action='store_true', help='Compilar também o proteoma mapeado em memória (.store)')
+    
+    def handle(self, *args, **options):
+        fasta = options['fasta'] or settings.MISSENSE_REFERENCE_FASTA
+        if not os.path.exists(fasta):
+            raise CommandError(f'Arquivo de referência {fasta} não encontrado')
+        
+        inicio = time.perf_counter()
+        index_path = build_fasta_index(fasta)
+        self.stdout.write(self.style.SUCCESS(f'Índice gravado em {index_path} ({time.perf_counter() - inicio:.2f}s)'))
+        
+        if options['store']:
+            inicio = time.perf_counter()
+            store_path = build_reference_store(fasta)
+            self.stdout.write(self.style.SUCCESS(f'Proteoma compilado em {store_path} ({time.perf_counter() - inicio:.2f}s)'))
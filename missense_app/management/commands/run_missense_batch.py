@@ -0,0 +1,128 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from missense_app.batch import (CHECKPOINT_FILE, Checkpoint, expand_inputs, ignore_interrupts, output_names,
+                                process_file)
+from missense_app.cache import output_options
+from missense_app.compression import SUFFIXES
+from missense_app.proteases import LEGACY, PROTEASES, digestion_rules
+from missense_app.reference import load_reference
+
+class Command(BaseCommand):
+    help = 'Processa vários arquivos de variantes fora do HTTP, em paralelo, retomando execuções interrompidas'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('inputs', nargs='+', help="Arquivos de variantes ou globs (ex.: 'coortes/**/*.tsv.gz')")
+        parser.add_argument('--output-dir', required=True, help='Diretório onde cada entrada ganha um subdiretório com as saídas')
+        parser.add_argument('--jobs', type=int, default=1, help='Arquivos processados ao mesmo tempo')
+        parser.add_argument('--workers', type=int, default=1, help='Processos por arquivo (modo paralelo de process_mutations)')
+        parser.add_argument('--fasta', default=None, help='FASTA de referência (padrão: MISSENSE_REFERENCE_FASTA)')
+        parser.add_argument('--backend', default=None, help='Backend da referência (padrão: MISSENSE_REFERENCE_BACKEND)')
+        parser.add_argument('--compression', choices=['none'] + list(SUFFIXES), default=None,
+                            help='Compressão das saídas (padrão: MISSENSE_OUTPUT_COMPRESSION)')
+        parser.add_argument('--protease', choices=[LEGACY] + list(PROTEASES), default=None,
+                            help='Enzima da digestão (padrão: MISSENSE_PROTEASE)')
+        parser.add_argument('--missed-cleavages', type=int, default=None,
+                            help='Clivagens perdidas, de 0 a 2 (padrão: MISSENSE_MISSED_CLEAVAGES)')
+        parser.add_argument('--min-length', type=int, default=None, help='Tamanho mínimo dos peptídeos')
+        parser.add_argument('--max-length', type=int, default=None, help='Tamanho máximo dos peptídeos')
+        parser.add_argument('--deduplicate', action='store_true', default=None,
+                            help='Grava cada peptídeo uma única vez, com as ocorrências em dbpepcounts '
+                                 '(padrão: MISSENSE_DEDUPLICATE)')
+        parser.add_argument('--checkpoint', default=None, help=f'Arquivo de checkpoint (padrão: <output-dir>/{CHECKPOINT_FILE})')
+        parser.add_argument('--force', action='store_true', help='Reprocessar também os arquivos já concluídos')
+    
+    def handle(self, *args, **options):
+        arquivos, sem_arquivos = expand_inputs(options['inputs'])
+        for padrao in sem_arquivos:
+            self.stdout.write(self.style.WARNING(f'Nenhum arquivo encontrado para {padrao}'))
+        if not arquivos:
+            raise CommandError('Nenhum arquivo de entrada encontrado')
+        
+        fasta = str(options['fasta'] or settings.MISSENSE_REFERENCE_FASTA)
+        backend = options['backend'] or settings.MISSENSE_REFERENCE_BACKEND
+        compression = options['compression'] or settings.MISSENSE_OUTPUT_COMPRESSION
+        if compression == 'none':
+            compression = None
+        try:
+            rules = digestion_rules(options['protease'], options['missed_cleavages'], options['min_length'],
+                                    options['max_length'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        deduplicate = settings.MISSENSE_DEDUPLICATE if options['deduplicate'] is None else options['deduplicate']
+        output_dir = os.path.abspath(options['output_dir'])
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # A referência é carregada uma vez aqui; os processos criados por fork a herdam já mapeada
+        inicio = time.perf_counter()
+        try:
+            referencia = load_reference(fasta, backend)
+        except Exception as e:
+            raise CommandError(f'Erro ao carregar a referência {fasta}: {e}')
+        self.stdout.write(f'Referência carregada ({time.perf_counter() - inicio:.2f}s)')
+        
+        # Um arquivo concluído com outra referência ou outras opções de saída é refeito
+        opcoes = dict(output_options(compression, rules, deduplicate), reference=referencia.version)
+        checkpoint = Checkpoint(options['checkpoint'] or os.path.join(output_dir, CHECKPOINT_FILE), opcoes)
+        
+        nomes = output_names(arquivos)
+        pendentes = []
+        for caminho in arquivos:
+            destino = os.path.join(output_dir, nomes[caminho])
+            if not options['force'] and checkpoint.is_done(caminho, destino):
+                continue
+            pendentes.append((caminho, destino))
+        self.stdout.write(f'{len(arquivos)} arquivo(s), {len(arquivos) - len(pendentes)} já concluído(s) no checkpoint')
+        if not pendentes:
+            return
+        
+        falhas = []
+        feitos = 0
+        interrompido = []
+        futuros = {}
+        
+        def interromper(signum, frame):
+            # Primeiro sinal: não inicia novos arquivos e espera os que estão em andamento
+            # (que entram no checkpoint). Um segundo Ctrl-C interrompe de imediato.
+            interrompido.append(signum)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for futuro in futuros:
+                futuro.cancel()
+            self.stdout.write(self.style.WARNING('Interrompendo: aguardando os arquivos em andamento...'))
+        
+        anteriores = {sinal: signal.signal(sinal, interromper) for sinal in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            # Os processos ignoram SIGINT: o Ctrl-C do terminal é tratado só aqui
+            with ProcessPoolExecutor(max_workers=max(1, options['jobs']), initializer=ignore_interrupts) as executor:
+                for caminho, destino in pendentes:
+                    futuro = executor.submit(process_file, fasta, caminho, destino, backend, options['workers'],
+                                             compression, rules, deduplicate)
+                    futuros[futuro] = (caminho, destino)
+                for futuro in as_completed(futuros):
+                    if futuro.cancelled():
+                        continue
+                    caminho, destino = futuros[futuro]
+                    feitos += 1
+                    try:
+                        stats = futuro.result()
+                    except Exception as e:
+                        falhas.append(caminho)
+                        self.stdout.write(self.style.ERROR(f'[{feitos}/{len(pendentes)}] {caminho}: {e}'))
+                        continue
+                    checkpoint.mark_done(caminho, destino, stats)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"[{feitos}/{len(pendentes)}] {caminho} -> {destino} "
+                        f"({stats['seconds']:.2f}s, {stats['counters'].get('variants_read', 0)} variantes)"))
+        finally:
+            for sinal, anterior in anteriores.items():
+                signal.signal(sinal, anterior)
+        
+        if interrompido:
+            raise CommandError(f'Interrompido após {feitos - len(falhas)} arquivo(s) concluído(s); '
+                               'execute de novo para retomar do checkpoint')
+        if falhas:
+            raise CommandError(f'{len(falhas)} arquivo(s) falharam; execute de novo para tentar apenas os pendentes')
+        self.stdout.write(self.style.SUCCESS(f'{len(pendentes)} arquivo(s) processados em {output_dir}'))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django import db
+import multiprocessing
+import time
+from missense_app.jobs import claim_next_job, reclaim_stale_jobs, run_job
+from missense_app import storage
+
+class Command(BaseCommand):
+    help = 'Executa os processamentos de variantes enfileirados pelo formulário /missense/'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Número de jobs processados ao mesmo tempo')
+        parser.add_argument('--poll', type=float, default=2.0, help='Intervalo (s) entre consultas à fila vazia')
+        parser.add_argument('--once', action='store_true', help='Processar a fila atual e sair')
+    
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        # Jobs deixados em 'running' por um worker encerrado no meio do processamento
+        reenfileirados, falhos = reclaim_stale_jobs()
+        if reenfileirados or falhos:
+            self.stdout.write(self.style.WARNING(f'Jobs órfãos: {reenfileirados} reenfileirado(s), {falhos} falho(s)'))
+        if concurrency == 1:
+            self.work(options['poll'], options['once'])
+            return
+        
+        # Conexões abertas não podem ser compartilhadas entre processos
+        db.connections.close_all()
+        processos = [multiprocessing.Process(target=self.work, args=(options['poll'], options['once']))
+                     for _ in range(concurrency)]
+        for processo in processos:
+            processo.start()
+        for processo in processos:
+            processo.join()
+    
+    def work(self, poll, once):
+        while True:
+            # Cota de media/temp: varredura periódica pelo índice, sem percorrer o disco
+            self.sweep(storage.maybe_sweep())
+            job = claim_next_job()
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            
+            self.stdout.write(f'Processando job {job.id}')
+            job = run_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(f'Job {job.id} concluído {job.stage_timings}'))
+                if job.profile:
+                    self.stdout.write(f'Perfil ({job.profile}) gravado em {job.temp_dir}')
+            else:
+                self.stdout.write(self.style.ERROR(f'Job {job.id} falhou: {job.error}'))
+            self.sweep(storage.maybe_sweep(force=True))
+    
+    def sweep(self, resultado):
+        if resultado and resultado[0]:
+            removidos, liberados = resultado
+            self.stdout.write(f'Cota de armazenamento: {removidos} job(s) removido(s), {liberados} bytes liberados')
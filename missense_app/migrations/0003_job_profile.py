@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missense_app', '0002_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missensejob',
+            name='profile',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:01
+
+import os
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def index_existing_jobs(apps, schema_editor):
+    # Jobs concluídos antes do índice entram com o tamanho atual e o fim como último acesso
+    MissenseJob = apps.get_model('missense_app', 'MissenseJob')
+    for job in MissenseJob.objects.filter(status__in=('done', 'failed')).annotate(
+            acesso=Coalesce('finished_at', 'created_at')).iterator():
+        total = 0
+        for raiz, _, arquivos in os.walk(os.path.join(settings.MEDIA_ROOT, 'temp', str(job.id))):
+            total += sum(os.lstat(os.path.join(raiz, nome)).st_size for nome in arquivos)
+        MissenseJob.objects.filter(pk=job.pk).update(size_bytes=total, last_access=job.acesso)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missense_app', '0003_job_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missensejob',
+            name='evicted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='missensejob',
+            name='last_access',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='missensejob',
+            name='size_bytes',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(index_existing_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missense_app', '0004_job_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missensejob',
+            name='input_files',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('missense_app', '0005_job_input_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missensejob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='missensejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
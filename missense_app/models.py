@@ -1,3 +1,92 @@
+import uuid
 from django.db import models
 
 # Create your models here.
+
+class MissenseJob(models.Model):
+    """Processamento de variantes enfileirado pelo formulário e executado pelo worker (run_missense_worker)."""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    input_name = models.CharField(max_length=255, blank=True)
+    stage = models.CharField(max_length=32, blank=True)
+    variants_total = models.PositiveBigIntegerField(default=0)
+    variants_done = models.PositiveBigIntegerField(default=0)
+    stage_timings = models.JSONField(default=dict, blank=True)
+    # Chave do cache de resultados (hash da entrada + versão da referência)
+    cache_key = models.CharField(max_length=64, blank=True)
+    from_cache = models.BooleanField(default=False)
+    # Modo de profiling pedido na submissão ('cprofile', 'sampling' ou vazio)
+    profile = models.CharField(max_length=16, blank=True)
+    # Nomes dos arquivos de um envio em lote (vazio para uma única entrada)
+    input_files = models.JSONField(default=list, blank=True)
+    # Índice do espaço em media/temp (ver storage): tamanho do diretório do job, último
+    # acesso (conclusão, página de resultados ou download) e quando foi removido pela cota
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    last_access = models.DateTimeField(null=True, blank=True, db_index=True)
+    evicted_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Vezes que o job foi pego por um worker e última gravação de andamento: um job
+    # 'running' sem andamento recente ficou órfão (ver jobs.reclaim_stale_jobs)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f'{self.id} ({self.status})'
+
+    @property
+    def temp_dir(self):
+        from .peptide_processor import job_dir
+        return job_dir(self.id)
+
+    @property
+    def progress(self):
+        """Fração das variantes já processadas (0 a 1)."""
+        if self.status == self.STATUS_DONE:
+            return 1.0
+        if not self.variants_total:
+            return 0.0
+        return min(1.0, self.variants_done / self.variants_total)
+
+    @property
+    def is_batch(self):
+        return bool(self.input_files)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def output_path(self, file_type):
+        from .peptide_processor import find_output
+        return find_output(self.temp_dir, file_type)
+
+
+class ResultCacheEntry(models.Model):
+    """Resultado guardado em media/cache/<key>, endereçado pelo hash da entrada normalizada + versão da referência."""
+
+    key = models.CharField(max_length=64, primary_key=True)
+    reference_version = models.CharField(max_length=64)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_access = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -1,186 +1,756 @@
 import re
 import os
+import logging
 import tempfile
 from django.conf import settings
+from django.core.files.move import file_move_safe
 import uuid
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from .reference import load_reference
+from .digestion import ProteinDigest, TRYPTIC_IGNORECASE
+from .proteome import encoded_proteome
+from .proteases import LEGACY_RULES, digestion_rules, get_protease
+from .compression import SUFFIXES, open_file, estimated_size
+from .instrumentation import (PipelineStats, profiling, SKIP_UNKNOWN_PROTEIN, SKIP_POSITION_OUT_OF_RANGE,
+                              SKIP_UNKNOWN_AMINO_ACID)
+from .variant_table import (AMINO, AMINO_CODES, PARSER_LEGACY, parse_variant_line, variant_rejection,
+                            read_variant_table, group_variant_table, count_variant_table)
 
-def process_peptide_data(input_data, input_type='text'):
-    # Criar um ID único para este processamento
-    process_id = str(uuid.uuid4())
-    
-    # Definir caminhos de arquivos temporários
-    temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp', process_id)
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    input_file = os.path.join(temp_dir, 'input.txt')
-    dbsaida_file = os.path.join(temp_dir, 'dbsaida.txt')
-    dbpepmutref_file = os.path.join(temp_dir, 'dbpepmutref.txt')
-    dbfinal_file = os.path.join(temp_dir, 'dbfinal.txt')
+logger = logging.getLogger(__name__)
+
+def job_dir(process_id):
+    """Diretório temporário de um processamento (media/temp/<process_id>)."""
+    return os.path.join(settings.MEDIA_ROOT, 'temp', str(process_id))
+
+
+def save_input(input_data, input_type, temp_dir, filename='input.txt'):
+    """
+    Grava a entrada (texto do formulário ou arquivo enviado) em <temp_dir>/input.txt
+    (ou em filename, relativo a temp_dir). Arquivos .gz/.bz2/.zst são guardados
+    comprimidos; a leitura detecta a compressão.
+    """
+    input_file = os.path.join(temp_dir, filename)
+    os.makedirs(os.path.dirname(input_file), exist_ok=True)
     
     # Salvar os dados de entrada em um arquivo
     if input_type == 'text':
         with open(input_file, 'w') as f:
             f.write(input_data)
+    elif hasattr(input_data, 'temporary_file_path'):
+        # Upload grande já está em disco: move o arquivo em vez de copiá-lo
+        input_data.close()
+        file_move_safe(input_data.temporary_file_path(), input_file, allow_overwrite=True)
     else:  
         with open(input_file, 'wb') as f:
             for chunk in input_data.chunks():
                 f.write(chunk)
+    return input_file
+
+
+def output_files(compression=None, deduplicate=None):
+    """
+    Nomes dos arquivos de saída, com a extensão da compressão configurada (MISSENSE_OUTPUT_COMPRESSION).
+    Com a deduplicação (MISSENSE_DEDUPLICATE) inclui o arquivo de contagens.
+    """
+    compression = compression or settings.MISSENSE_OUTPUT_COMPRESSION
+    deduplicate = settings.MISSENSE_DEDUPLICATE if deduplicate is None else deduplicate
+    sufixo = SUFFIXES[compression] if compression else ''
+    return tuple(nome + sufixo for nome in OUTPUT_FILES + ((COUNTS_FILE,) if deduplicate else ()))
+
+
+def output_paths(temp_dir):
+    """Caminhos dos arquivos de saída, no formato guardado na sessão para download."""
+    return {f"{nome.split('.')[0]}_path": os.path.join(temp_dir, nome) for nome in output_files()}
+
+
+def find_output(temp_dir, file_type):
+    """Caminho da saída file_type em temp_dir, com ou sem compressão (a que existir)."""
+    for sufixo in ('',) + tuple(SUFFIXES.values()):
+        caminho = os.path.join(temp_dir, f'{file_type}.txt{sufixo}')
+        if os.path.exists(caminho):
+            return caminho
+    return os.path.join(temp_dir, f'{file_type}.txt')
+
+
+def run_pipeline(temp_dir, progress=None, profile=None):
+    """
+    Processa <temp_dir>/input.txt e retorna a prévia das saídas e as estatísticas.
+    profile ('cprofile' ou 'sampling'; padrão MISSENSE_PROFILE) grava o perfil da
+    execução em temp_dir.
+    """
+    paths = output_paths(temp_dir)
+    proteinas_file = settings.MISSENSE_REFERENCE_FASTA
+    with profiling(profile or settings.MISSENSE_PROFILE, temp_dir):
+        # As primeiras 10 linhas de cada saída são capturadas durante a gravação
+        return process_mutations(proteinas_file, os.path.join(temp_dir, 'input.txt'), paths['dbsaida_path'],
+                                 paths['dbpepmutref_path'], paths['dbfinal_path'], progress=progress,
+                                 compression=settings.MISSENSE_OUTPUT_COMPRESSION,
+                                 deduplicate=settings.MISSENSE_DEDUPLICATE, dbpepcounts=paths.get('dbpepcounts_path'))
+
+
+def process_peptide_data(input_data, input_type='text'):
+    # Criar um ID único para este processamento
+    process_id = str(uuid.uuid4())
     
-    proteinas_file = os.path.join(settings.BASE_DIR, 'data', 'RefSeqhumanFullNP.fasta')
-    process_mutations(proteinas_file, input_file, dbsaida_file, dbpepmutref_file, dbfinal_file)
-    
-    # Ler os resultados e pegar as primeiras 10 linhas
-    results = {}
-    for file_type in ['dbpepmutref', 'dbsaida', 'dbfinal']:
-        file_path = os.path.join(temp_dir, f'{file_type}.txt')
-        try:
-            with open(file_path, 'r') as f:
-                content = ''.join(f.readlines()[:10])
-                results[file_type] = content
-        except Exception as e:
-            results[file_type] = f"Erro ao ler o arquivo: {str(e)}"
+    # Definir caminhos de arquivos temporários
+    temp_dir = job_dir(process_id)
+    save_input(input_data, input_type, temp_dir)
+    results = run_pipeline(temp_dir)
     
-    session_data = {
-        'dbpepmutref_path': dbpepmutref_file,
-        'dbsaida_path': dbsaida_file,
-        'dbfinal_path': dbfinal_file,
-        'process_id': process_id
-    }
+    session_data = dict(output_paths(temp_dir), process_id=process_id)
     
     return results, session_data
 
-def process_mutations(proteinas, mutacao, dbsaida, dbpepmutref, dbfinal):
-    amino = {
-        "Ala": "a", "Arg": "r", "Asn": "n", "Asp": "d", "Cys": "c", "Gln": "q", "Glu": "e", "Gly": "g", "His": "h",
-        "Ile": "i", "Leu": "l", "Lys": "k", "Met": "m", "Phe": "f", "Pro": "p", "Ser": "s", "Thr": "t", "Trp": "w",
-        "Tyr": "y", "Val": "v", "Ter": "z",
-        "A": "a", "R": "r", "N": "n", "D": "d", "C": "c", "Q": "q", "E": "e", "G": "g", "H": "h",
-        "I": "i", "L": "l", "K": "k", "M": "m", "F": "f", "P": "p", "S": "s", "T": "t", "W": "w",
-        "Y": "y", "V": "v", "Z": "z"
-    }
-
-    idnp = None
-    hash_proteinas = {}
-    concat_peptideo = ""  
-    prev_id = None 
+# Arquivos gerados por process_mutations, na ordem dos argumentos
+OUTPUT_FILES = ('dbsaida.txt', 'dbpepmutref.txt', 'dbfinal.txt')
+# Saída extra da deduplicação: peptídeo, ocorrências e variantes que o geraram
+COUNTS_FILE = 'dbpepcounts.txt'
+# Shards por worker no modo paralelo (equilibra proteínas de tamanhos diferentes)
+SHARDS_PER_WORKER = 4
+# Linhas de cada saída mostradas na página de resultados
+PREVIEW_LINES = 10
+# Peptídeos distintos por arquivo de origens da deduplicação (ver PeptideDeduplicator)
+ORIGINS_PER_BUCKET = 100000
+# Arquivo, ao lado de cada partição em disco, com os NPs dela na ordem global
+PARTITION_ORDER_SUFFIX = '.order'
+
+_MINUSCULA = re.compile(r'[a-z]')
+_RK_MINUSCULO = re.compile(r'[r|k]')
+
+
+def read_variants(DBSNP, stats=None):
+    """
+    Lê o arquivo de variantes linha a linha, pulando linhas incompletas ou com posição
+    inválida (contadas em stats, se informado; linhas vazias não contam).
+    """
+    for lin in DBSNP:
+        variante, motivo = parse_variant_line(lin)
+        if variante is not None:
+            yield variante
+        elif motivo is not None and stats is not None:
+            stats.skip(motivo)
+
+
+def group_variants(variantes, stats=None):
+    """
+    Agrupa as variantes por NP, na ordem da primeira ocorrência de cada proteína.
+    As descartadas por variant_rejection (contadas em stats) também definem essa
+    ordem, como no leitor colunar.
+    """
+    grupos = {}
+    for variante in variantes:
+        grupo = grupos.get(variante.id_)
+        if grupo is None:
+            grupo = grupos[variante.id_] = []
+        motivo = variant_rejection(variante)
+        if motivo is None:
+            grupo.append(variante)
+        elif stats is not None:
+            stats.skip(motivo)
+    return grupos
+
+
+def process_variant(digestao, variante, DBSAIDA, DBRELACAO, stats=None, rules=LEGACY_RULES):
+    """
+    Gera os peptídeos mutados de uma variante, grava dbsaida/dbpepmutref e
+    retorna os peptídeos emitidos (para a concatenação do dbfinal). Com uma
+    protease em digestao os peptídeos seguem as regras (clivagens perdidas e
+    tamanhos); sem ela vale a digestão tríptica histórica.
+    """
+    id_, snp, ref, pos, alt = variante
+    mutacao = f"p.{ref}{pos}{alt}"
+    emitidos = []
+
+    # Verificar se a posição é válida
+    if pos <= 0 or pos > len(digestao):
+        if stats is not None:
+            stats.skip(SKIP_POSITION_OUT_OF_RANGE)
+        return emitidos
+    
+    # Verificar se aminoácidos ref e alt estão no dicionário
+    if ref not in AMINO_CODES or alt not in AMINO_CODES:
+        if stats is not None:
+            stats.skip(SKIP_UNKNOWN_AMINO_ACID)
+        return emitidos
+    
+    # Converter para código de uma letra se necessário
+    ref_one_letter = AMINO.get(ref, ref.lower())
+    alt_one_letter = AMINO.get(alt, alt.lower())
+
+    if digestao.protease is not None:
+        return _emit_cleavage_peptides(digestao, variante, mutacao, ref_one_letter, alt_one_letter, rules,
+                                       DBSAIDA, DBRELACAO)
+    
+    # Substituir o aminoácido na posição correta; só a janela entre os
+    # sítios de clivagem vizinhos é redigerida
+    aminoacidos = digestao.mutate(pos - 1, alt_one_letter)
+
+    for pepmutado in aminoacidos.tryptic_peptides():
+        tam_pep = len(pepmutado)
+        if rules.min_length <= tam_pep <= rules.max_length and _MINUSCULA.search(pepmutado):
+            aminoref = ref_one_letter
+            aminomut = alt_one_letter
+            pepref = pepmutado.replace(aminomut, aminoref)
+
+            sitiopos = aminoacidos.find(pepmutado)
+
+            if sitiopos == 0:
+                pepmutado = pepmutado + pepmutado[1:]
+            
+            if _RK_MINUSCULO.search(pepmutado):  # Verifica se um novo peptídeo tríptico foi criado
+                peptriptico = ""
+                # Busca novamente fragmentos trípticos
+                for match in TRYPTIC_IGNORECASE.finditer(pepmutado):
+                    pep = match.group(1)
+                    if len(pep) >= 7:
+                        peptriptico += pep  # Concatena fragmentos com tamanho adequado
+                pepmutado = peptriptico 
+            
+            if 'z' in pepmutado:
+                stop = 'z'
+                pos_stop = pepmutado.index(stop)
+                pepstop = pepmutado[:pos_stop]
+                if len(pepstop) >= 7:
+                    pepmutado = pepstop
+            
+            if pepmutado: 
+                DBSAIDA.write(f">{id_}\n{pepmutado}\n")
+                emitidos.append(pepmutado)
+
+                pepmut = pepmutado
+                for match in TRYPTIC_IGNORECASE.finditer(pepmutado):
+                    pepmut = match.group(1)
+                    sitiopos = aminoacidos.find(pepmut)
+                    DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
+
+                if sitiopos == 0 and alt == "Ter":
+                    sitiopos = 1  
+                    pepmutado = pepmutado[1:]
+                    DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
+
+    return emitidos
+
+
+def _emit_cleavage_peptides(digestao, variante, mutacao, ref_one_letter, alt_one_letter, rules, DBSAIDA, DBRELACAO):
+    """Grava os peptídeos da protease que contêm a variante, com o resíduo trocado em minúscula."""
+    id_, snp, _, pos, _ = variante
+    seq = digestao.seq
+    emitidos = []
+    for inicio, fim in digestao.cleavage_peptides(pos - 1, alt_one_letter, rules.missed_cleavages,
+                                                  rules.min_length, rules.max_length):
+        if alt_one_letter == 'z':
+            # Stop: o peptídeo é o novo C-terminal da proteína truncada
+            pepmut = pepref = seq[inicio:fim]
+        else:
+            pepmut = seq[inicio:pos - 1] + alt_one_letter + seq[pos:fim]
+            pepref = seq[inicio:pos - 1] + ref_one_letter + seq[pos:fim]
+        DBSAIDA.write(f">{id_}\n{pepmut}\n")
+        DBRELACAO.write(f">{id_}\t{snp}\t{inicio}\t{mutacao}\t{pepref}\t{pepmut}\n")
+        emitidos.append(pepmut)
+    return emitidos
+
+
+def process_protein(id_, digestao, variantes, DBSAIDA, DBRELACAO, DBFINAL, stats=None, rules=LEGACY_RULES,
+                    dedup=None, log=None):
+    """
+    Processa todas as variantes de uma proteína e grava um único registro dela no dbfinal.
+    Com dedup (PeptideDeduplicator ou EmissionLog) o dbsaida e o dbfinal ficam a cargo dele.
+    log (EmissionLog), se informado, também recebe cada peptídeo emitido.
+    """
+    # O registro do dbfinal é gravado aos poucos, sem acumular a concatenação em memória
+    aberto = False
+    for variante in variantes:
+        peptideos = process_variant(digestao, variante, DBSAIDA if dedup is None else _DISCARD, DBRELACAO, stats,
+                                    rules)
+        if stats is not None:
+            stats.counters['peptides_emitted'] += len(peptideos)
+        if dedup is not None or log is not None:
+            origem = f"{id_}:{variante.snp}:p.{variante.ref}{variante.pos}{variante.alt}"
+            for pepmutado in peptideos:
+                if log is not None:
+                    log.add(id_, origem, pepmutado)
+                if dedup is not None:
+                    dedup.add(id_, origem, pepmutado)
+            if dedup is not None:
+                continue
+        for pepmutado in peptideos:
+            if not aberto:
+                DBFINAL.write(f">{id_}\n")
+                aberto = True
+            DBFINAL.write(pepmutado)
+    if aberto:
+        DBFINAL.write("\n")
+
+
+class _Discard:
+    """Destino nulo para o dbsaida de process_variant quando a deduplicação grava o arquivo."""
+
+    def write(self, dados):
+        return len(dados)
+
+
+_DISCARD = _Discard()
+
+
+class PeptideDeduplicator:
+    """
+    Etapa opcional de deduplicação (MISSENSE_DEDUPLICATE): cada peptídeo mutado é
+    gravado uma única vez no dbsaida e no dbfinal (no registro da primeira proteína
+    que o gerou), e as variantes que o geraram vão para o arquivo de contagens. O
+    dbpepmutref continua com uma linha por variante.
+
+    Em memória ficam só o índice (ordem de aparição) e a contagem de cada peptídeo
+    distinto; as origens são gravadas em arquivos em spill_dir, um para cada
+    ORIGINS_PER_BUCKET peptídeos, e agrupadas em write_counts um arquivo por vez.
+    """
+
+    def __init__(self, DBSAIDA, DBFINAL, spill_dir, binary=False):
+        self._saida = DBSAIDA
+        self._final = DBFINAL
+        self._codificar = (lambda texto: texto.encode('utf-8')) if binary else str
+        self._spill_dir = spill_dir
+        self._indices = {}
+        self._contagens = []
+        self._baldes = []
+        self._aberto = None
+
+    def __len__(self):
+        return len(self._indices)
 
+    def _balde(self, indice):
+        numero = indice // ORIGINS_PER_BUCKET
+        if numero == len(self._baldes):
+            self._baldes.append(open(os.path.join(self._spill_dir, f'origins-{numero:05d}.txt'), 'w'))
+        return self._baldes[numero]
+
+    def add(self, id_, origem, peptideo):
+        indice = self._indices.get(peptideo)
+        if indice is None:
+            indice = self._indices[peptideo] = len(self._contagens)
+            self._contagens.append(0)
+            self._saida.write(self._codificar(f">{id_}\n{peptideo}\n"))
+            if self._aberto != id_:
+                self._final.write(self._codificar(f"\n>{id_}\n" if self._aberto is not None else f">{id_}\n"))
+                self._aberto = id_
+            self._final.write(self._codificar(peptideo))
+        self._contagens[indice] += 1
+        self._balde(indice).write(f"{indice}\t{origem}\n")
+
+    def close(self):
+        """Termina o registro aberto do dbfinal e fecha os arquivos de origens."""
+        if self._aberto is not None:
+            self._final.write(self._codificar("\n"))
+            self._aberto = None
+        for f in self._baldes:
+            f.close()
+
+    def write_counts(self, DBCONTAGENS):
+        """
+        Uma linha por peptídeo distinto, na ordem de aparição: peptídeo, ocorrências e
+        variantes (NP:SNP:mutação) separadas por vírgula. Chamado depois de close().
+        """
+        peptideos = iter(self._indices)
+        for f in self._baldes:
+            origens = {}
+            with open(f.name, 'r') as balde:
+                for lin in balde:
+                    indice, origem = lin.rstrip('\n').split('\t', 1)
+                    origens.setdefault(int(indice), []).append(origem)
+            os.remove(f.name)
+            for indice in sorted(origens):
+                DBCONTAGENS.write(f"{next(peptideos)}\t{self._contagens[indice]}\t{','.join(origens[indice])}\n")
+
+
+class EmissionLog:
+    """
+    Deduplicação nos processos do modo paralelo: registra as emissões (NP, origem,
+    peptídeo) do shard para o processo principal deduplicar na ordem serial.
+    """
+
+    def __init__(self, f):
+        self._f = f
+
+    def add(self, id_, origem, peptideo):
+        self._f.write(f"{id_}\t{origem}\t{peptideo}\n")
+
+    @staticmethod
+    def replay(caminho, dedup):
+        """Repassa ao dedup as emissões gravadas em caminho, na ordem."""
+        with open(caminho, 'r') as f:
+            for lin in f:
+                dedup.add(*lin.rstrip('\n').split('\t'))
+
+
+class PreviewWriter:
+    """Repassa as escritas para o arquivo e guarda as primeiras linhas gravadas (prévia dos resultados)."""
+
+    def __init__(self, f, max_lines=PREVIEW_LINES):
+        self._f = f
+        self._partes = []
+        self._max_lines = max_lines
+        self._faltam = max_lines
+
+    def close(self):
+        self._f.close()
+
+    def write(self, dados):
+        if self._faltam > 0:
+            self._partes.append(dados)
+            self._faltam -= dados.count(b'\n' if isinstance(dados, bytes) else '\n')
+        return self._f.write(dados)
+
+    @property
+    def preview(self):
+        texto = b''.join(self._partes).decode('utf-8', 'replace') if self._partes and \
+            isinstance(self._partes[0], bytes) else ''.join(self._partes)
+        return ''.join(texto.splitlines(keepends=True)[:self._max_lines])
+
+
+def _write_proteins(referencia, grupos, DBSAIDA, DBRELACAO, DBFINAL, avancar=None, stats=None, rules=LEGACY_RULES,
+                    dedup=None, log=None):
+    """
+    Digere e grava uma sequência de grupos (NP, variantes) nos três arquivos de saída.
+    avancar(n) é chamado com o número de variantes de cada proteína concluída.
+    """
+    protease = get_protease(rules)
+    codificado = encoded_proteome(referencia)
+    for id_, variantes in grupos:
+        if id_ in referencia:
+            # Sítios da enzima calculados uma vez por proteína (ou para o proteoma todo,
+            # com NumPy), reaproveitados por todas as variantes
+            if codificado is not None:
+                digestao = codificado.digest(id_, protease)
+            else:
+                digestao = ProteinDigest(referencia[id_], protease)
+            process_protein(id_, digestao, variantes, DBSAIDA, DBRELACAO, DBFINAL, stats, rules, dedup, log)
+            if stats is not None:
+                stats.counters['proteins_digested'] += 1
+        elif stats is not None:
+            stats.skip(SKIP_UNKNOWN_PROTEIN, len(variantes))
+        if avancar:
+            avancar(len(variantes))
+
+
+def _open_outputs(caminhos, mode='w', compression=None):
+    return [open_file(caminho, mode, compression) for caminho in caminhos]
+
+
+def _close_outputs(arquivos):
+    for f in arquivos:
+        f.close()
+
+
+def load_variants(mutacao, stats=None):
+    """
+    Variantes do arquivo agrupadas por NP (ver group_variants), com o leitor escolhido
+    em MISSENSE_VARIANT_PARSER: 'columnar' (blocos lidos e validados com pandas/NumPy;
+    ver variant_table) ou 'legacy' (linha a linha).
+    """
+    if settings.MISSENSE_VARIANT_PARSER == PARSER_LEGACY:
+        with open_file(mutacao, 'r') as DBSNP:
+            return group_variants(read_variants(DBSNP, stats), stats)
+    return group_variant_table(read_variant_table(mutacao, stats))
+
+
+def scan_variants(mutacao, stats=None):
+    """Primeira passada no arquivo de variantes: {NP: número de variantes}, na ordem da primeira ocorrência."""
+    if settings.MISSENSE_VARIANT_PARSER != PARSER_LEGACY:
+        return count_variant_table(read_variant_table(mutacao, stats))
+    contagem = {}
+    with open_file(mutacao, 'r') as DBSNP:
+        for variante in read_variants(DBSNP, stats):
+            # Variantes descartadas também definem a ordem das proteínas, como em count_variant_table
+            contagem.setdefault(variante.id_, 0)
+            motivo = variant_rejection(variante)
+            if motivo is None:
+                contagem[variante.id_] += 1
+            elif stats is not None:
+                stats.skip(motivo)
+    return {id_: total for id_, total in contagem.items() if total}
+
+
+def plan_partitions(contagem, limite):
+    """Atribui a cada NP uma partição contígua (na ordem serial) com até ~limite variantes."""
+    particao = {}
+    n, acumulado = 0, 0
+    for id_, total in contagem.items():
+        if acumulado and acumulado + total > limite:
+            n, acumulado = n + 1, 0
+        particao[id_] = n
+        acumulado += total
+    return particao, (n + 1 if contagem else 0)
+
+
+def spill_partitions(mutacao, particao, n_particoes, spill_dir):
+    """
+    Segunda passada: grava cada variante no arquivo da sua partição (TSV já
+    normalizado). Ao lado de cada partição fica a lista dos seus NPs na ordem global
+    (a de particao), que _load_partition restaura: os leitores já descartam as
+    variantes com aminoácidos desconhecidos ou posição não positiva, e a primeira
+    variante aceita de um NP pode vir depois da de outro NP que ele precede.
+    """
+    caminhos = [os.path.join(spill_dir, f'part-{n:05d}.tsv') for n in range(n_particoes)]
+    ordens = [[] for _ in range(n_particoes)]
+    for id_, n in particao.items():
+        ordens[n].append(id_)
+    for caminho, ids in zip(caminhos, ordens):
+        with open(caminho + PARTITION_ORDER_SUFFIX, 'w') as f:
+            f.write(''.join(f'{id_}\n' for id_ in ids))
+    arquivos = _open_outputs(caminhos)
     try:
-        with open(proteinas, 'r') as PROTEINAS, \
-             open(mutacao, 'r') as DBSNP, \
-             open(dbsaida, 'w') as DBSAIDA, \
-             open(dbpepmutref, 'w') as DBRELACAO, \
-             open(dbfinal, 'w') as DBFINAL: 
-
-            # Processando o arquivo de proteínas
-            for lin in PROTEINAS:
-                lin = lin.strip().replace('\r', '')
-                if lin.startswith(">"):
-                    head = lin.split("|")
-                    if len(head) > 3:
-                        idnp = head[3].split('.')[0]
-                        hash_proteinas[idnp] = ""
-                else:
-                    if idnp is not None:
-                        hash_proteinas[idnp] += lin
-
-            # Processando o arquivo de mutações
-            for lin in DBSNP:
-                lin = lin.strip().replace('\r', '')
-                
-                # Tratar diferentes formatos de entrada (espaços ou tabs)
-                if '\t' in lin:
-                    linhas = lin.split('\t')
+        if settings.MISSENSE_VARIANT_PARSER == PARSER_LEGACY:
+            with open_file(mutacao, 'r') as DBSNP:
+                for variante in read_variants(DBSNP):
+                    if variant_rejection(variante) is None:
+                        arquivos[particao[variante.id_]].write('\t'.join(map(str, variante)) + '\n')
+        else:
+            # Cada bloco é gravado com uma escrita por partição presente nele
+            for bloco in read_variant_table(mutacao):
+                partes = {}
+                ids = bloco.id_.tolist()
+                linhas = map('\t'.join, zip(ids, bloco.snp.tolist(), bloco.ref.tolist(), map(str, bloco.pos.tolist()),
+                                            bloco.alt.tolist()))
+                for id_, lin in zip(ids, linhas):
+                    partes.setdefault(particao[id_], []).append(lin)
+                for n, lins in partes.items():
+                    arquivos[n].write('\n'.join(lins) + '\n')
+    finally:
+        _close_outputs(arquivos)
+    return caminhos
+
+
+def _load_partition(caminho):
+    """Grupos de uma partição, na ordem global dos NPs gravada por spill_partitions."""
+    grupos = load_variants(caminho)
+    with open(caminho + PARTITION_ORDER_SUFFIX, 'r') as f:
+        ordem = f.read().split()
+    return {id_: grupos[id_] for id_ in ordem if id_ in grupos}
+
+
+def _remove_partition(caminho):
+    os.remove(caminho)
+    os.remove(caminho + PARTITION_ORDER_SUFFIX)
+
+
+def _process_shard(proteinas, backend, shard, shard_dir, rules=LEGACY_RULES, deduplicate=False, emissions=False):
+    """
+    Tarefa de um processo do pool: grava as saídas parciais de um shard. O shard é
+    uma lista de grupos (NP, variantes) ou o caminho de uma partição em disco.
+    Retorna os caminhos das saídas parciais e os contadores do shard. Com
+    deduplicate ou emissions, os peptídeos emitidos vão para um registro
+    (EmissionLog) gravado depois do dbfinal, que o processo principal deduplica ou
+    junta ao registro da execução; só com deduplicate o dbsaida e o dbfinal ficam
+    a cargo dele.
+    """
+    # Em processos criados por fork a referência já vem mapeada do processo pai
+    referencia = load_reference(proteinas, backend)
+    if isinstance(shard, str):
+        shard = _load_partition(shard).items()
+    registra = deduplicate or emissions
+    caminhos = tuple(os.path.join(shard_dir, nome) for nome in OUTPUT_FILES + (('emissions.txt',) if registra else ()))
+    arquivos = _open_outputs(caminhos)
+    stats = PipelineStats()
+    try:
+        registro = EmissionLog(arquivos[3]) if registra else None
+        _write_proteins(referencia, shard, *arquivos[:3], stats=stats, rules=rules,
+                        dedup=registro if deduplicate else None, log=None if deduplicate else registro)
+    finally:
+        _close_outputs(arquivos)
+    return caminhos, stats.as_dict()
+
+
+def shard_groups(grupos, n_shards):
+    """
+    Divide os grupos (na ordem do caminho serial) em até n_shards fatias contíguas
+    com número parecido de variantes. Concatenar as saídas das fatias em ordem
+    reproduz exatamente a saída serial.
+    """
+    itens = list(grupos.items())
+    total = sum(len(variantes) for _, variantes in itens)
+    alvo = max(1, -(-total // max(1, n_shards)))
+    shards, atual, acumulado = [], [], 0
+    for item in itens:
+        atual.append(item)
+        acumulado += len(item[1])
+        if acumulado >= alvo:
+            shards.append(atual)
+            atual, acumulado = [], 0
+    if atual:
+        shards.append(atual)
+    return shards
+
+
+def _shard_size(shard, contagem):
+    if isinstance(shard, str):
+        return contagem[shard]
+    return sum(len(variantes) for _, variantes in shard)
+
+
+def _process_parallel(proteinas, backend, shards, saidas, workers, tmp_dir, avancar=None, contagem=None,
+                      stats=None, rules=LEGACY_RULES, dedup=None, log=None):
+    """
+    Distribui os shards entre processos e junta as saídas parciais na ordem serial.
+    Com dedup, as emissões de cada shard são repassadas a ele, também em ordem; com
+    log (arquivo binário), os registros de emissões dos shards são concatenados nele.
+    """
+    # Sítios do proteoma inteiro calculados antes do pool: os processos criados por fork os herdam
+    codificado = encoded_proteome(load_reference(proteinas, backend))
+    if codificado is not None:
+        codificado.sites(get_protease(rules))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = []
+        for n, shard in enumerate(shards):
+            shard_dir = os.path.join(tmp_dir, f'shard-{n:05d}')
+            os.makedirs(shard_dir)
+            futuros.append(executor.submit(_process_shard, proteinas, backend, shard, shard_dir, rules,
+                                           dedup is not None, log is not None))
+        # Junta cada shard assim que termina, na ordem, e apaga as saídas parciais
+        for shard, futuro in zip(shards, futuros):
+            partes, parciais = futuro.result()
+            if stats is not None:
+                stats.merge(parciais)
+            for parte, saida in zip(partes, saidas):
+                with open(parte, 'rb') as f:
+                    shutil.copyfileobj(f, saida, 1024 * 1024)
+                os.remove(parte)
+            if dedup is not None:
+                EmissionLog.replay(partes[3], dedup)
+            if log is not None:
+                with open(partes[3], 'rb') as f:
+                    shutil.copyfileobj(f, log, 1024 * 1024)
+            if len(partes) > 3:
+                os.remove(partes[3])
+            if avancar:
+                avancar(_shard_size(shard, contagem))
+
+
+def process_mutations(proteinas, mutacao, dbsaida, dbpepmutref, dbfinal, backend=None, workers=None,
+                      progress=None, compression=None, rules=None, deduplicate=None, dbpepcounts=None,
+                      emissions=None):
+    """
+    Gera dbsaida, dbpepmutref e dbfinal a partir do arquivo de variantes e retorna a
+    prévia (primeiras linhas) de cada saída, capturada durante a gravação, e em
+    'stats' a instrumentação da execução (PipelineStats.as_dict()).
+
+    O arquivo de variantes é lido pelo leitor de MISSENSE_VARIANT_PARSER (ver
+    load_variants); as linhas descartadas na leitura ficam em stats['rejected'].
+    Arquivos de variantes maiores que MISSENSE_SPILL_THRESHOLD são particionados em
+    disco por proteína, de modo que a memória usada não cresce com a entrada.
+    progress(etapa, feitas, total), se informado, recebe o andamento: etapas
+    'reference', 'parsing' e 'digestion', com o número de variantes processadas.
+
+    O arquivo de variantes pode estar comprimido (gzip, bz2 ou zstd); compression
+    ('gzip', 'bz2', 'zstd' ou None) define a compressão das três saídas.
+
+    rules (proteases.DigestionRules; padrão: configurações MISSENSE_PROTEASE etc.)
+    escolhe a enzima, as clivagens perdidas e os tamanhos dos peptídeos. A protease
+    'legacy' reproduz a digestão tríptica histórica.
+
+    deduplicate (padrão: MISSENSE_DEDUPLICATE) grava cada peptídeo uma única vez no
+    dbsaida e no dbfinal e as ocorrências em dbpepcounts (padrão: dbpepcounts.txt ao
+    lado do dbfinal); ver PeptideDeduplicator.
+
+    emissions (caminho), se informado, recebe o registro (EmissionLog, sem
+    compressão) de todos os peptídeos emitidos, na ordem das saídas, para que
+    outras execuções sejam juntadas a esta por proteína (ver
+    batch.run_batch_pipeline).
+    """
+    backend = backend or settings.MISSENSE_REFERENCE_BACKEND
+    deduplicate = settings.MISSENSE_DEDUPLICATE if deduplicate is None else deduplicate
+    if deduplicate and not dbpepcounts:
+        dbpepcounts = os.path.join(os.path.dirname(os.path.abspath(dbfinal)),
+                                   COUNTS_FILE + (SUFFIXES[compression] if compression else ''))
+    rules = rules or digestion_rules()
+    workers = workers or settings.MISSENSE_WORKERS
+    andamento = {'feitas': 0, 'total': 0}
+    stats = PipelineStats()
+
+    def avancar(n):
+        andamento['feitas'] += n
+        if progress:
+            progress('digestion', andamento['feitas'], andamento['total'])
+
+    try:
+        # Proteoma aberto uma única vez por processo (store mmap ou índice faidx)
+        if progress:
+            progress('reference', 0, 0)
+        with stats.stage('reference'):
+            referencia = load_reference(proteinas, backend)
+        tmp_dir = tempfile.mkdtemp(prefix='missense-', dir=os.path.dirname(os.path.abspath(dbsaida)))
+        try:
+            if progress:
+                progress('parsing', 0, 0)
+            contagem = None
+            particionado = estimated_size(mutacao) > settings.MISSENSE_SPILL_THRESHOLD
+            with stats.stage('parsing'):
+                if particionado:
+                    # Entrada grande: duas passadas em streaming e partições contíguas em disco
+                    por_np = scan_variants(mutacao, stats)
+                    andamento['total'] = sum(por_np.values())
+                    particao, n_particoes = plan_partitions(por_np, settings.MISSENSE_PARTITION_VARIANTS)
+                    shards = spill_partitions(mutacao, particao, n_particoes, tmp_dir)
+                    contagem = dict.fromkeys(shards, 0)
+                    for id_, total in por_np.items():
+                        contagem[shards[particao[id_]]] += total
                 else:
-                    linhas = lin.split()
-                
-                # Verifica se a linha tem o número esperado de colunas
-                if len(linhas) < 5:
-                    continue
-
-                id_ = linhas[0].split('.')[0]
-                snp = linhas[1]
-                ref = linhas[2]
-                try:
-                    pos = int(linhas[3])
-                except ValueError:
-                    continue  # Pular linhas com posição inválida
-                alt = linhas[4]
-                mutacao = f"p.{ref}{pos}{alt}"
-
-                if id_ in hash_proteinas:
-                    aminoacidos = hash_proteinas[id_]
-                    
-                    # Verificar se a posição é válida
-                    if pos <= 0 or pos > len(aminoacidos):
-                        continue
-                    
-                    # Verificar se aminoácidos ref e alt estão no dicionário
-                    if ref not in amino and ref not in amino.values():
-                        continue
-                    if alt not in amino and alt not in amino.values():
-                        continue
-                    
-                    # Converter para código de uma letra se necessário
-                    ref_one_letter = amino.get(ref, ref.lower())
-                    alt_one_letter = amino.get(alt, alt.lower())
-                    
-                    # Substituir o aminoácido na posição correta
-                    aminoacidos = aminoacidos[:pos - 1] + alt_one_letter + aminoacidos[pos:]
-
-                    pattern = re.compile(r'([^RK]+(R|K|$))')
-                    for match in pattern.finditer(aminoacidos):
-                        pepmutado = match.group(1)
-                        tam_pep = len(pepmutado)
-                        if 7 <= tam_pep <= 35 and re.search(r'[a-z]', pepmutado):
-                            aminoref = ref_one_letter
-                            aminomut = alt_one_letter
-                            pepref = pepmutado.replace(aminomut, aminoref)
-
-                            sitiopos = aminoacidos.find(pepmutado)
-
-                            if sitiopos == 0:
-                                pepmutado = pepmutado + pepmutado[1:]
-                            
-                            if re.search(r'[r|k]', pepmutado):  # Verifica se um novo peptídeo tríptico foi criado
-                                peptriptico = ""
-                                pattern = re.compile(r'([^RK]+(R|K|$))', re.IGNORECASE)  # Busca novamente fragmentos trípticos
-                                for match in pattern.finditer(pepmutado):
-                                    pep = match.group(1)
-                                    if len(pep) >= 7:
-                                        peptriptico += pep  # Concatena fragmentos com tamanho adequado
-                                pepmutado = peptriptico 
-                            
-                            if 'z' in pepmutado:
-                                stop = 'z'
-                                pos_stop = pepmutado.index(stop)
-                                pepstop = pepmutado[:pos_stop]
-                                if len(pepstop) >= 7:
-                                    pepmutado = pepstop
-                            
-                            if pepmutado: 
-                                DBSAIDA.write(f">{id_}\n{pepmutado}\n")
-
-                                if prev_id and prev_id != id_: #verificação para caso o id mudar
-                                    DBFINAL.write(f">{prev_id}\n{concat_peptideo}\n")
-                                    concat_peptideo = ""
-
-                                prev_id = id_
-                                concat_peptideo += pepmutado #concatena o pep
-
-                                pattern = re.compile(r'([^RK]+(R|K|$))', re.IGNORECASE)
-                                for match in pattern.finditer(pepmutado):
-                                    pepmut = match.group(1)
-                                    sitiopos = aminoacidos.find(pepmut)
-                                    DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
-
-                                if sitiopos == 0 and alt == "Ter":
-                                    sitiopos = 1  
-                                    pepmutado = pepmutado[1:]
-                                    DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
-
-           # Grava o último ID e sequência concatenada
-            if prev_id:
-                DBFINAL.write(f">{prev_id}\n{concat_peptideo}\n")
+                    # Agrupa as variantes por proteína: cada proteína é lida e digerida uma única vez
+                    grupos = load_variants(mutacao, stats)
+                    andamento['total'] = sum(len(variantes) for variantes in grupos.values())
+                    # Mais shards que workers para equilibrar proteínas grandes
+                    shards = shard_groups(grupos, workers * SHARDS_PER_WORKER) if workers > 1 else [grupos.items()]
+            stats.counters['variants_read'] = andamento['total']
+            paralelo = workers > 1 and len(shards) > 1
+            avancar(0)
+
+            # No modo paralelo as saídas parciais são concatenadas como bytes
+            caminhos = (dbsaida, dbpepmutref, dbfinal)
+            saidas = [PreviewWriter(f) for f in _open_outputs(caminhos, 'wb' if paralelo else 'w', compression)]
+            dedup = PeptideDeduplicator(saidas[0], saidas[2], tmp_dir, binary=paralelo) if deduplicate else None
+            registro = open(emissions, 'wb' if paralelo else 'w') if emissions else None
+            log = EmissionLog(registro) if registro is not None and not paralelo else None
+            try:
+                # As escritas em buffer entram na digestão; 'writing' é o esvaziamento final
+                with stats.stage('digestion'):
+                    if paralelo:
+                        _process_parallel(proteinas, backend, shards, saidas, workers, tmp_dir, avancar, contagem,
+                                          stats, rules, dedup, registro)
+                    elif particionado:
+                        for caminho in shards:
+                            _write_proteins(referencia, _load_partition(caminho).items(), *saidas,
+                                            avancar=avancar, stats=stats, rules=rules, dedup=dedup, log=log)
+                            _remove_partition(caminho)
+                    else:
+                        _write_proteins(referencia, grupos.items(), *saidas, avancar=avancar, stats=stats,
+                                        rules=rules, dedup=dedup, log=log)
+                if dedup is not None:
+                    dedup.close()
+                    stats.counters['unique_peptides'] = len(dedup)
+                    with stats.stage('deduplication'):
+                        contagens = PreviewWriter(open_file(dbpepcounts, 'w', compression))
+                        try:
+                            dedup.write_counts(contagens)
+                        finally:
+                            contagens.close()
+                    caminhos += (dbpepcounts,)
+                    saidas.append(contagens)
+            finally:
+                with stats.stage('writing'):
+                    _close_outputs(saidas[:3])
+                    if registro is not None:
+                        registro.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
     except Exception as e:
-        raise Exception(f"Erro ao processar mutações: {str(e)}")
\ No newline at end of file
+        logger.exception("process_mutations falhou para %s", mutacao)
+        raise Exception(f"Erro ao processar mutações: {str(e)}") from e
+
+    nomes = OUTPUT_FILES + (COUNTS_FILE,)
+    for nome, caminho in zip(nomes, caminhos):
+        stats.bytes_written[nome.split('.')[0]] = os.path.getsize(caminho)
+    stats.log(logger, mutacao)
+
+    results = {nome.split('.')[0]: saida.preview for nome, saida in zip(nomes, saidas)}
+    results['stats'] = stats.as_dict()
+    return results
@@ -0,0 +1,81 @@
+import re
+from collections import namedtuple
+from django.conf import settings
+
+# Digestão histórica do pipeline: tripsina sem regra da prolina, sem clivagens perdidas
+# e com o re-split e o corte no stop originais. Reproduz exatamente as saídas antigas.
+LEGACY = 'legacy'
+
+# Clivagens perdidas aceitas (0 a 2, como nos motores de busca)
+MAX_MISSED_CLEAVAGES = 2
+
+
+class Protease:
+    """
+    Enzima que cliva no lado C-terminal dos resíduos indicados. Com proline_rule a
+    clivagem não ocorre quando o resíduo seguinte é uma prolina. O padrão dos sítios
+    é compilado uma única vez, na criação da enzima.
+    """
+
+    def __init__(self, name, residues, proline_rule):
+        self.name = name
+        self.residues = frozenset(residues)
+        self.proline_rule = proline_rule
+        padrao = f'[{residues}](?!P)' if proline_rule else f'[{residues}]'
+        self._sitio = re.compile(padrao, re.IGNORECASE)
+
+    def __repr__(self):
+        return f'Protease({self.name!r})'
+
+    def sites(self, seq):
+        """Posições (0-based) após as quais a sequência é clivada."""
+        return [m.start() for m in self._sitio.finditer(seq)]
+
+    def cleaves_after(self, residuo, seguinte):
+        """Se há clivagem entre residuo e seguinte ('' no fim da proteína)."""
+        if residuo.upper() not in self.residues:
+            return False
+        return not (self.proline_rule and seguinte.upper() == 'P')
+
+
+PROTEASES = {
+    'trypsin': Protease('trypsin', 'KR', proline_rule=True),
+    'trypsin/p': Protease('trypsin/p', 'KR', proline_rule=False),
+    'lys-c': Protease('lys-c', 'K', proline_rule=False),
+    'glu-c': Protease('glu-c', 'E', proline_rule=True),
+    'chymotrypsin': Protease('chymotrypsin', 'FWY', proline_rule=True),
+}
+
+# Regras de digestão de uma execução (o nome da enzima mantém a tupla serializável
+# para os processos do modo paralelo e para a chave do cache)
+DigestionRules = namedtuple('DigestionRules', ['protease', 'missed_cleavages', 'min_length', 'max_length'])
+
+LEGACY_RULES = DigestionRules(LEGACY, 0, 7, 35)
+
+
+def validate_rules(rules):
+    """Confere as regras e retorna-as; levanta ValueError se forem inválidas."""
+    if rules.protease != LEGACY and rules.protease not in PROTEASES:
+        raise ValueError(f"Protease desconhecida: {rules.protease} (use {', '.join([LEGACY] + list(PROTEASES))})")
+    if not 0 <= rules.missed_cleavages <= MAX_MISSED_CLEAVAGES:
+        raise ValueError(f"Clivagens perdidas devem estar entre 0 e {MAX_MISSED_CLEAVAGES}")
+    if rules.protease == LEGACY and rules.missed_cleavages:
+        raise ValueError(f"A digestão '{LEGACY}' não aceita clivagens perdidas; escolha uma protease")
+    if not 1 <= rules.min_length <= rules.max_length:
+        raise ValueError(f"Limites de tamanho inválidos: {rules.min_length}-{rules.max_length}")
+    return rules
+
+
+def digestion_rules(protease=None, missed_cleavages=None, min_length=None, max_length=None):
+    """Regras de digestão, com os valores não informados vindos das configurações MISSENSE_*."""
+    return validate_rules(DigestionRules(
+        protease or settings.MISSENSE_PROTEASE,
+        settings.MISSENSE_MISSED_CLEAVAGES if missed_cleavages is None else missed_cleavages,
+        min_length or settings.MISSENSE_PEPTIDE_MIN_LENGTH,
+        max_length or settings.MISSENSE_PEPTIDE_MAX_LENGTH,
+    ))
+
+
+def get_protease(rules):
+    """Enzima das regras, ou None para a digestão histórica."""
+    return None if rules.protease == LEGACY else PROTEASES[rules.protease]
@@ -0,0 +1,98 @@
+import threading
+from django.conf import settings
+from .digestion import ProteinDigest
+from .reference import ReferenceStore
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele os sítios são calculados proteína a proteína com regex
+    np = None
+
+_lock = threading.Lock()
+
+
+class EncodedProteome:
+    """
+    Proteoma do store visto como um único vetor uint8 (sem cópia, sobre o mmap) e
+    um vetor de offsets/tamanhos por proteína.
+
+    Os sítios de clivagem de todas as proteínas são calculados de uma vez, com
+    operações vetorizadas, na primeira vez que uma enzima é usada no processo; no
+    modo paralelo isso acontece no processo principal antes de o pool ser criado, e
+    os processos criados por fork herdam o resultado. Digerir uma proteína passa a
+    ser um par de buscas binárias no vetor de sítios, sem percorrer a sequência.
+
+    Só os sítios são vetorizados: as janelas de cada variante e os filtros dos
+    peptídeos continuam em Python (ProteinDigest e process_variant), porque operam
+    sobre strings e cada variante gera poucos peptídeos. Os sítios de uma proteína
+    viram lista uma vez por proteína, para as buscas com bisect de cada variante.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.residues = np.frombuffer(store._mm, dtype=np.uint8, offset=store._data_offset)
+        self._rows = {idnp: i for i, idnp in enumerate(store.index)}
+        posicoes = np.array(list(store.index.values()), dtype=np.int64).reshape(-1, 2)
+        self.offsets = posicoes[:, 0]
+        self.lengths = posicoes[:, 1]
+        # Posições com minúsculas (em geral nenhuma): decidem o caminho completo do MutatedProtein
+        self._lower = np.flatnonzero((self.residues >= ord('a')) & (self.residues <= ord('z')))
+        self._sites = {}
+
+    def sites(self, protease=None):
+        """
+        Posições (no vetor inteiro) após as quais há clivagem: R/K da digestão
+        histórica (só maiúsculas, como o regex original) ou os sítios da enzima.
+        """
+        nome = protease.name if protease is not None else None
+        sites = self._sites.get(nome)
+        if sites is None:
+            with _lock:
+                if nome not in self._sites:
+                    self._sites[nome] = self._compute_sites(protease)
+                sites = self._sites[nome]
+        return sites
+
+    def _compute_sites(self, protease):
+        tabela = np.zeros(256, dtype=bool)
+        residuos = protease.residues if protease is not None else 'RK'
+        for residuo in residuos:
+            tabela[ord(residuo)] = True
+            if protease is not None:
+                tabela[ord(residuo.lower())] = True
+        marcados = tabela[self.residues]
+        if protease is not None and protease.proline_rule and len(marcados):
+            prolina = (self.residues == ord('P')) | (self.residues == ord('p'))
+            marcados[:-1] &= ~prolina[1:]
+            # O último resíduo de cada proteína não tem vizinho: a regra da prolina não se aplica
+            ultimos = (self.offsets + self.lengths - 1)[self.lengths > 0]
+            marcados[ultimos] = tabela[self.residues[ultimos]]
+        sites = np.flatnonzero(marcados)
+        return sites.astype(np.uint32) if len(self.residues) < 2 ** 32 else sites
+
+    def digest(self, idnp, protease=None):
+        """ProteinDigest da proteína com os sítios tirados do vetor pré-calculado."""
+        linha = self._rows[idnp]
+        inicio = int(self.offsets[linha])
+        fim = inicio + int(self.lengths[linha])
+        sites = self.sites(protease)
+        # Chaves no mesmo dtype dos sítios: senão o NumPy converte o vetor inteiro a cada busca
+        a, b = np.searchsorted(sites, np.array((inicio, fim), dtype=sites.dtype))
+        a2, b2 = np.searchsorted(self._lower, (inicio, fim))
+        return ProteinDigest(self.store[idnp], protease,
+                             sites=(sites[a:b].astype(np.int64) - inicio).tolist(), has_lower=bool(b2 > a2))
+
+
+def encoded_proteome(referencia):
+    """
+    Versão vetorizada do proteoma, criada uma vez por store. Retorna None quando não
+    se aplica (NumPy ausente, MISSENSE_NUMPY_SITES desligado, backend faidx ou
+    sequências fora do ASCII, em que offsets em bytes e posições na string divergem).
+    """
+    if np is None or not settings.MISSENSE_NUMPY_SITES or not isinstance(referencia, ReferenceStore):
+        return None
+    with _lock:
+        if referencia._encoded is None:
+            codificado = EncodedProteome(referencia)
+            referencia._encoded = codificado if not (codificado.residues >= 128).any() else False
+        return referencia._encoded or None
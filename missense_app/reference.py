@@ -0,0 +1,364 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from .compression import open_file, detect_compression
+
+# Extensão do arquivo compilado gravado ao lado do FASTA de referência
+STORE_SUFFIX = '.store'
+# Índice de offsets no estilo samtools faidx
+INDEX_SUFFIX = '.fai'
+
+# Backends disponíveis para o proteoma de referência
+BACKEND_STORE = 'store'
+BACKEND_FAIDX = 'faidx'
+
+_MAGIC = b'PIBICREF1\n'
+_HEADER_LEN = struct.Struct('<Q')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def accession_from_header(lin):
+    """Extrai o NP (sem versão) de um cabeçalho '>gi|...|ref|NP_xxx.y|'. Retorna None se não houver."""
+    head = lin.split("|")
+    if len(head) > 3:
+        return head[3].split('.')[0]
+    return None
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_reference_fasta(path):
+    """
+    Lê o FASTA de referência e retorna {NP: sequência}.
+
+    Mantém as mesmas regras do parser original de process_mutations: cabeçalhos com
+    menos de 4 campos não abrem um novo registro (as linhas seguintes continuam no
+    NP anterior) e um NP repetido substitui a sequência anterior.
+    """
+    partes = {}
+    idnp = None
+    with open_file(path, 'r') as PROTEINAS:
+        for lin in PROTEINAS:
+            lin = lin.strip().replace('\r', '')
+            if lin.startswith(">"):
+                novo_id = accession_from_header(lin)
+                if novo_id is not None:
+                    idnp = novo_id
+                    partes[idnp] = []
+            elif idnp is not None:
+                partes[idnp].append(lin)
+    return {idnp: ''.join(linhas) for idnp, linhas in partes.items()}
+
+
+class ReferenceStore:
+    """
+    Proteoma de referência compilado em um único arquivo mapeado em memória.
+
+    O arquivo contém um cabeçalho JSON (origem do FASTA e índice NP -> (offset, tamanho))
+    seguido das sequências concatenadas. Como o mapeamento é somente leitura, todos os
+    processos que abrem o mesmo arquivo compartilham as páginas do cache do sistema.
+    """
+
+    def __init__(self, store_path):
+        self.path = store_path
+        with open(store_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"Arquivo de referência compilado inválido: {store_path}")
+        inicio = len(_MAGIC)
+        (header_len,) = _HEADER_LEN.unpack_from(self._mm, inicio)
+        inicio += _HEADER_LEN.size
+        header = json.loads(self._mm[inicio:inicio + header_len].decode('utf-8'))
+        self.source = header['source']
+        self.index = header['index']
+        self._data_offset = inicio + header_len
+        # Vetor NumPy sobre o mmap e sítios pré-calculados (proteome.encoded_proteome)
+        self._encoded = None
+
+    @property
+    def version(self):
+        """Identifica o conteúdo do FASTA de origem (sha256)."""
+        return self.source['sha256']
+
+    def __contains__(self, idnp):
+        return idnp in self.index
+
+    def __getitem__(self, idnp):
+        offset, tamanho = self.index[idnp]
+        inicio = self._data_offset + offset
+        return self._mm[inicio:inicio + tamanho].decode('utf-8')
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, idnp, default=None):
+        if idnp not in self.index:
+            return default
+        return self[idnp]
+
+    def close(self):
+        self._encoded = None  # Libera a visão NumPy antes de fechar o mmap
+        self._mm.close()
+
+    def is_current(self, fasta_path):
+        """Confere se o FASTA ainda corresponde ao que foi compilado (mtime/tamanho e, se mudaram, sha256)."""
+        st = os.stat(fasta_path)
+        if st.st_mtime_ns == self.source['mtime_ns'] and st.st_size == self.source['size']:
+            return True
+        if st.st_size != self.source['size']:
+            return False
+        return file_sha256(fasta_path) == self.source['sha256']
+
+
+class FastaIndex:
+    """
+    Acesso aleatório ao FASTA de referência por um índice de offsets no estilo samtools faidx.
+
+    Cada linha do arquivo <fasta>.fai tem as colunas NOME, TAMANHO, OFFSET, LINEBASES,
+    LINEWIDTH e SPAN (bytes ocupados pelo registro no FASTA). Só os registros pedidos
+    são lidos do disco, com os.pread, então o consumo de memória acompanha a entrada
+    e não o proteoma inteiro.
+    """
+
+    def __init__(self, fasta_path, index_path=None):
+        self.fasta_path = os.fspath(fasta_path)
+        self.path = index_path or index_path_for(fasta_path)
+        self.index = {}
+        with open(self.path, 'r') as f:
+            for lin in f:
+                campos = lin.rstrip('\n').split('\t')
+                if len(campos) < 6:
+                    continue
+                self.index[campos[0]] = (int(campos[1]), int(campos[2]), int(campos[5]))
+        self._fd = os.open(self.fasta_path, os.O_RDONLY)
+        st = os.fstat(self._fd)
+        self.source = {'path': os.path.abspath(self.fasta_path), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+    @property
+    def version(self):
+        if 'sha256' not in self.source:
+            self.source['sha256'] = file_sha256(self.fasta_path)
+        return self.source['sha256']
+
+    def __contains__(self, idnp):
+        return idnp in self.index
+
+    def __getitem__(self, idnp):
+        _, offset, span = self.index[idnp]
+        bruto = os.pread(self._fd, span, offset).decode('utf-8')
+        # Mesma normalização do parser: strip por linha e cabeçalhos curtos ignorados
+        linhas = (lin.strip().replace('\r', '') for lin in bruto.split('\n'))
+        return ''.join(lin for lin in linhas if not lin.startswith('>'))
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, idnp, default=None):
+        if idnp not in self.index:
+            return default
+        return self[idnp]
+
+    def close(self):
+        os.close(self._fd)
+
+    def is_current(self, fasta_path=None):
+        st = os.stat(fasta_path or self.fasta_path)
+        return st.st_mtime_ns == self.source['mtime_ns'] and st.st_size == self.source['size']
+
+
+def index_path_for(fasta_path):
+    return os.fspath(fasta_path) + INDEX_SUFFIX
+
+
+def build_fasta_index(fasta_path, index_path=None):
+    """
+    Varre o FASTA uma vez (sem carregar sequências) e grava o índice <fasta>.fai.
+
+    Registros com linhas de tamanho irregular ou com cabeçalhos curtos no meio ficam
+    com LINEBASES/LINEWIDTH = 0; o SPAN continua valendo para a leitura.
+    """
+    index_path = index_path or index_path_for(fasta_path)
+    registros = {}
+    atual = None
+    pos = 0
+
+    def fechar(fim):
+        if atual is not None:
+            atual['span'] = fim - atual['offset']
+            registros[atual['name']] = atual
+
+    with open(fasta_path, 'rb') as f:
+        for bruto in f:
+            inicio = pos
+            pos += len(bruto)
+            lin = bruto.decode('utf-8').strip().replace('\r', '')
+            if lin.startswith('>'):
+                idnp = accession_from_header(lin)
+                if idnp is not None:
+                    fechar(inicio)
+                    atual = {'name': idnp, 'length': 0, 'offset': pos, 'linebases': None,
+                             'linewidth': None, 'regular': True, 'last_short': False}
+                elif atual is not None:
+                    atual['regular'] = False
+                continue
+            if atual is None:
+                continue
+            if atual['linebases'] is None:
+                atual['linebases'] = len(lin)
+                atual['linewidth'] = len(bruto)
+            elif atual['last_short'] or len(lin) > atual['linebases'] or \
+                    (len(lin) == atual['linebases'] and len(bruto) != atual['linewidth']):
+                atual['regular'] = False
+            atual['last_short'] = len(lin) < atual['linebases']
+            atual['length'] += len(lin)
+        fechar(pos)
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            for reg in registros.values():
+                regular = reg['regular'] and reg['linebases'] is not None
+                linebases = reg['linebases'] if regular else 0
+                linewidth = reg['linewidth'] if regular else 0
+                f.write(f"{reg['name']}\t{reg['length']}\t{reg['offset']}\t{linebases}\t{linewidth}\t{reg['span']}\n")
+        os.replace(tmp_path, index_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index_path
+
+
+def open_fasta_index(fasta_path, index_path=None):
+    """Abre o índice faidx, reconstruindo-o se não existir ou for mais antigo que o FASTA."""
+    index_path = index_path or index_path_for(fasta_path)
+    if not os.path.exists(fasta_path):
+        raise FileNotFoundError(f"Arquivo de referência não encontrado: {fasta_path}")
+    if detect_compression(fasta_path):
+        # Offsets do .fai só valem no arquivo descomprimido; o store lê o FASTA comprimido
+        raise ValueError(f"O backend '{BACKEND_FAIDX}' exige um FASTA sem compressão: {fasta_path}")
+    if not os.path.exists(index_path) or os.stat(index_path).st_mtime_ns < os.stat(fasta_path).st_mtime_ns:
+        build_fasta_index(fasta_path, index_path)
+    return FastaIndex(fasta_path, index_path)
+
+
+def store_path_for(fasta_path):
+    return os.fspath(fasta_path) + STORE_SUFFIX
+
+
+def _write_store(store_path, source, sequences):
+    """Grava o arquivo compilado de forma atômica (arquivo temporário + os.replace)."""
+    index = {}
+    blobs = []
+    offset = 0
+    for idnp, seq in sequences:
+        dados = seq.encode('utf-8') if isinstance(seq, str) else seq
+        index[idnp] = (offset, len(dados))
+        blobs.append(dados)
+        offset += len(dados)
+
+    header = json.dumps({'source': source, 'index': index}, separators=(',', ':')).encode('utf-8')
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for dados in blobs:
+                f.write(dados)
+        os.replace(tmp_path, store_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _source_info(fasta_path):
+    st = os.stat(fasta_path)
+    return {
+        'path': os.path.abspath(fasta_path),
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+        'sha256': file_sha256(fasta_path),
+    }
+
+
+def build_reference_store(fasta_path, store_path=None):
+    """Compila o FASTA de referência para o formato mapeado em memória e retorna o caminho gravado."""
+    store_path = store_path or store_path_for(fasta_path)
+    source = _source_info(fasta_path)
+    sequences = parse_reference_fasta(fasta_path)
+    _write_store(store_path, source, sequences.items())
+    return store_path
+
+
+def _refresh_store_source(store, store_path, fasta_path):
+    """O FASTA foi tocado mas o conteúdo é o mesmo: regrava só os metadados, sem reprocessar."""
+    source = _source_info(fasta_path)
+    _write_store(store_path, source, ((idnp, store._mm[store._data_offset + off:store._data_offset + off + n])
+                                      for idnp, (off, n) in store.index.items()))
+
+
+def open_reference_store(fasta_path, store_path=None):
+    """Abre o arquivo compilado, reconstruindo-o quando ausente, inválido ou desatualizado."""
+    store_path = store_path or store_path_for(fasta_path)
+    if not os.path.exists(fasta_path):
+        raise FileNotFoundError(f"Arquivo de referência não encontrado: {fasta_path}")
+
+    if os.path.exists(store_path):
+        try:
+            store = ReferenceStore(store_path)
+        except (ValueError, KeyError, OSError, struct.error):
+            store = None
+        if store is not None:
+            st = os.stat(fasta_path)
+            if st.st_mtime_ns == store.source['mtime_ns'] and st.st_size == store.source['size']:
+                return store
+            if store.is_current(fasta_path):
+                _refresh_store_source(store, store_path, fasta_path)
+                store.close()
+                return ReferenceStore(store_path)
+            store.close()
+
+    build_reference_store(fasta_path, store_path)
+    return ReferenceStore(store_path)
+
+
+def load_reference(fasta_path, backend=BACKEND_STORE):
+    """
+    Retorna o proteoma de referência compartilhado deste processo.
+
+    backend='store' usa o arquivo compilado mapeado em memória; backend='faidx' lê
+    diretamente do FASTA apenas as proteínas pedidas, via índice .fai. A primeira
+    chamada abre (ou constrói) o arquivo; as seguintes só conferem o mtime do FASTA.
+    """
+    if backend not in (BACKEND_STORE, BACKEND_FAIDX):
+        raise ValueError(f"Backend de referência desconhecido: {backend}")
+    key = (os.path.abspath(fasta_path), backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            try:
+                st = os.stat(key[0])
+            except FileNotFoundError:
+                del _stores[key]
+                raise
+            if st.st_mtime_ns == store.source['mtime_ns'] and st.st_size == store.source['size']:
+                return store
+            del _stores[key]
+        if backend == BACKEND_FAIDX:
+            store = open_fasta_index(key[0])
+        else:
+            store = open_reference_store(key[0])
+        _stores[key] = store
+        return store
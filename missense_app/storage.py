@@ -0,0 +1,138 @@
+import os
+import shutil
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.utils import timezone
+from .models import MissenseJob
+
+# Intervalo mínimo entre gravações do último acesso de um mesmo job (downloads com Range
+# fazem várias requisições seguidas)
+TOUCH_INTERVAL = timedelta(minutes=1)
+# Jobs acessados há menos que isso ficam em disco mesmo acima da cota, para que um
+# resultado recém-concluído ainda possa ser baixado
+GRACE_PERIOD = timedelta(minutes=10)
+
+_ultima_varredura = 0.0
+
+
+def temp_root():
+    return os.path.join(settings.MEDIA_ROOT, 'temp')
+
+
+def directory_size(pasta):
+    """
+    Soma dos tamanhos dos arquivos de um diretório de job (percorre só esse
+    diretório). Hardlinks para o mesmo arquivo (st_dev, st_ino) contam uma vez.
+    """
+    total = 0
+    vistos = set()
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in arquivos:
+            try:
+                st = os.lstat(os.path.join(raiz, nome))
+            except FileNotFoundError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in vistos:
+                    continue
+                vistos.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def record_usage(job):
+    """Atualiza no job (sem salvar) o tamanho do diretório e o último acesso; chamado na conclusão."""
+    job.size_bytes = directory_size(job.temp_dir)
+    job.last_access = timezone.now()
+
+
+def touch(job):
+    """Registra um acesso (página de resultados ou download) ao diretório do job."""
+    agora = timezone.now()
+    if job.last_access is None or agora - job.last_access >= TOUCH_INTERVAL:
+        job.last_access = agora
+        MissenseJob.objects.filter(pk=job.pk).update(last_access=agora)
+
+
+def usage():
+    """Espaço ocupado pelos jobs concluídos ainda em disco, segundo o índice."""
+    return MissenseJob.objects.filter(evicted_at__isnull=True).aggregate(total=Sum('size_bytes'))['total'] or 0
+
+
+def _evict(job, agora):
+    shutil.rmtree(job.temp_dir, ignore_errors=True)
+    MissenseJob.objects.filter(pk=job.pk).update(evicted_at=agora, size_bytes=0)
+
+
+def sweep(quota=None, max_age=None):
+    """
+    Aplica a cota de media/temp consultando só o índice (sem percorrer o disco):
+    remove os diretórios de jobs concluídos com último acesso mais antigo que
+    max_age e, enquanto o total passar de quota bytes, os acessados há mais tempo.
+    Jobs na fila ou em execução, ou acessados dentro de GRACE_PERIOD, não são removidos
+    pela cota. Retorna (removidos, bytes liberados).
+    """
+    quota = settings.MISSENSE_TEMP_QUOTA_BYTES if quota is None else quota
+    if max_age is None and settings.MISSENSE_TEMP_MAX_AGE_DAYS:
+        max_age = timedelta(days=settings.MISSENSE_TEMP_MAX_AGE_DAYS)
+    agora = timezone.now()
+    candidatos = MissenseJob.objects.filter(
+        status__in=(MissenseJob.STATUS_DONE, MissenseJob.STATUS_FAILED), evicted_at__isnull=True,
+        last_access__isnull=False).only('id', 'size_bytes', 'last_access').order_by('last_access')
+    removidos = liberados = 0
+    if max_age:
+        for job in candidatos.filter(last_access__lt=agora - max_age).iterator():
+            _evict(job, agora)
+            removidos += 1
+            liberados += job.size_bytes
+    if quota:
+        excesso = usage() - quota
+        for job in candidatos.filter(last_access__lt=agora - GRACE_PERIOD).iterator():
+            if excesso <= 0:
+                break
+            _evict(job, agora)
+            excesso -= job.size_bytes
+            removidos += 1
+            liberados += job.size_bytes
+    return removidos, liberados
+
+
+def maybe_sweep(force=False):
+    """
+    Varredura periódica (a cada MISSENSE_TEMP_SWEEP_INTERVAL s) chamada pelo worker;
+    force=True (depois de cada job) varre já, para o job recém-concluído entrar na cota.
+    """
+    global _ultima_varredura
+    agora = time.monotonic()
+    if not force and agora - _ultima_varredura < settings.MISSENSE_TEMP_SWEEP_INTERVAL:
+        return None
+    _ultima_varredura = agora
+    return sweep()
+
+
+def remove_orphans(max_age):
+    """
+    Remove diretórios de media/temp sem job no índice (processamentos antigos ou
+    interrompidos) modificados há mais de max_age. Lista só o primeiro nível de
+    media/temp; não é chamado pela varredura periódica.
+    """
+    raiz = temp_root()
+    if not os.path.isdir(raiz):
+        return 0
+    limite = time.time() - max_age.total_seconds()
+    removidos = 0
+    with os.scandir(raiz) as itens:
+        for item in itens:
+            if not item.is_dir() or item.stat().st_mtime >= limite:
+                continue
+            try:
+                conhecido = MissenseJob.objects.filter(pk=item.name, evicted_at__isnull=True).exists()
+            except ValidationError:
+                conhecido = False  # Nome que não é um UUID
+            if not conhecido:
+                shutil.rmtree(item.path, ignore_errors=True)
+                removidos += 1
+    return removidos
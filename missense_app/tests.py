@@ -1,3 +1,661 @@
-from django.test import TestCase
+import gzip
+import os
+import random
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from itertools import product
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import cache, compression, storage
+from .batch import CHECKPOINT_FILE, Checkpoint, batch_input_name, run_batch_pipeline
+from .cache import output_options
+from .downloads import file_download_response
+from .jobs import claim_next_job, load_results, reclaim_stale_jobs, run_job, submit_job
+from .models import MissenseJob
+from . import peptide_processor
+from .peptide_processor import process_mutations
+from .proteases import LEGACY_RULES
 
-# Create your tests here.
+OUTPUTS = ('dbsaida.txt', 'dbpepmutref.txt', 'dbfinal.txt')
+
+
+def legacy_process_mutations(proteinas, mutacao, dbsaida, dbpepmutref, dbfinal):
+    """
+    process_mutations da versão original (uma variante por vez, redigestão da proteína
+    inteira por regex), mantido aqui como referência dos testes de equivalência.
+    """
+    amino = {
+        "Ala": "a", "Arg": "r", "Asn": "n", "Asp": "d", "Cys": "c", "Gln": "q", "Glu": "e", "Gly": "g", "His": "h",
+        "Ile": "i", "Leu": "l", "Lys": "k", "Met": "m", "Phe": "f", "Pro": "p", "Ser": "s", "Thr": "t", "Trp": "w",
+        "Tyr": "y", "Val": "v", "Ter": "z",
+        "A": "a", "R": "r", "N": "n", "D": "d", "C": "c", "Q": "q", "E": "e", "G": "g", "H": "h",
+        "I": "i", "L": "l", "K": "k", "M": "m", "F": "f", "P": "p", "S": "s", "T": "t", "W": "w",
+        "Y": "y", "V": "v", "Z": "z"
+    }
+
+    idnp = None
+    hash_proteinas = {}
+    concat_peptideo = ""
+    prev_id = None
+
+    with open(proteinas, 'r') as PROTEINAS, \
+         open(mutacao, 'r') as DBSNP, \
+         open(dbsaida, 'w') as DBSAIDA, \
+         open(dbpepmutref, 'w') as DBRELACAO, \
+         open(dbfinal, 'w') as DBFINAL:
+
+        for lin in PROTEINAS:
+            lin = lin.strip().replace('\r', '')
+            if lin.startswith(">"):
+                head = lin.split("|")
+                if len(head) > 3:
+                    idnp = head[3].split('.')[0]
+                    hash_proteinas[idnp] = ""
+            else:
+                if idnp is not None:
+                    hash_proteinas[idnp] += lin
+
+        for lin in DBSNP:
+            lin = lin.strip().replace('\r', '')
+            if '\t' in lin:
+                linhas = lin.split('\t')
+            else:
+                linhas = lin.split()
+            if len(linhas) < 5:
+                continue
+
+            id_ = linhas[0].split('.')[0]
+            snp = linhas[1]
+            ref = linhas[2]
+            try:
+                pos = int(linhas[3])
+            except ValueError:
+                continue
+            alt = linhas[4]
+            mutacao = f"p.{ref}{pos}{alt}"
+
+            if id_ in hash_proteinas:
+                aminoacidos = hash_proteinas[id_]
+                if pos <= 0 or pos > len(aminoacidos):
+                    continue
+                if ref not in amino and ref not in amino.values():
+                    continue
+                if alt not in amino and alt not in amino.values():
+                    continue
+                ref_one_letter = amino.get(ref, ref.lower())
+                alt_one_letter = amino.get(alt, alt.lower())
+                aminoacidos = aminoacidos[:pos - 1] + alt_one_letter + aminoacidos[pos:]
+
+                pattern = re.compile(r'([^RK]+(R|K|$))')
+                for match in pattern.finditer(aminoacidos):
+                    pepmutado = match.group(1)
+                    tam_pep = len(pepmutado)
+                    if 7 <= tam_pep <= 35 and re.search(r'[a-z]', pepmutado):
+                        aminoref = ref_one_letter
+                        aminomut = alt_one_letter
+                        pepref = pepmutado.replace(aminomut, aminoref)
+
+                        sitiopos = aminoacidos.find(pepmutado)
+
+                        if sitiopos == 0:
+                            pepmutado = pepmutado + pepmutado[1:]
+
+                        if re.search(r'[r|k]', pepmutado):
+                            peptriptico = ""
+                            pattern = re.compile(r'([^RK]+(R|K|$))', re.IGNORECASE)
+                            for match in pattern.finditer(pepmutado):
+                                pep = match.group(1)
+                                if len(pep) >= 7:
+                                    peptriptico += pep
+                            pepmutado = peptriptico
+
+                        if 'z' in pepmutado:
+                            stop = 'z'
+                            pos_stop = pepmutado.index(stop)
+                            pepstop = pepmutado[:pos_stop]
+                            if len(pepstop) >= 7:
+                                pepmutado = pepstop
+
+                        if pepmutado:
+                            DBSAIDA.write(f">{id_}\n{pepmutado}\n")
+
+                            if prev_id and prev_id != id_:
+                                DBFINAL.write(f">{prev_id}\n{concat_peptideo}\n")
+                                concat_peptideo = ""
+
+                            prev_id = id_
+                            concat_peptideo += pepmutado
+
+                            pattern = re.compile(r'([^RK]+(R|K|$))', re.IGNORECASE)
+                            for match in pattern.finditer(pepmutado):
+                                pepmut = match.group(1)
+                                sitiopos = aminoacidos.find(pepmut)
+                                DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
+
+                            if sitiopos == 0 and alt == "Ter":
+                                sitiopos = 1
+                                pepmutado = pepmutado[1:]
+                                DBRELACAO.write(f">{id_}\t{snp}\t{sitiopos}\t{mutacao}\t{pepref}\t{pepmut}\n")
+
+        if prev_id:
+            DBFINAL.write(f">{prev_id}\n{concat_peptideo}\n")
+
+
+def legacy_fields(lin):
+    """Campos de uma linha de variante como a versão original os lia (None se ela a ignorava)."""
+    lin = lin.strip().replace('\r', '')
+    campos = lin.split('\t') if '\t' in lin else lin.split()
+    if len(campos) < 5:
+        return None
+    try:
+        int(campos[3])
+    except ValueError:
+        return None
+    return campos
+
+
+def group_by_protein(linhas):
+    """
+    Linhas agrupadas por NP (sem versão), na ordem da primeira linha bem formada de
+    cada proteína: a entrada em que a versão original e o agrupamento por proteína
+    geram as mesmas saídas.
+    """
+    grupos = {}
+    for lin in linhas:
+        campos = legacy_fields(lin)
+        if campos is not None:
+            grupos.setdefault(campos[0].split('.')[0], []).append(lin)
+    return [lin for grupo in grupos.values() for lin in grupo]
+
+
+def write_fixtures(pasta, seed=7, n_proteinas=40, n_variantes=1500):
+    """
+    FASTA (cabeçalhos gi|...|ref|NP_...|, linhas de larguras diferentes, CRLF em
+    algumas proteínas, acesso repetido) e variantes fora de ordem com os casos da
+    entrada real: códigos de uma e de três letras, stop, aminoácidos desconhecidos,
+    posições fora da proteína, acessos com versão, NP ausente e linhas inválidas.
+    Retorna (fasta, linhas das variantes).
+    """
+    rnd = random.Random(seed)
+    aa = "ACDEFGHIKLMNPQRSTVWY"
+    tres = {"A": "Ala", "R": "Arg", "N": "Asn", "D": "Asp", "C": "Cys", "Q": "Gln", "E": "Glu", "G": "Gly",
+            "H": "His", "I": "Ile", "L": "Leu", "K": "Lys", "M": "Met", "F": "Phe", "P": "Pro", "S": "Ser",
+            "T": "Thr", "W": "Trp", "Y": "Tyr", "V": "Val"}
+    proteinas = {}
+    fasta = os.path.join(pasta, 'ref.fasta')
+    with open(fasta, 'w', newline='') as f:
+        for i in range(n_proteinas):
+            acesso = f"NP_{i:06d}"
+            seq = ''.join(rnd.choice(aa) for _ in range(rnd.choice([6, 25, 80, 300, 900])))
+            if i % 7 == 0:
+                seq = "KK" + seq[2:]
+            if i % 11 == 0:
+                seq = seq[:4] + "KKRR" + seq[8:]
+            proteinas[acesso] = seq
+            largura = 60 if i % 3 else 70
+            fim = "\r\n" if i % 13 == 0 else "\n"
+            f.write(f">gi|{1000 + i}|ref|{acesso}.1| protein {i}{fim}")
+            for j in range(0, len(seq), largura):
+                f.write(seq[j:j + largura] + fim)
+            if i % 17 == 0:
+                f.write(">short|header\nACDEKFGH\n")
+        # Acesso repetido: vale a última sequência
+        f.write(">gi|9|ref|NP_000005.2| dup\nMKTAYIAKQRQISFVKSHFSRQ\n")
+        proteinas["NP_000005"] = "MKTAYIAKQRQISFVKSHFSRQ"
+
+    acessos = list(proteinas) + ["NP_999999"]
+    linhas = []
+    for k in range(n_variantes):
+        acesso = rnd.choice(acessos)
+        seq = proteinas.get(acesso, "A")
+        pos = rnd.randint(-1, len(seq) + 1)
+        ref = seq[pos - 1] if 1 <= pos <= len(seq) else "A"
+        if rnd.random() < .5:
+            ref = tres.get(ref, ref)
+        alt = rnd.choice(list(aa) + ["Ter", "Z", "Lys", "Arg", "K", "R", "Xyz", "a", "k"])
+        if rnd.random() < .5 and alt in tres:
+            alt = tres[alt]
+        sep = "\t" if rnd.random() < .5 else "  "
+        versao = ".2" if rnd.random() < .5 else ""
+        sorteio = rnd.random()
+        if sorteio < .01:
+            linhas.append("garbage line\n")
+        elif sorteio < .02:
+            linhas.append(f"{acesso}\trs1\tA\tx\tB\n")
+        elif sorteio < .03:
+            linhas.append("\n")
+        else:
+            linhas.append(sep.join([acesso + versao, f"rs{k}", ref, str(pos), alt]) + "\n")
+    return fasta, linhas
+
+
+def read_outputs(pasta):
+    conteudo = []
+    for nome in OUTPUTS:
+        with open(os.path.join(pasta, nome), 'rb') as f:
+            conteudo.append(f.read())
+    return conteudo
+
+
+class PipelineTestCase(SimpleTestCase):
+    """Diretório temporário por classe e execução de process_mutations com opções."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def write_input(self, nome, linhas, compress=False):
+        caminho = os.path.join(self.tmp, nome)
+        with (gzip.open(caminho, 'wt') if compress else open(caminho, 'w')) as f:
+            f.writelines(linhas)
+        return caminho
+
+    def run_legacy(self, fasta, entrada, nome):
+        pasta = os.path.join(self.tmp, nome)
+        os.makedirs(pasta)
+        legacy_process_mutations(fasta, entrada, *(os.path.join(pasta, saida) for saida in OUTPUTS))
+        return read_outputs(pasta)
+
+    def run_pipeline(self, fasta, entrada, nome, spill=False, parser='columnar', **kwargs):
+        pasta = os.path.join(self.tmp, nome)
+        os.makedirs(pasta)
+        # Limite 0: qualquer entrada vai para partições em disco (pequenas, para haver várias)
+        with override_settings(MISSENSE_SPILL_THRESHOLD=0 if spill else 2 ** 62, MISSENSE_PARTITION_VARIANTS=150,
+                               MISSENSE_VARIANT_PARSER=parser):
+            process_mutations(fasta, entrada, *(os.path.join(pasta, saida) for saida in OUTPUTS),
+                              deduplicate=False, **kwargs)
+        return read_outputs(pasta)
+
+
+class LegacyEquivalenceTests(PipelineTestCase):
+    """
+    As saídas de process_mutations são idênticas, byte a byte, às da versão original
+    executada sobre a entrada agrupada por proteína, em todos os modos do pipeline.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fasta, cls.linhas = write_fixtures(cls.tmp)
+
+    def test_outputs_match_legacy(self):
+        agrupadas = group_by_protein(self.linhas)
+        # A entrada de teste precisa ter proteínas fora de ordem para valer
+        self.assertNotEqual(agrupadas, [lin for lin in self.linhas if legacy_fields(lin)])
+        entradas = {
+            'sorted': self.write_input('sorted.txt', agrupadas),
+            'unsorted': self.write_input('unsorted.txt', self.linhas),
+            'gz': self.write_input('unsorted.txt.gz', self.linhas, compress=True),
+        }
+        esperado = self.run_legacy(self.fasta, entradas['sorted'], 'legacy')
+        self.assertTrue(all(esperado), 'a fixture deve gerar as três saídas')
+
+        for (entrada, caminho), backend, workers, spill, parser in product(
+                entradas.items(), ('store', 'faidx'), (1, 3), (False, True), ('columnar', 'legacy')):
+            with self.subTest(entrada=entrada, backend=backend, workers=workers, spill=spill, parser=parser):
+                nome = f'{entrada}-{backend}-{workers}-{spill}-{parser}'
+                saidas = self.run_pipeline(self.fasta, caminho, nome, spill=spill, parser=parser,
+                                           backend=backend, workers=workers)
+                for saida, obtido, referencia in zip(OUTPUTS, saidas, esperado):
+                    self.assertEqual(obtido, referencia, saida)
+
+    def test_stats_do_not_depend_on_parser(self):
+        entrada = self.write_input('stats.txt', self.linhas)
+        obtidos = {}
+        for spill, parser, workers in product((False, True), ('columnar', 'legacy'), (1, 3)):
+            pasta = os.path.join(self.tmp, f'stats-{spill}-{parser}-{workers}')
+            os.makedirs(pasta)
+            with override_settings(MISSENSE_SPILL_THRESHOLD=0 if spill else 2 ** 62, MISSENSE_PARTITION_VARIANTS=150,
+                                   MISSENSE_VARIANT_PARSER=parser):
+                stats = process_mutations(self.fasta, entrada, *(os.path.join(pasta, saida) for saida in OUTPUTS),
+                                          deduplicate=False, workers=workers)['stats']
+            obtidos[spill, parser, workers] = (stats['counters'], stats['skipped'])
+        esperado = obtidos[False, 'columnar', 1]
+        # A fixture precisa ter variantes descartadas por cada verificação
+        for motivo in ('unknown_protein', 'position_out_of_range', 'unknown_amino_acid'):
+            self.assertGreater(esperado[1].get(motivo, 0), 0, motivo)
+        for chave, valor in obtidos.items():
+            with self.subTest(spill=chave[0], parser=chave[1], workers=chave[2]):
+                self.assertEqual(valor, esperado)
+
+    def test_per_protein_sites_match_legacy(self):
+        entrada = self.write_input('sites.txt', self.linhas)
+        esperado = self.run_legacy(self.fasta, self.write_input('sites-sorted.txt', group_by_protein(self.linhas)),
+                                   'sites-legacy')
+        with override_settings(MISSENSE_NUMPY_SITES=False):
+            self.assertEqual(self.run_pipeline(self.fasta, entrada, 'sites'), esperado)
+
+    def test_compressed_outputs_match_legacy(self):
+        entrada = self.write_input('gzout.txt', self.linhas)
+        esperado = self.run_legacy(self.fasta, self.write_input('gzout-sorted.txt', group_by_protein(self.linhas)),
+                                   'gzout-legacy')
+        pasta = os.path.join(self.tmp, 'gzout')
+        os.makedirs(pasta)
+        with override_settings(MISSENSE_SPILL_THRESHOLD=2 ** 62):
+            process_mutations(self.fasta, entrada, *(os.path.join(pasta, saida + '.gz') for saida in OUTPUTS),
+                              compression='gzip', deduplicate=False)
+        for saida, referencia in zip(OUTPUTS, esperado):
+            with gzip.open(os.path.join(pasta, saida + '.gz'), 'rb') as f:
+                self.assertEqual(f.read(), referencia, saida)
+
+
+class DeduplicationTests(PipelineTestCase):
+    """A deduplicação grava cada peptídeo uma vez e as suas origens, mesmo com vários arquivos de origens."""
+
+    def test_counts_cover_every_emission(self):
+        fasta, linhas = write_fixtures(self.tmp, seed=3, n_variantes=4000)
+        entrada = self.write_input('dedup.txt', linhas)
+        saidas = self.run_pipeline(fasta, entrada, 'dedup-off')
+        registros = saidas[0].decode().split('\n')[:-1]
+        emitidos = list(zip(registros[::2], registros[1::2]))
+        esperado = {}
+        for cabecalho, peptideo in emitidos:
+            esperado.setdefault(peptideo, (cabecalho, []))[1].append(cabecalho[1:])
+
+        pasta = os.path.join(self.tmp, 'dedup-on')
+        os.makedirs(pasta)
+        with override_settings(MISSENSE_SPILL_THRESHOLD=2 ** 62), \
+                mock.patch.object(peptide_processor, 'ORIGINS_PER_BUCKET', 50):
+            process_mutations(fasta, entrada, *(os.path.join(pasta, saida) for saida in OUTPUTS), deduplicate=True)
+        with open(os.path.join(pasta, 'dbsaida.txt')) as f:
+            self.assertEqual(f.read(), ''.join(f"{cabecalho}\n{peptideo}\n"
+                                               for peptideo, (cabecalho, _) in esperado.items()))
+        with open(os.path.join(pasta, 'dbpepcounts.txt')) as f:
+            contagens = [lin.rstrip('\n').split('\t') for lin in f]
+        self.assertGreater(len(esperado), 50)
+        self.assertEqual([peptideo for peptideo, _, _ in contagens], list(esperado))
+        for peptideo, n, origens in contagens:
+            origens = origens.split(',')
+            self.assertEqual(int(n), len(origens))
+            self.assertEqual([origem.split(':')[0] for origem in origens], esperado[peptideo][1])
+        self.assertEqual(sorted(os.listdir(pasta)), sorted(OUTPUTS + ('dbpepcounts.txt',)))
+
+
+class SpillOrderTests(PipelineTestCase):
+    """Com partições em disco a ordem das proteínas é a mesma do caminho em memória."""
+
+    def test_rejected_first_occurrence_keeps_protein_order(self):
+        fasta = os.path.join(self.tmp, 'ab.fasta')
+        with open(fasta, 'w') as f:
+            f.write(">gi|1|ref|NP_A.1| a\nMSTAYIAKQRQISFVKSHFSR\n>gi|2|ref|NP_B.1| b\nMSTAYIAKQRQISFVKSHFSR\n")
+        # A primeira linha de NP_B tem um aminoácido desconhecido: NP_B vem antes de NP_A
+        entrada = self.write_input('ab.txt', ["NP_B\trs0\tXaa\t3\tAla\n", "NP_A\trs1\tT\t3\tA\n",
+                                              "NP_B\trs2\tT\t3\tA\n"])
+        esperado = self.run_pipeline(fasta, entrada, 'ab-memory')
+        self.assertTrue(esperado[2].startswith(b'>NP_B\n'))
+        for spill, parser, workers in product((False, True), ('columnar', 'legacy'), (1, 2)):
+            with self.subTest(spill=spill, parser=parser, workers=workers):
+                self.assertEqual(self.run_pipeline(fasta, entrada, f'ab-{spill}-{parser}-{workers}', spill=spill,
+                                                   parser=parser, workers=workers), esperado)
+
+
+class CheckpointTests(SimpleTestCase):
+    """Um arquivo só conta como concluído com a mesma entrada, o mesmo destino e as mesmas opções."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.entrada = os.path.join(self.tmp, 'a.txt')
+        with open(self.entrada, 'w') as f:
+            f.write("NP_A\trs1\tT\t3\tA\n")
+        self.destino = os.path.join(self.tmp, 'out')
+        os.makedirs(self.destino)
+        self.path = os.path.join(self.tmp, CHECKPOINT_FILE)
+
+    def test_options_must_match(self):
+        opcoes = output_options(None, LEGACY_RULES, False)
+        Checkpoint(self.path, opcoes).mark_done(self.entrada, self.destino, {})
+        self.assertTrue(Checkpoint(self.path, opcoes).is_done(self.entrada, self.destino))
+        for outras in (output_options('gzip', LEGACY_RULES, False), output_options(None, LEGACY_RULES, True),
+                       output_options(None, LEGACY_RULES._replace(missed_cleavages=1), False),
+                       dict(opcoes, reference='outra')):
+            with self.subTest(options=outras):
+                self.assertFalse(Checkpoint(self.path, outras).is_done(self.entrada, self.destino))
+
+    def test_modified_input_is_redone(self):
+        Checkpoint(self.path).mark_done(self.entrada, self.destino, {})
+        with open(self.entrada, 'a') as f:
+            f.write("NP_A\trs2\tT\t4\tA\n")
+        self.assertFalse(Checkpoint(self.path).is_done(self.entrada, self.destino))
+
+
+class JobCacheTests(TestCase):
+    """O cache de resultados é consultado pelo worker, não na submissão."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        fasta, self.linhas = write_fixtures(self.tmp, n_variantes=300)
+        configuracoes = override_settings(MEDIA_ROOT=os.path.join(self.tmp, 'media'), MISSENSE_REFERENCE_FASTA=fasta,
+                                          MISSENSE_PROFILE='')
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+
+    def run_next(self):
+        job = claim_next_job()
+        self.assertIsNotNone(job)
+        return run_job(job)
+
+    def run_next_of(self, job):
+        self.assertEqual(self.run_next().pk, job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_cache_hit_in_worker(self):
+        primeiro = submit_job(''.join(self.linhas))
+        self.assertEqual((primeiro.status, primeiro.cache_key), (MissenseJob.STATUS_QUEUED, ''))
+        primeiro = self.run_next()
+        self.assertEqual(primeiro.status, MissenseJob.STATUS_DONE, primeiro.error)
+        self.assertFalse(primeiro.from_cache)
+
+        # Mesmo conteúdo com outra forma (CRLF, linhas vazias): fica na fila e sai do cache no worker
+        segundo = submit_job('\r\n'.join(lin.rstrip('\n') for lin in self.linhas) + '\r\n\r\n')
+        self.assertEqual(segundo.status, MissenseJob.STATUS_QUEUED)
+        segundo = self.run_next()
+        self.assertEqual(segundo.status, MissenseJob.STATUS_DONE, segundo.error)
+        self.assertTrue(segundo.from_cache)
+        self.assertEqual(segundo.cache_key, primeiro.cache_key)
+        self.assertEqual(load_results(segundo), load_results(primeiro))
+        self.assertEqual(list(segundo.stage_timings), ['cache'])
+
+    def test_evicted_entry_is_recomputed(self):
+        self.assertEqual(self.run_next_of(submit_job(''.join(self.linhas))).status, MissenseJob.STATUS_DONE)
+        # Entrada removida pelo limite do cache entre lookup e restore
+        with mock.patch.object(cache, 'restore', side_effect=FileNotFoundError('evicted')), \
+                self.assertLogs('missense_app.jobs', 'WARNING'):
+            job = self.run_next_of(submit_job(''.join(self.linhas)))
+        self.assertEqual(job.status, MissenseJob.STATUS_DONE, job.error)
+        self.assertFalse(job.from_cache)
+        self.assertIn('digestion', job.stage_timings)
+
+    def test_store_failure_is_logged(self):
+        with mock.patch.object(cache, 'store', side_effect=OSError('disk full')), \
+                self.assertLogs('missense_app.jobs', 'ERROR') as logs:
+            job = self.run_next_of(submit_job(''.join(self.linhas)))
+        self.assertEqual(job.status, MissenseJob.STATUS_DONE, job.error)
+        self.assertIn('disk full', '\n'.join(logs.output))
+
+
+class JobLifecycleTests(TestCase):
+    """Jobs só são vistos pela sessão que os enviou; jobs órfãos voltam para a fila ou falham."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        configuracoes = override_settings(MEDIA_ROOT=self.tmp, MISSENSE_JOB_STALE_SECONDS=60,
+                                          MISSENSE_JOB_MAX_ATTEMPTS=2)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+
+    def test_job_bound_to_session(self):
+        resposta = self.client.post(reverse('missense'), {'input_type': 'text', 'peptide_text': 'NP_A\trs1\tT\t3\tA\n'},
+                                    HTTP_ACCEPT='application/json')
+        self.assertEqual(resposta.status_code, 202)
+        dados = resposta.json()
+        self.assertEqual(self.client.get(dados['status_url']).status_code, 200)
+        self.assertEqual(self.client.get(dados['result_url']).context.get('error'), None)
+
+        outro = self.client_class()
+        self.assertEqual(outro.get(dados['status_url']).status_code, 404)
+        self.assertEqual(outro.get(dados['events_url']).status_code, 404)
+        download = reverse('job_download', kwargs={'job_id': dados['id'], 'file_type': 'dbsaida'})
+        self.assertEqual(outro.get(download).status_code, 404)
+        self.assertEqual(outro.get(dados['result_url']).context['error'], "Processing job not found.")
+
+    def test_reclaim_stale_jobs(self):
+        novo, velho, esgotado = (submit_job('NP_A\trs1\tT\t3\tA\n') for _ in range(3))
+        for job in (novo, velho, esgotado):
+            self.assertIsNotNone(claim_next_job())
+        antigo = timezone.now() - timedelta(minutes=5)
+        MissenseJob.objects.filter(pk__in=[velho.pk, esgotado.pk]).update(heartbeat_at=antigo)
+        MissenseJob.objects.filter(pk=esgotado.pk).update(attempts=2)
+
+        self.assertEqual(reclaim_stale_jobs(), (1, 1))
+        estados = {job.pk: job for job in MissenseJob.objects.all()}
+        self.assertEqual(estados[novo.pk].status, MissenseJob.STATUS_RUNNING)
+        self.assertEqual((estados[velho.pk].status, estados[velho.pk].started_at),
+                         (MissenseJob.STATUS_QUEUED, None))
+        self.assertEqual(estados[esgotado.pk].status, MissenseJob.STATUS_FAILED)
+        self.assertEqual(claim_next_job().pk, velho.pk)
+
+
+class UploadCompressionTests(TestCase):
+    """Uploads .zst só são oferecidos e aceitos com o pacote zstandard instalado."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        configuracoes = override_settings(MEDIA_ROOT=self.tmp)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+        # Simula um ambiente sem zstandard
+        patcher = mock.patch.object(compression, '_zstandard', side_effect=ValueError('zstandard'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, nome):
+        arquivo = SimpleUploadedFile(nome, b'NP_000006.2 rs1208 Arg 268 Ile\n')
+        return self.client.post(reverse('missense'), {'input_type': 'file', 'peptide_file': arquivo},
+                                HTTP_ACCEPT='application/json')
+
+    def test_form_omits_zst(self):
+        resposta = self.client.get(reverse('missense'))
+        self.assertContains(resposta, 'accept=".txt,.fasta,.csv,.tsv,.gz,.bz2"')
+        self.assertNotContains(resposta, '.zst')
+
+    def test_zst_upload_rejected(self):
+        resposta = self.upload('variantes.txt.zst')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('variantes.txt.zst', resposta.json()['error'])
+        self.assertFalse(MissenseJob.objects.exists())
+
+    def test_gz_upload_accepted(self):
+        self.assertEqual(self.upload('variantes.txt.gz').status_code, 202)
+
+
+class BatchMergeTests(PipelineTestCase):
+    """A base unificada do envio em lote é a mesma do processamento das entradas concatenadas."""
+
+    def test_merged_outputs_match_concatenated_input(self):
+        fasta, linhas = write_fixtures(self.tmp, seed=11, n_variantes=3000)
+        # Três arquivos com proteínas em comum
+        partes = [linhas[:1000], linhas[1000:1800], linhas[1800:]]
+        concatenada = self.write_input('concat.txt', linhas)
+        for deduplicate, compressao in ((False, None), (True, None), (True, 'gzip')):
+            with self.subTest(deduplicate=deduplicate, compression=compressao):
+                job = os.path.join(self.tmp, f'job-{deduplicate}-{compressao}')
+                for indice, parte in enumerate(partes):
+                    caminho = os.path.join(job, batch_input_name(indice, f'parte{indice}.txt'))
+                    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                    with open(caminho, 'w') as f:
+                        f.writelines(parte)
+                esperado = os.path.join(self.tmp, f'concat-{deduplicate}-{compressao}')
+                os.makedirs(esperado)
+                nomes = OUTPUTS + (('dbpepcounts.txt',) if deduplicate else ())
+                with override_settings(MISSENSE_REFERENCE_FASTA=fasta, MISSENSE_DEDUPLICATE=deduplicate,
+                                       MISSENSE_OUTPUT_COMPRESSION=compressao, MISSENSE_BATCH_CONCURRENCY=2):
+                    run_batch_pipeline(job)
+                    process_mutations(fasta, concatenada, *(os.path.join(esperado, nome) for nome in OUTPUTS),
+                                      deduplicate=deduplicate)
+                sufixo = '.gz' if compressao else ''
+                for nome in nomes:
+                    with compression.open_file(os.path.join(job, nome + sufixo), 'rb') as f:
+                        obtido = f.read()
+                    with open(os.path.join(esperado, nome), 'rb') as f:
+                        self.assertEqual(obtido, f.read(), nome)
+                with open(os.path.join(esperado, 'dbfinal.txt')) as f:
+                    cabecalhos = [lin for lin in f if lin.startswith('>')]
+                self.assertEqual(len(cabecalhos), len(set(cabecalhos)))
+
+    def test_parallel_emissions_match_serial(self):
+        fasta, linhas = write_fixtures(self.tmp, seed=5, n_variantes=2000)
+        entrada = self.write_input('emissions.txt', linhas)
+        registros = []
+        for workers in (1, 3):
+            pasta = os.path.join(self.tmp, f'emissions-{workers}')
+            os.makedirs(pasta)
+            process_mutations(fasta, entrada, *(os.path.join(pasta, nome) for nome in OUTPUTS), workers=workers,
+                              deduplicate=False, emissions=os.path.join(pasta, 'emissions.log'))
+            with open(os.path.join(pasta, 'emissions.log'), 'rb') as f:
+                registros.append(f.read())
+        self.assertTrue(registros[0])
+        self.assertEqual(registros[0], registros[1])
+
+
+@override_settings(MISSENSE_DOWNLOAD_GZIP=True)
+class DownloadEncodingTests(SimpleTestCase):
+    """A compressão sob demanda segue os tokens e pesos (q) do Accept-Encoding."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, 'dbsaida.txt')
+        with open(self.path, 'w') as f:
+            f.write('>NP_A\nMSaAYIAK\n' * 100)
+
+    def download(self, accept_encoding=None, **headers):
+        if accept_encoding is not None:
+            headers['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return file_download_response(RequestFactory().get('/', **headers), self.path, 'dbsaida.txt')
+
+    def test_accept_encoding_tokens(self):
+        casos = {None: False, '': False, 'gzip': True, 'GZIP': True, 'deflate, gzip;q=0.5': True, 'gzip;q=0': False,
+                 'gzip; q=0.0, identity': False, 'x-gzip': True, '*': True, '*;q=0': False, 'gzip;q=0, *': False,
+                 'identity': False, 'br, notgzip': False}
+        for accept_encoding, gzip_esperado in casos.items():
+            with self.subTest(accept_encoding=accept_encoding):
+                resposta = self.download(accept_encoding)
+                self.assertEqual(resposta.get('Content-Encoding') == 'gzip', gzip_esperado)
+                self.assertIn('Accept-Encoding', resposta['Vary'])
+
+    def test_vary_on_conditional_response(self):
+        etag = self.download('gzip')['ETag']
+        resposta = self.download('gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertIn('Accept-Encoding', resposta['Vary'])
+
+
+class DirectorySizeTests(SimpleTestCase):
+    """Saídas restauradas do cache por hardlink contam uma vez no tamanho do diretório do job."""
+
+    def test_hardlinks_counted_once(self):
+        tmp = tempfile.mkdtemp(prefix='missense-tests-')
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, 'sub'))
+        with open(os.path.join(tmp, 'a.txt'), 'wb') as f:
+            f.write(b'x' * 1000)
+        with open(os.path.join(tmp, 'b.txt'), 'wb') as f:
+            f.write(b'y' * 10)
+        os.link(os.path.join(tmp, 'a.txt'), os.path.join(tmp, 'sub', 'a.txt'))
+        self.assertEqual(storage.directory_size(tmp), 1010)
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.index, name='missense'),
     path('download/<str:file_type>/', views.download_file, name='download_file'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/events/', views.job_events, name='job_events'),
+    path('jobs/<uuid:job_id>/download/<str:file_type>/', views.job_download, name='job_download'),
 ]
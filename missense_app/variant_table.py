@@ -0,0 +1,296 @@
+import csv
+import io
+from collections import namedtuple
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from .compression import open_file
+from .instrumentation import (SKIP_MALFORMED_LINE, SKIP_INVALID_POSITION, SKIP_POSITION_OUT_OF_RANGE,
+                              SKIP_UNKNOWN_AMINO_ACID)
+
+# Leitores do arquivo de variantes (MISSENSE_VARIANT_PARSER)
+PARSER_COLUMNAR = 'columnar'
+PARSER_LEGACY = 'legacy'
+
+AMINO = {
+    "Ala": "a", "Arg": "r", "Asn": "n", "Asp": "d", "Cys": "c", "Gln": "q", "Glu": "e", "Gly": "g", "His": "h",
+    "Ile": "i", "Leu": "l", "Lys": "k", "Met": "m", "Phe": "f", "Pro": "p", "Ser": "s", "Thr": "t", "Trp": "w",
+    "Tyr": "y", "Val": "v", "Ter": "z",
+    "A": "a", "R": "r", "N": "n", "D": "d", "C": "c", "Q": "q", "E": "e", "G": "g", "H": "h",
+    "I": "i", "L": "l", "K": "k", "M": "m", "F": "f", "P": "p", "S": "s", "T": "t", "W": "w",
+    "Y": "y", "V": "v", "Z": "z"
+}
+AMINO_CODES = set(AMINO) | set(AMINO.values())
+
+# Uma linha do arquivo de variantes: NP (sem versão), SNP, aminoácido ref, posição, aminoácido alt
+Variant = namedtuple('Variant', ['id_', 'snp', 'ref', 'pos', 'alt'])
+
+# Bloco de variantes aceitas em colunas (vetores NumPy na ordem do arquivo; posições em
+# int64) e, em 'seen', os NPs de todas as linhas bem formadas do bloco na ordem da
+# primeira ocorrência
+VariantColumns = namedtuple('VariantColumns', ['id_', 'snp', 'ref', 'pos', 'alt', 'seen'])
+
+# Linhas de exemplo guardadas por motivo no relatório de rejeições, e tamanho máximo de cada uma
+REJECTION_SAMPLES = 5
+REJECTION_TEXT_MAX = 200
+
+# Bytes que str.strip() removeria das pontas de uma linha; bytes fora do ASCII também
+# (início de um caractere multibyte, que pode ser um espaço Unicode ou o BOM)
+_BORDA_SUSPEITA = np.zeros(256, dtype=bool)
+_BORDA_SUSPEITA[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+_BORDA_SUSPEITA[128:] = True
+
+
+def parse_variant_line(lin):
+    """
+    Interpreta uma linha do arquivo de variantes (colunas separadas por tab ou, sem
+    tab, por espaços). Retorna (Variant, None), ou (None, motivo) para uma linha
+    descartada; linhas vazias retornam (None, None).
+    """
+    lin = lin.strip().replace('\r', '')
+
+    # Tratar diferentes formatos de entrada (espaços ou tabs)
+    if '\t' in lin:
+        linhas = lin.split('\t')
+    else:
+        linhas = lin.split()
+
+    # Verifica se a linha tem o número esperado de colunas
+    if len(linhas) < 5:
+        return None, (SKIP_MALFORMED_LINE if lin else None)
+
+    try:
+        pos = int(linhas[3])
+    except ValueError:
+        return None, SKIP_INVALID_POSITION
+    return Variant(linhas[0].split('.')[0], linhas[1], linhas[2], pos, linhas[4]), None
+
+
+def variant_rejection(variante):
+    """
+    Motivo de descarte de uma variante bem formada (posição não positiva ou aminoácido
+    fora de AMINO_CODES, nessa ordem, como na validação em bloco de _parse_block), ou None.
+    """
+    if variante.pos <= 0:
+        return SKIP_POSITION_OUT_OF_RANGE
+    if variante.ref not in AMINO_CODES or variante.alt not in AMINO_CODES:
+        return SKIP_UNKNOWN_AMINO_ACID
+    return None
+
+
+def _read_blocks(f, tamanho):
+    """Blocos de ~tamanho bytes do arquivo, sempre terminados em fim de linha."""
+    while True:
+        bloco = f.read(tamanho)
+        if not bloco:
+            return
+        if not bloco.endswith(b'\n'):
+            bloco += f.readline()
+        yield bloco
+
+
+def _positions(textos):
+    """Posições como int64 (int() de cada texto, em C); com falhas, elemento a elemento."""
+    try:
+        return textos.astype(np.int64), None
+    except (ValueError, OverflowError):
+        pass
+    posicoes = np.empty(len(textos), dtype=object)
+    invalidas = np.zeros(len(textos), dtype=bool)
+    for i, texto in enumerate(textos):
+        try:
+            posicoes[i] = int(texto)
+        except ValueError:
+            posicoes[i] = 0
+            invalidas[i] = True
+    return posicoes, invalidas
+
+
+class _Rejections:
+    """Conta as linhas rejeitadas de um bloco por motivo e guarda as primeiras como exemplo."""
+
+    def __init__(self, stats, bloco, inicios, fins, primeira_linha):
+        self.stats = stats
+        self._bloco = bloco
+        self._inicios = inicios
+        self._fins = fins
+        self._primeira = primeira_linha
+
+    def add(self, motivo, linhas):
+        if self.stats is None or not len(linhas):
+            return
+        faltam = REJECTION_SAMPLES - len(self.stats.rejected.get(motivo, ()))
+        exemplos = [(self._primeira + int(i) + 1,
+                     self._bloco[self._inicios[i]:self._fins[i]].decode('utf-8', 'replace')[:REJECTION_TEXT_MAX])
+                    for i in linhas[:max(0, faltam)]]
+        self.stats.skip(motivo, len(linhas), exemplos)
+
+
+def _parse_block(bloco, primeira_linha, stats=None):
+    """
+    Separa as colunas de um bloco com o leitor CSV em C do pandas e valida todas as
+    linhas de uma vez. Linhas que o leitor em C poderia interpretar diferente de
+    parse_variant_line (sem tab, com espaços nas pontas, menos de cinco colunas ou
+    caracteres fora do ASCII nas pontas) são relidas por ele, uma a uma.
+    """
+    if b'\r' in bloco:
+        # Mesma conversão de fins de linha da leitura em modo texto
+        bloco = bloco.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    dados = np.frombuffer(bloco, dtype=np.uint8)
+    fins = np.flatnonzero(dados == 10)
+    if not bloco.endswith(b'\n'):
+        fins = np.append(fins, len(bloco))
+    inicios = np.concatenate(([0], fins[:-1] + 1))
+    n = len(fins)
+
+    colunas = None
+    if b'\x00' not in bloco:
+        try:
+            tabela = pd.read_csv(io.BytesIO(bloco), sep='\t', header=None, names=range(5), usecols=range(5),
+                                 dtype=object, quoting=csv.QUOTE_NONE, na_filter=False, skip_blank_lines=False,
+                                 engine='c', encoding='utf-8')
+        except pd.errors.ParserError:
+            tabela = None  # Nenhuma linha do bloco com cinco colunas separadas por tab
+        if tabela is not None and len(tabela) == n:
+            colunas = [tabela[c].to_numpy(dtype=object, copy=True) for c in range(5)]
+    if colunas is None:
+        # O leitor em C não se aplica ao bloco: todas as linhas pelo caminho linha a linha
+        colunas = [np.full(n, '', dtype=object) for _ in range(5)]
+        estranhas = np.ones(n, dtype=bool)
+    else:
+        vazias = inicios == fins
+        ultimos = dados[np.maximum(fins - 1, 0)] if len(dados) else np.zeros(n, dtype=np.uint8)
+        primeiros = dados[np.minimum(inicios, max(len(dados) - 1, 0))] if len(dados) else ultimos
+        estranhas = vazias | _BORDA_SUSPEITA[primeiros] | _BORDA_SUSPEITA[ultimos] | (colunas[4] == '')
+    ids, snps, refs, textos_pos, alts = colunas
+    rejeicoes = _Rejections(stats, bloco, inicios, fins, primeira_linha)
+
+    # Linhas comuns: colunas do leitor em C e posições convertidas em bloco
+    limpas = np.flatnonzero(~estranhas)
+    posicoes = np.zeros(n, dtype=np.int64)
+    validas = ~estranhas
+    pos_limpas, invalidas = _positions(textos_pos[limpas])
+    if pos_limpas.dtype == object:
+        posicoes = posicoes.astype(object)
+    posicoes[limpas] = pos_limpas
+    if invalidas is not None:
+        validas[limpas[invalidas]] = False
+        rejeicoes.add(SKIP_INVALID_POSITION, limpas[invalidas])
+    # Versão removida uma vez por acesso distinto, não por linha
+    codigos, acessos = pd.factorize(ids[limpas])
+    ids[limpas] = np.array([acesso.split('.')[0] for acesso in acessos], dtype=object)[codigos]
+
+    # Linhas incomuns: a interpretação de parse_variant_line
+    malformadas, sem_posicao = [], []
+    for i in np.flatnonzero(estranhas):
+        variante, motivo = parse_variant_line(bloco[inicios[i]:fins[i]].decode('utf-8'))
+        if variante is None:
+            if motivo == SKIP_MALFORMED_LINE:
+                malformadas.append(i)
+            elif motivo == SKIP_INVALID_POSITION:
+                sem_posicao.append(i)
+            continue
+        if posicoes.dtype != object and not -2 ** 63 <= variante.pos < 2 ** 63:
+            posicoes = posicoes.astype(object)
+        ids[i], snps[i], refs[i], posicoes[i], alts[i] = variante
+        validas[i] = True
+    rejeicoes.add(SKIP_MALFORMED_LINE, malformadas)
+    rejeicoes.add(SKIP_INVALID_POSITION, sem_posicao)
+
+    # Validação em bloco: posição positiva e aminoácidos conhecidos. A ordem das
+    # proteínas considera todas as linhas bem formadas, como no agrupamento linha a linha
+    vistos = pd.unique(ids[validas])
+    fora = validas & (posicoes <= 0)
+    aminoacidos = list(AMINO_CODES)
+    desconhecidos = validas & ~fora & ~(pd.Series(refs).isin(aminoacidos).to_numpy()
+                                        & pd.Series(alts).isin(aminoacidos).to_numpy())
+    rejeicoes.add(SKIP_POSITION_OUT_OF_RANGE, np.flatnonzero(fora))
+    rejeicoes.add(SKIP_UNKNOWN_AMINO_ACID, np.flatnonzero(desconhecidos))
+    aceitas = validas & ~fora & ~desconhecidos
+    return VariantColumns(ids[aceitas], snps[aceitas], refs[aceitas], posicoes[aceitas], alts[aceitas],
+                          vistos.tolist()), n
+
+
+def read_variant_table(mutacao, stats=None, chunk_bytes=None):
+    """
+    Lê o arquivo de variantes (comprimido ou não) em blocos de chunk_bytes (padrão:
+    MISSENSE_PARSER_CHUNK_BYTES) e gera um VariantColumns por bloco. Linhas
+    malformadas, com posição inválida ou não positiva ou com aminoácidos fora de
+    AMINO_CODES são descartadas aqui e contadas em stats por motivo, com as
+    primeiras de cada motivo (número e texto) em stats.rejected.
+    """
+    tamanho = chunk_bytes or settings.MISSENSE_PARSER_CHUNK_BYTES
+    linha = 0
+    with open_file(mutacao, 'rb') as f:
+        for bloco in _read_blocks(f, tamanho):
+            colunas, n = _parse_block(bloco, linha, stats)
+            linha += n
+            yield colunas
+
+
+class VariantGroup:
+    """
+    Variantes de uma proteína guardadas em colunas (SNP, ref, posição e alt). Os
+    Variant são criados só durante a digestão, um de cada vez, ao percorrer o grupo.
+    """
+
+    __slots__ = ('id_', 'snp', 'ref', 'pos', 'alt')
+
+    def __init__(self, id_):
+        self.id_ = id_
+        self.snp = []
+        self.ref = []
+        self.pos = []
+        self.alt = []
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __iter__(self):
+        return map(Variant._make, zip(repeat(self.id_), self.snp, self.ref, self.pos, self.alt))
+
+
+def group_variant_table(blocos):
+    """
+    Agrupa as variantes por NP como group_variants, na ordem da primeira ocorrência
+    de cada proteína, em VariantGroups: as colunas de cada bloco são ordenadas por
+    proteína (ordenação estável) e repartidas em fatias, sem percorrer as variantes
+    uma a uma em Python.
+    """
+    grupos = {}
+    for bloco in blocos:
+        for id_ in bloco.seen:
+            if id_ not in grupos:
+                grupos[id_] = VariantGroup(id_)
+        if not len(bloco.id_):
+            continue
+        codigos, proteinas = pd.factorize(bloco.id_)
+        ordem = np.argsort(codigos, kind='stable')
+        snps, refs, posicoes, alts = (coluna[ordem] for coluna in (bloco.snp, bloco.ref, bloco.pos, bloco.alt))
+        limites = np.cumsum(np.bincount(codigos, minlength=len(proteinas))).tolist()
+        inicio = 0
+        for id_, fim in zip(proteinas, limites):
+            grupo = grupos[id_]
+            grupo.snp.extend(snps[inicio:fim].tolist())
+            grupo.ref.extend(refs[inicio:fim].tolist())
+            grupo.pos.extend(posicoes[inicio:fim].tolist())
+            grupo.alt.extend(alts[inicio:fim].tolist())
+            inicio = fim
+    # Proteínas só com variantes rejeitadas ficam fora, sem mudar a ordem das demais
+    return {id_: grupo for id_, grupo in grupos.items() if len(grupo)}
+
+
+def count_variant_table(blocos):
+    """{NP: número de variantes}, na ordem da primeira ocorrência, sem montar as variantes."""
+    contagem = {}
+    for bloco in blocos:
+        for id_ in bloco.seen:
+            if id_ not in contagem:
+                contagem[id_] = 0
+        if not len(bloco.id_):
+            continue
+        codigos, proteinas = pd.factorize(bloco.id_)
+        for id_, total in zip(proteinas, np.bincount(codigos).tolist()):
+            contagem[id_] += total
+    return {id_: total for id_, total in contagem.items() if total}
@@ -1,80 +1,223 @@
-from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import os
 import tempfile
 import json
-from .peptide_processor import process_peptide_data
+from .models import MissenseJob
+from .jobs import submit_job, submit_batch, load_results
+from .batch import ARCHIVE_FILE
+from .events import job_events as sync_job_events, ajob_events
+from .downloads import file_download_response
+from .compression import SUFFIXES, CONTENT_TYPES, available_suffixes, compression_from_name, is_available, strip_suffix
+from .instrumentation import PROFILE_MODES
+from . import storage
 
 # Create your views here.
 
+OUTPUT_TYPES = ('dbpepmutref', 'dbsaida', 'dbfinal', 'dbpepcounts')
+# Zip com as saídas de cada arquivo e a base unificada (envios com vários arquivos)
+ARCHIVE_TYPE = 'archive'
+# IDs dos jobs enviados pela sessão (os mais recentes): só eles podem ser consultados e baixados
+SESSION_JOBS_KEY = 'missense_jobs'
+SESSION_JOBS_MAX = 200
+
+
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def _get_job(job_id, request=None):
+    """Job pelo ID; com request, None também para jobs que não foram enviados pela sessão."""
+    if request is not None and str(job_id) not in request.session.get(SESSION_JOBS_KEY, []):
+        return None
+    try:
+        return MissenseJob.objects.get(pk=job_id)
+    except (MissenseJob.DoesNotExist, ValidationError, ValueError):
+        return None
+
+
+def _remember_job(request, job):
+    jobs = request.session.get(SESSION_JOBS_KEY, [])
+    request.session[SESSION_JOBS_KEY] = (jobs + [str(job.id)])[-SESSION_JOBS_MAX:]
+
+
+def _output_path(job, file_type):
+    if file_type == ARCHIVE_TYPE:
+        return os.path.join(job.temp_dir, ARCHIVE_FILE)
+    return job.output_path(file_type)
+
+
+def _job_payload(job):
+    """Estado de um job no formato retornado pelos endpoints JSON."""
+    payload = {
+        'id': str(job.id),
+        'status': job.status,
+        'stage': job.stage,
+        'variants_done': job.variants_done,
+        'variants_total': job.variants_total,
+        'progress': round(job.progress, 4),
+        'stage_timings': job.stage_timings,
+        'from_cache': job.from_cache,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': reverse('job_status', kwargs={'job_id': job.id}),
+        'events_url': reverse('job_events', kwargs={'job_id': job.id}),
+        'result_url': f"{reverse('missense')}?job={job.id}",
+    }
+    if job.status == MissenseJob.STATUS_DONE:
+        try:
+            payload['stats'] = load_results(job).get('stats')
+        except FileNotFoundError:
+            payload['stats'] = None
+        # dbpepcounts só existe quando a deduplicação está ligada
+        payload['downloads'] = {
+            file_type: reverse('job_download', kwargs={'job_id': job.id, 'file_type': file_type})
+            for file_type in OUTPUT_TYPES + (ARCHIVE_TYPE,) if os.path.exists(_output_path(job, file_type))
+        }
+    return payload
+
+
 def index(request):
-    context = {}
+    # .zst só é oferecido com o pacote zstandard instalado
+    sufixos = list(available_suffixes().values())
+    context = {'compression_suffixes': sufixos}
     
     if request.method == 'POST':
+        job = None
         try:
             input_type = request.POST.get('input_type', 'text')
+            # Optional per-submission profiling ('cprofile' or 'sampling')
+            profile = request.POST.get('profile', '')
+            if profile not in PROFILE_MODES:
+                profile = ''
             
             if input_type == 'text':
                 peptide_text = request.POST.get('peptide_text', '')
                 if not peptide_text.strip():
                     context['error'] = "The peptide text cannot be empty."
                 else:
-                    try:
-                        results, session_data = process_peptide_data(peptide_text, 'text')
-                        context['results'] = results
-                        
-                        # Save file paths in session for later download
-                        request.session['peptide_files'] = session_data
-                        
-                        # Add success message for better UX
-                        context['success'] = "Peptide data processed successfully!"
-                        
-                    except ValueError as ve:
-                        context['error'] = f"Invalid input format: {str(ve)}"
-                    except FileNotFoundError as fe:
-                        context['error'] = f"Required reference file not found: {str(fe)}"
-                    except Exception as e:
-                        context['error'] = f"Processing error: {str(e)}"
+                    # O processamento roda no worker; a resposta volta com o ID do job
+                    job = submit_job(peptide_text, 'text', 'Text input', profile)
                     
             elif input_type == 'file':
-                peptide_file = request.FILES.get('peptide_file')
-                if not peptide_file:
+                peptide_files = request.FILES.getlist('peptide_file')
+                # Validate file types (optionally compressed: .gz, .bz2 and, with zstandard installed, .zst)
+                allowed_extensions = ['.txt', '.fasta', '.csv', '.tsv']
+                invalid = [f.name for f in peptide_files
+                           if os.path.splitext(strip_suffix(f.name))[1].lower() not in allowed_extensions
+                           or not is_available(compression_from_name(f.name))]
+                if not peptide_files:
                     context['error'] = "No file was uploaded."
+                elif invalid:
+                    context['error'] = (f"Invalid file type ({', '.join(invalid)}). Please upload files with one of "
+                                        f"these extensions: {', '.join(allowed_extensions)} (optionally compressed "
+                                        f"as {', '.join(sufixos)})")
+                elif len(peptide_files) > settings.MISSENSE_BATCH_MAX_FILES:
+                    context['error'] = f"Too many files: at most {settings.MISSENSE_BATCH_MAX_FILES} per submission."
+                elif len(peptide_files) > 1:
+                    # Several files become a single job, processed concurrently by the worker
+                    job = submit_batch(peptide_files, profile)
                 else:
-                    # Validate file type
-                    allowed_extensions = ['.txt', '.fasta', '.csv', '.tsv']
-                    file_extension = os.path.splitext(peptide_file.name)[1].lower()
-                    
-                    if file_extension not in allowed_extensions:
-                        context['error'] = f"Invalid file type. Please upload a file with one of these extensions: {', '.join(allowed_extensions)}"
-                    else:
-                        try:
-                            results, session_data = process_peptide_data(peptide_file, 'file')
-                            context['results'] = results
-                            
-                            # Save file paths in session for later download
-                            request.session['peptide_files'] = session_data
-                            
-                            # Add success message for better UX
-                            context['success'] = f"File '{peptide_file.name}' processed successfully!"
-                            
-                        except ValueError as ve:
-                            context['error'] = f"Invalid file content: {str(ve)}"
-                        except FileNotFoundError as fe:
-                            context['error'] = f"Required reference file not found: {str(fe)}"
-                        except Exception as e:
-                            context['error'] = f"File processing error: {str(e)}"
+                    job = submit_job(peptide_files[0], 'file', peptide_files[0].name, profile)
                     
         except Exception as e:
             context['error'] = f"Unexpected error: {str(e)}"
+        
+        if job is not None:
+            _remember_job(request, job)
+        if _wants_json(request):
+            if job is None:
+                return JsonResponse({'error': context.get('error', 'Invalid submission.')}, status=400)
+            return JsonResponse(_job_payload(job), status=202)
+        if job is not None:
+            return redirect(f"{reverse('missense')}?job={job.id}")
+    
+    elif request.GET.get('job'):
+        job = _get_job(request.GET['job'], request)
+        if job is None:
+            context['error'] = "Processing job not found."
+        elif job.status == MissenseJob.STATUS_DONE:
+            try:
+                context['results'] = load_results(job)
+                storage.touch(job)
+                # Save file paths in session for later download
+                request.session['peptide_files'] = dict(
+                    {f'{file_type}_path': _output_path(job, file_type) for file_type in OUTPUT_TYPES + (ARCHIVE_TYPE,)},
+                    process_id=str(job.id))
+                context['success'] = f"'{job.input_name}' processed successfully!"
+            except FileNotFoundError:
+                context['error'] = "The results of this job are no longer available."
+        elif job.status == MissenseJob.STATUS_FAILED:
+            context['error'] = f"Processing error: {job.error}"
+        else:
+            context['job'] = job
     
     return render(request, 'missense.html', context)
 
+
+def job_status(request, job_id):
+    """Status, andamento (fração de variantes) e tempos por etapa de um job, em JSON."""
+    job = _get_job(job_id, request)
+    if job is None:
+        return JsonResponse({'error': 'Job not found.'}, status=404)
+    return JsonResponse(_job_payload(job))
+
+
+def job_events(request, job_id):
+    """
+    Andamento de um job como Server-Sent Events (text/event-stream): progresso,
+    ETA, prévia das saídas e conclusão. Sob ASGI o gerador é assíncrono, então
+    uma conexão aberta não ocupa uma thread do servidor.
+    """
+    if _get_job(job_id, request) is None:
+        return HttpResponse("Job not found.", status=404)
+    eventos = ajob_events(job_id) if isinstance(request, ASGIRequest) else sync_job_events(job_id)
+    response = StreamingHttpResponse(eventos, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Impede que proxies (nginx) acumulem os eventos em buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _file_response(request, file_path, file_type):
+    # Return file as a streamed download (Range, ETag and gzip aware)
+    if file_type == ARCHIVE_TYPE:
+        return file_download_response(request, file_path, ARCHIVE_FILE, content_type='application/zip')
+    compression = compression_from_name(file_path)
+    if compression:
+        return file_download_response(request, file_path, f'{file_type}.txt{SUFFIXES[compression]}',
+                                      content_type=CONTENT_TYPES[compression])
+    return file_download_response(request, file_path, f'{file_type}.txt')
+
+
+def job_download(request, job_id, file_type):
+    """Download de uma das saídas de um job concluído."""
+    job = _get_job(job_id, request)
+    if job is None or file_type not in OUTPUT_TYPES + (ARCHIVE_TYPE,):
+        return HttpResponse("File not found.", status=404)
+    if job.status != MissenseJob.STATUS_DONE:
+        return HttpResponse("Job has not finished yet.", status=409)
+    
+    file_path = _output_path(job, file_type)
+    if not os.path.exists(file_path):
+        return HttpResponse(f"File {file_type} not found.", status=404)
+    storage.touch(job)
+    try:
+        return _file_response(request, file_path, file_type)
+    except Exception as e:
+        return HttpResponse(f"Error downloading file: {str(e)}", status=500)
+
+
 def download_file(request, file_type):
     """
-    Allow downloading one of the generated files (dbpepmutref, dbsaida, dbfinal)
+    Allow downloading one of the generated files (dbpepmutref, dbsaida, dbfinal, dbpepcounts)
     """
     try:
         # Get file paths from session
@@ -87,11 +230,11 @@ def download_file(request, file_type):
         if not file_path or not os.path.exists(file_path):
             return HttpResponse(f"File {file_type} not found.", status=404)
         
-        # Return file as download response
-        with open(file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='text/plain')
-            response['Content-Disposition'] = f'attachment; filename="{file_type}.txt"'
-            return response
+        job = _get_job(peptide_files.get('process_id'))
+        if job is not None:
+            storage.touch(job)
+        
+        return _file_response(request, file_path, file_type)
             
     except Exception as e:
         return HttpResponse(f"Error downloading file: {str(e)}", status=500)
@@ -80,6 +80,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Web requests and run_missense_worker write to the same database
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -127,9 +129,102 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Reference proteome (compiled on first use into <fasta>.store, shared read-only via mmap)
+MISSENSE_REFERENCE_FASTA = BASE_DIR / 'data' / 'RefSeqhumanFullNP.fasta'
+# 'store' (compiled mmap) or 'faidx' (reads only the requested proteins through <fasta>.fai)
+MISSENSE_REFERENCE_BACKEND = os.getenv('MISSENSE_REFERENCE_BACKEND', 'store')
+# Compute cleavage sites for the whole 'store' proteome at once with NumPy (falls back to per-protein regex)
+MISSENSE_NUMPY_SITES = os.getenv('MISSENSE_NUMPY_SITES', 'True') == 'True'
+# Worker processes for process_mutations (1 = serial)
+MISSENSE_WORKERS = int(os.getenv('MISSENSE_WORKERS', '1'))
+# Variant files larger than this (bytes) are partitioned on disk instead of grouped in memory
+MISSENSE_SPILL_THRESHOLD = int(os.getenv('MISSENSE_SPILL_THRESHOLD', str(64 * 1024 * 1024)))
+# Approximate number of variants held in memory per partition
+MISSENSE_PARTITION_VARIANTS = int(os.getenv('MISSENSE_PARTITION_VARIANTS', '500000'))
+# Variant file reader: 'columnar' (chunks parsed and validated with pandas/NumPy) or 'legacy' (line by line)
+MISSENSE_VARIANT_PARSER = os.getenv('MISSENSE_VARIANT_PARSER', 'columnar')
+# Bytes of the variant file parsed per chunk by the columnar reader
+MISSENSE_PARSER_CHUNK_BYTES = int(os.getenv('MISSENSE_PARSER_CHUNK_BYTES', str(32 * 1024 * 1024)))
+# Size limit of the content-addressed result cache in MEDIA_ROOT/cache (0 disables it)
+MISSENSE_RESULT_CACHE_MAX_BYTES = int(os.getenv('MISSENSE_RESULT_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+# Multi-file submissions from the web form: files processed at the same time and files per submission
+MISSENSE_BATCH_CONCURRENCY = int(os.getenv('MISSENSE_BATCH_CONCURRENCY', str(os.cpu_count() or 1)))
+MISSENSE_BATCH_MAX_FILES = int(os.getenv('MISSENSE_BATCH_MAX_FILES', '100'))
+# Running jobs without a progress update for this many seconds are considered orphaned
+# (worker killed) and are requeued by run_missense_worker on startup
+MISSENSE_JOB_STALE_SECONDS = int(os.getenv('MISSENSE_JOB_STALE_SECONDS', '1800'))
+# Orphaned jobs already claimed this many times are marked as failed instead of requeued
+MISSENSE_JOB_MAX_ATTEMPTS = int(os.getenv('MISSENSE_JOB_MAX_ATTEMPTS', '2'))
+# Disk quota for job directories in MEDIA_ROOT/temp (0 disables it); least recently accessed
+# finished jobs are removed first by the worker's periodic sweep and by cleanup_temp
+MISSENSE_TEMP_QUOTA_BYTES = int(os.getenv('MISSENSE_TEMP_QUOTA_BYTES', str(20 * 1024 ** 3)))
+# Also remove finished jobs not accessed for this many days (0 disables it)
+MISSENSE_TEMP_MAX_AGE_DAYS = float(os.getenv('MISSENSE_TEMP_MAX_AGE_DAYS', '0'))
+# Seconds between the worker's storage sweeps
+MISSENSE_TEMP_SWEEP_INTERVAL = float(os.getenv('MISSENSE_TEMP_SWEEP_INTERVAL', '300'))
+# Compress downloads on the fly when the client sends Accept-Encoding: gzip
+MISSENSE_DOWNLOAD_GZIP = os.getenv('MISSENSE_DOWNLOAD_GZIP', 'True') == 'True'
+# Compression of the generated databases: '' (none), 'gzip', 'bz2' or 'zstd' (needs the zstandard package)
+MISSENSE_OUTPUT_COMPRESSION = os.getenv('MISSENSE_OUTPUT_COMPRESSION', '') or None
+# Digestion: 'legacy' (historical tryptic digest, default) or one of trypsin, trypsin/p, lys-c, glu-c,
+# chymotrypsin; up to 2 missed cleavages and the peptide length window
+MISSENSE_PROTEASE = os.getenv('MISSENSE_PROTEASE', 'legacy')
+MISSENSE_MISSED_CLEAVAGES = int(os.getenv('MISSENSE_MISSED_CLEAVAGES', '0'))
+MISSENSE_PEPTIDE_MIN_LENGTH = int(os.getenv('MISSENSE_PEPTIDE_MIN_LENGTH', '7'))
+MISSENSE_PEPTIDE_MAX_LENGTH = int(os.getenv('MISSENSE_PEPTIDE_MAX_LENGTH', '35'))
+# Write each mutated peptide once to dbsaida/dbfinal, with occurrences and source variants in dbpepcounts
+MISSENSE_DEDUPLICATE = os.getenv('MISSENSE_DEDUPLICATE', 'False') == 'True'
+
+# Server-Sent Events progress stream (/missense/jobs/<id>/events/). Serve through
+# missense_project.asgi (e.g. uvicorn/daphne) so idle connections do not hold a thread.
+# Seconds between job polls
+MISSENSE_SSE_INTERVAL = float(os.getenv('MISSENSE_SSE_INTERVAL', '1.0'))
+# Seconds without events before a keep-alive comment is sent
+MISSENSE_SSE_HEARTBEAT = float(os.getenv('MISSENSE_SSE_HEARTBEAT', '15'))
+# Seconds before a stream is closed; the browser reconnects after MISSENSE_SSE_RETRY_MS
+MISSENSE_SSE_TIMEOUT = float(os.getenv('MISSENSE_SSE_TIMEOUT', '300'))
+MISSENSE_SSE_RETRY_MS = int(os.getenv('MISSENSE_SSE_RETRY_MS', '2000'))
+# Profile every job into its temp dir: '' (off), 'cprofile' (profile.pstats) or 'sampling' (profile.folded).
+# A single submission can also ask for it with the 'profile' form parameter.
+MISSENSE_PROFILE = os.getenv('MISSENSE_PROFILE', '')
+
+# missense_app logs warnings and errors by default; MISSENSE_LOG_LEVEL=INFO also logs the
+# pipeline instrumentation (stage durations, counters and skip reasons) of every run
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'missense_app': {
+            'handlers': ['console'],
+            'level': os.getenv('MISSENSE_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
 # Entrez configuration (for gene lookup)
 ENTREZ_EMAIL = os.getenv('ENTREZ_EMAIL', 'your-email@example.com')
-ENTREZ_DELAY = float(os.getenv('ENTREZ_DELAY', '0.34'))
+# NCBI allows 3 requests/s per site, or 10 with an API key
+ENTREZ_API_KEY = os.getenv('ENTREZ_API_KEY', '')
+# Minimum seconds between requests, shared by every thread and process of the deployment
+# through ENTREZ_RATE_LIMIT_FILE (capped at the NCBI limit for the configured key)
+ENTREZ_DELAY = float(os.getenv('ENTREZ_DELAY', '0.1' if ENTREZ_API_KEY else '0.34'))
+ENTREZ_RATE_LIMIT_FILE = os.getenv('ENTREZ_RATE_LIMIT_FILE', str(MEDIA_ROOT / 'entrez.ratelimit'))
+# Batches of add-genes IDs looked up at the same time
+ENTREZ_WORKERS = int(os.getenv('ENTREZ_WORKERS', '4'))
+# E-utilities endpoint (point it at a local stand-in server for tests) and protein IDs
+# per batched elink/esummary request in the add-genes filter
+ENTREZ_BASE_URL = os.getenv('ENTREZ_BASE_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/')
+ENTREZ_BATCH_SIZE = int(os.getenv('ENTREZ_BATCH_SIZE', '200'))
+# Days a gene symbol from Entrez stays in the local cache (0 disables the cache), and days
+# a "no gene" answer is remembered before the ID is looked up again
+GENE_SYMBOL_CACHE_TTL_DAYS = float(os.getenv('GENE_SYMBOL_CACHE_TTL_DAYS', '30'))
+GENE_SYMBOL_NEGATIVE_TTL_DAYS = float(os.getenv('GENE_SYMBOL_NEGATIVE_TTL_DAYS', '7'))
+# Gene annotation source for add-genes: 'entrez' (NCBI E-utilities) or 'local' (offline index
+# built from the NCBI gene2refseq/gene_info files with `manage.py import_gene_index`)
+GENE_ANNOTATION_BACKEND = os.getenv('GENE_ANNOTATION_BACKEND', 'entrez')
 
 
 # Default primary key field type
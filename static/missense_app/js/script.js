@@ -7,6 +7,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeCopyButtons();
     initializeExpandCollapse();
     initializeMobileMenu();
+    initializeJobStatus();
 
     const modal = document.getElementById('help-modal');
     if (modal) {
@@ -123,7 +124,7 @@ function initializeFileUpload() {
     
     fileInput.addEventListener('change', function() {
         if (this.files.length > 0) {
-            handleFile(this.files[0]);
+            handleFiles(this.files);
         }
     });
     
@@ -145,7 +146,9 @@ function initializeFileUpload() {
         this.classList.remove('dragover');
         
         if (e.dataTransfer.files.length > 0) {
-            handleFile(e.dataTransfer.files[0]);
+            // Dropped files must go into the input to be submitted with the form
+            fileInput.files = e.dataTransfer.files;
+            handleFiles(e.dataTransfer.files);
         }
     });
     
@@ -165,16 +168,35 @@ function initializeFileUpload() {
         });
     }
     
-    function handleFile(file) {
+    // Compression suffixes the server can read (.zst only with the zstandard package)
+    const compressionSuffixes = (fileInput.getAttribute('data-compression-suffixes') || '').split(',').filter(Boolean);
+    
+    function isValidFile(file) {
         const validTypes = ['.txt', '.fasta', '.csv', '.tsv', 'text/plain', 'text/csv', 'text/tab-separated-values'];
-        const fileExtension = file.name.substring(file.name.lastIndexOf('.')); 
-        
-        if (!validTypes.some(type => file.type === type || fileExtension.toLowerCase() === type)) {
-            alert('Invalid file type. Please upload a .txt, .fasta, .csv, or .tsv file.');
+        // Compressed uploads are checked by the extension before the compression suffix
+        const suffix = file.name.substring(file.name.lastIndexOf('.')).toLowerCase();
+        if (/^\.(gz|bz2|zst)$/.test(suffix) && !compressionSuffixes.includes(suffix)) return false;
+        const baseName = file.name.replace(/\.(gz|bz2|zst)$/i, '');
+        const fileExtension = baseName.substring(baseName.lastIndexOf('.')); 
+        return validTypes.some(type => (baseName === file.name && file.type === type) || fileExtension.toLowerCase() === type);
+    }
+    
+    function handleFiles(files) {
+        files = Array.from(files);
+        const invalid = files.filter(file => !isValidFile(file));
+        if (invalid.length > 0) {
+            alert(`Invalid file type (${invalid.map(file => file.name).join(', ')}). ` +
+                  `Please upload .txt, .fasta, .csv, or .tsv files (optionally ${compressionSuffixes.join(', ')} compressed).`);
+            fileInput.value = '';
+            fileInfo.style.display = 'none';
             return;
         }
         
-        fileName.textContent = `${file.name} (${formatFileSize(file.size)})`;
+        const totalSize = files.reduce((total, file) => total + file.size, 0);
+        fileName.textContent = files.length === 1
+            ? `${files[0].name} (${formatFileSize(files[0].size)})`
+            : `${files.length} files (${formatFileSize(totalSize)})`;
+        fileName.title = files.map(file => file.name).join('\n');
         fileInfo.style.display = 'flex';
         
         fileUploadArea.classList.add('highlight');
@@ -378,6 +400,106 @@ function initializeExpandCollapse() {
     }
 }
 
+function initializeJobStatus() {
+    const section = document.getElementById('job-status');
+    if (!section) return;
+    
+    const statusUrl = section.getAttribute('data-status-url');
+    const eventsUrl = section.getAttribute('data-events-url');
+    const resultUrl = section.getAttribute('data-result-url');
+    const state = document.getElementById('job-state');
+    const fill = document.getElementById('job-progress-fill');
+    const text = document.getElementById('job-progress-text');
+    const preview = document.getElementById('job-preview');
+    const progressBar = section.querySelector('.progress-bar');
+    const stageLabels = {
+        cache: 'Checking result cache',
+        reference: 'Loading reference proteome',
+        parsing: 'Reading variants',
+        digestion: 'Digesting proteins',
+        batch: 'Processing files'
+    };
+    
+    function formatEta(seconds) {
+        if (seconds === null || seconds === undefined) return '';
+        if (seconds < 60) return ` - about ${Math.ceil(seconds)}s left`;
+        return ` - about ${Math.ceil(seconds / 60)} min left`;
+    }
+    
+    function render(job) {
+        const percent = Math.round(job.progress * 100);
+        fill.style.width = percent + '%';
+        progressBar.setAttribute('aria-valuenow', percent);
+        
+        if (job.status === 'queued') {
+            state.textContent = 'Queued';
+            text.textContent = 'Waiting for a worker...';
+        } else {
+            state.textContent = stageLabels[job.stage] || 'Running';
+            // Multi-file submissions report finished files instead of variants
+            const unit = job.stage === 'batch' ? 'files' : 'variants';
+            text.textContent = job.variants_total
+                ? `${job.variants_done.toLocaleString()} of ${job.variants_total.toLocaleString()} ${unit} (${percent}%)` +
+                  formatEta(job.eta_seconds)
+                : 'Preparing...';
+        }
+    }
+    
+    function renderPreview(data) {
+        let block = preview.querySelector(`pre[data-file="${data.file}"]`);
+        if (!block) {
+            const title = document.createElement('h3');
+            title.textContent = data.file;
+            block = document.createElement('pre');
+            block.setAttribute('data-file', data.file);
+            preview.appendChild(title);
+            preview.appendChild(block);
+        }
+        block.textContent = data.lines;
+        preview.hidden = false;
+    }
+    
+    function poll() {
+        fetch(statusUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(job => {
+                if (job.status === 'done' || job.status === 'failed') {
+                    window.location.href = resultUrl;
+                    return;
+                }
+                render(job);
+                setTimeout(poll, 1500);
+            })
+            .catch(err => {
+                console.error('Failed to fetch job status: ', err);
+                setTimeout(poll, 5000);
+            });
+    }
+    
+    // Server-Sent Events: one open connection pushes progress, ETA and preview lines.
+    // Browsers without EventSource (or a refused stream) fall back to polling.
+    if (!eventsUrl || !window.EventSource) {
+        poll();
+        return;
+    }
+    
+    const source = new EventSource(eventsUrl);
+    source.addEventListener('progress', event => render(JSON.parse(event.data)));
+    source.addEventListener('preview', event => renderPreview(JSON.parse(event.data)));
+    ['done', 'failed'].forEach(name => {
+        source.addEventListener(name, () => {
+            source.close();
+            window.location.href = resultUrl;
+        });
+    });
+    source.onerror = () => {
+        // CONNECTING means the browser is already retrying on its own
+        if (source.readyState === EventSource.CLOSED) {
+            poll();
+        }
+    };
+}
+
 function initializeMobileMenu() {
     const mobileMenuToggle = document.querySelector('.mobile-menu-toggle');
     const navbarLinks = document.querySelector('.navbar-links');
@@ -264,7 +264,8 @@ document.addEventListener("DOMContentLoaded", () => {
       const result = await response.json()
 
       if (result.success) {
-        currentData = result.data
+        // Only the sheets changed by the filter come back
+        currentData = { ...currentData, ...result.data }
         currentPage = 1 // Reset to first page
         updateTable()
         hideLoading()
@@ -316,7 +317,8 @@ document.addEventListener("DOMContentLoaded", () => {
       const result = await response.json()
 
       if (result.success) {
-        currentData = result.data
+        // Only the sheets changed by the filter come back
+        currentData = { ...currentData, ...result.data }
         currentPage = 1 // Reset to first page
         updateTable()
         hideLoading()
@@ -1,3 +1,15 @@
 from django.contrib import admin
+from .models import GeneSymbolCacheEntry, ProteinGene
 
 # Register your models here.
+
+@admin.register(GeneSymbolCacheEntry)
+class GeneSymbolCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('accession', 'symbol', 'fetched_at')
+    search_fields = ('accession', 'symbol')
+
+
+@admin.register(ProteinGene)
+class ProteinGeneAdmin(admin.ModelAdmin):
+    list_display = ('protein', 'symbol', 'gene_id', 'tax_id')
+    search_fields = ('protein', 'symbol')
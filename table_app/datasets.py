@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import pandas as pd
+from django.conf import settings
+
+# Arquivo com as planilhas do dataset (nome e arquivo, na ordem da pasta de trabalho)
+MANIFEST = 'manifest.json'
+# Intervalo mínimo entre atualizações do último acesso (mtime do manifesto)
+TOUCH_INTERVAL = 60
+ARROW = '.arrow'
+PICKLE = '.pkl'
+
+logger = logging.getLogger(__name__)
+_sem_pyarrow_avisado = False
+
+
+def _pyarrow():
+    """
+    pyarrow (requirements.txt), ou None se não estiver instalado. Sem ele as
+    planilhas são gravadas como pickle do pandas: cada filtro lê a planilha inteira
+    para a memória em vez de mapeá-la, e o aviso é registrado uma vez por processo.
+    """
+    global _sem_pyarrow_avisado
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        if not _sem_pyarrow_avisado:
+            _sem_pyarrow_avisado = True
+            logger.warning("pyarrow não está instalado: os datasets serão gravados como pickle, sem leitura por mmap "
+                           "(pip install pyarrow)")
+        return None
+    return pyarrow
+
+
+def datasets_root():
+    return os.path.join(settings.MEDIA_ROOT, 'datasets')
+
+
+def _dir(dataset_id):
+    # O ID vem da sessão, mas nunca deve virar um caminho fora de datasets_root
+    if not isinstance(dataset_id, str) or len(dataset_id) != 32 or not dataset_id.isalnum():
+        raise KeyError(dataset_id)
+    return os.path.join(datasets_root(), dataset_id)
+
+
+def _write_sheet(pasta, base, df):
+    """
+    Grava uma planilha em Arrow IPC sem compressão (lida depois por mmap) ou, sem
+    pyarrow ou com colunas que o Arrow não representa (tipos misturados vindos do
+    Excel), em pickle. A gravação é atômica: leitores veem a versão antiga ou a nova.
+    """
+    pa = _pyarrow()
+    if pa is not None:
+        try:
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            tabela = None
+        if tabela is not None:
+            arquivo = base + ARROW
+            tmp = os.path.join(pasta, f'.{arquivo}.tmp')
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, tabela.schema) as writer:
+                writer.write_table(tabela)
+            os.replace(tmp, os.path.join(pasta, arquivo))
+            return arquivo
+    arquivo = base + PICKLE
+    tmp = os.path.join(pasta, f'.{arquivo}.tmp')
+    # Como no Arrow, o índice (com lacunas depois de um filtro) não é guardado
+    df.reset_index(drop=True).to_pickle(tmp, compression=None)
+    os.replace(tmp, os.path.join(pasta, arquivo))
+    return arquivo
+
+
+def _read_sheet(caminho, columns=None):
+    """
+    Planilha como DataFrame; com columns, só as colunas pedidas que existem nela. No
+    Arrow as demais colunas nem saem do mmap; o pickle é lido inteiro e recortado.
+    """
+    if caminho.endswith(ARROW):
+        pa = _pyarrow()
+        with pa.memory_map(caminho, 'r') as source:
+            tabela = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                tabela = tabela.select([coluna for coluna in columns if coluna in tabela.column_names])
+            return tabela.to_pandas()
+    df = pd.read_pickle(caminho, compression=None)
+    return df if columns is None else df[[coluna for coluna in columns if coluna in df.columns]]
+
+
+def _read_manifest(pasta):
+    with open(os.path.join(pasta, MANIFEST), 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(pasta, manifesto):
+    tmp = os.path.join(pasta, f'.{MANIFEST}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifesto, f)
+    os.replace(tmp, os.path.join(pasta, MANIFEST))
+
+
+def create(sheets):
+    """Grava as planilhas ({nome: DataFrame}) como um novo dataset e retorna o seu ID."""
+    dataset_id = uuid.uuid4().hex
+    pasta = _dir(dataset_id)
+    os.makedirs(pasta)
+    try:
+        # Arquivos pela posição da planilha: nomes do Excel não viram nomes de arquivo
+        manifesto = {'sheets': [[nome, _write_sheet(pasta, f'sheet{i}', df)]
+                                for i, (nome, df) in enumerate(sheets.items())]}
+        _write_manifest(pasta, manifesto)
+    except Exception:
+        shutil.rmtree(pasta, ignore_errors=True)
+        raise
+    return dataset_id
+
+
+def exists(dataset_id):
+    try:
+        return os.path.exists(os.path.join(_dir(dataset_id), MANIFEST))
+    except KeyError:
+        return False
+
+
+def load(dataset_id, names=None, columns=None):
+    """
+    {nome: DataFrame} das planilhas pedidas (todas se names for None), na ordem do
+    dataset. columns ({nome: colunas}) limita as colunas lidas das planilhas citadas.
+    """
+    pasta = _dir(dataset_id)
+    manifesto = _read_manifest(pasta)
+    _touch(pasta)
+    columns = columns or {}
+    return {nome: _read_sheet(os.path.join(pasta, arquivo), columns.get(nome)) for nome, arquivo in manifesto['sheets']
+            if names is None or nome in names}
+
+
+def save(dataset_id, sheets):
+    """Substitui planilhas ({nome: DataFrame}) de um dataset existente; as demais não são regravadas."""
+    pasta = _dir(dataset_id)
+    manifesto = _read_manifest(pasta)
+    arquivos = dict(manifesto['sheets'])
+    novos = {}
+    for nome, df in sheets.items():
+        base = os.path.splitext(arquivos[nome])[0] if nome in arquivos else f'sheet{len(arquivos) + len(novos)}'
+        novos[nome] = _write_sheet(pasta, base, df)
+    manifesto['sheets'] = [[nome, novos.get(nome, arquivo)] for nome, arquivo in manifesto['sheets']]
+    manifesto['sheets'] += [[nome, arquivo] for nome, arquivo in novos.items() if nome not in arquivos]
+    _write_manifest(pasta, manifesto)
+    # Planilha que mudou de formato (Arrow <-> pickle): o arquivo antigo sai depois do manifesto novo
+    for nome, arquivo in novos.items():
+        if arquivos.get(nome) not in (None, arquivo):
+            os.remove(os.path.join(pasta, arquivos[nome]))
+
+
+def delete(dataset_id):
+    try:
+        shutil.rmtree(_dir(dataset_id), ignore_errors=True)
+    except KeyError:
+        pass
+
+
+def _touch(pasta):
+    manifesto = os.path.join(pasta, MANIFEST)
+    try:
+        if time.time() - os.path.getmtime(manifesto) >= TOUCH_INTERVAL:
+            os.utime(manifesto)
+    except FileNotFoundError:
+        pass
+
+
+def remove_expired(max_age):
+    """Remove os datasets não acessados há mais que max_age segundos. Retorna quantos foram removidos."""
+    raiz = datasets_root()
+    if not os.path.isdir(raiz):
+        return 0
+    limite = time.time() - max_age
+    removidos = 0
+    for entrada in os.scandir(raiz):
+        if not entrada.is_dir():
+            continue
+        manifesto = os.path.join(entrada.path, MANIFEST)
+        try:
+            # Sem manifesto: criação interrompida; vale o mtime do diretório
+            mtime = os.path.getmtime(manifesto) if os.path.exists(manifesto) else entrada.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if mtime < limite:
+            shutil.rmtree(entrada.path, ignore_errors=True)
+            removidos += 1
+    return removidos
@@ -0,0 +1,246 @@
+import io
+import logging
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlencode, urlsplit
+from Bio import Entrez
+from django.conf import settings
+from . import gene_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: o limite vale só para o processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Segundos de espera máxima por uma resposta do Entrez
+TIMEOUT = 60
+# Novas tentativas de uma requisição que falhou (rede, 429 ou 5xx) e a espera antes
+# da primeira delas, dobrada a cada tentativa
+RETRIES = 3
+BACKOFF = 1.0
+# Requisições por segundo aceitas pelo NCBI sem e com chave de API
+RATE_LIMIT = 3
+RATE_LIMIT_API_KEY = 10
+
+
+def requests_per_second():
+    """Ritmo das requisições: 1 / ENTREZ_DELAY, limitado ao máximo do NCBI para a chave configurada."""
+    limite = RATE_LIMIT_API_KEY if settings.ENTREZ_API_KEY else RATE_LIMIT
+    return min(limite, 1 / settings.ENTREZ_DELAY) if settings.ENTREZ_DELAY > 0 else limite
+
+
+class RateLimiter:
+    """
+    Balde de fichas de capacidade 1 compartilhado por todos os processos de uma
+    instalação: o horário da próxima ficha livre fica em um arquivo (8 bytes) sob
+    flock, e cada requisição reserva a sua vaga antes de dormir até ela, sem segurar
+    o lock. Threads e processos juntos não passam de requests_per_second().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._proximo = 0.0
+
+    def _reserve(self, intervalo):
+        agora = time.time()
+        if fcntl is None:
+            with self._lock:
+                vaga = max(agora, self._proximo)
+                self._proximo = vaga + intervalo
+            return vaga - agora
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            dados = os.pread(fd, 8, 0)
+            proximo = struct.unpack('<d', dados)[0] if len(dados) == 8 else 0.0
+            # Um horário muito adiante (relógio ajustado) não bloqueia as requisições
+            vaga = agora if proximo > agora + 60 else max(agora, proximo)
+            os.pwrite(fd, struct.pack('<d', vaga + intervalo), 0)
+        finally:
+            os.close(fd)  # Libera o flock
+        return vaga - agora
+
+    def acquire(self):
+        espera = self._reserve(1 / requests_per_second())
+        if espera > 0:
+            time.sleep(espera)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def limiter():
+    """RateLimiter de ENTREZ_RATE_LIMIT_FILE (recriado se o caminho mudar)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None or _limiter.path != str(settings.ENTREZ_RATE_LIMIT_FILE):
+            _limiter = RateLimiter(str(settings.ENTREZ_RATE_LIMIT_FILE))
+        return _limiter
+
+
+# Conexões HTTP ociosas por (esquema, host), reaproveitadas entre requisições e threads
+_conexoes = {}
+_conexoes_lock = threading.Lock()
+
+
+def _connection(chave, nova=False):
+    """(conexão, reaproveitada): uma conexão ociosa do pool ou, se não houver (ou nova=True), uma nova."""
+    with _conexoes_lock:
+        livres = _conexoes.get(chave)
+        if livres and not nova:
+            return livres.pop(), True
+    esquema, host = chave
+    return (HTTPSConnection if esquema == 'https' else HTTPConnection)(host, timeout=TIMEOUT), False
+
+
+def _release(chave, conexao):
+    with _conexoes_lock:
+        _conexoes.setdefault(chave, []).append(conexao)
+
+
+class EntrezError(Exception):
+    """Resposta HTTP de erro do Entrez; retryable indica se vale tentar de novo."""
+
+    def __init__(self, status, motivo, retry_after=None):
+        super().__init__(f'HTTP {status} {motivo}')
+        self.retryable = status == 429 or status >= 500
+        self.retry_after = retry_after
+
+
+def _request(chave, caminho, corpo, nova=False):
+    conexao, reaproveitada = _connection(chave, nova)
+    try:
+        conexao.request('POST', caminho, body=corpo,
+                        headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        resposta = conexao.getresponse()
+        dados = resposta.read()
+    except (OSError, HTTPException):
+        conexao.close()
+        if not reaproveitada:
+            raise
+        # Conexão ociosa já fechada pelo servidor: repete uma vez em uma conexão nova
+        return _request(chave, caminho, corpo, nova=True)
+    if resposta.will_close:
+        conexao.close()
+    else:
+        _release(chave, conexao)
+    if resposta.status != 200:
+        retry_after = resposta.getheader('Retry-After')
+        raise EntrezError(resposta.status, resposta.reason,
+                          float(retry_after) if retry_after and retry_after.isdigit() else None)
+    return dados
+
+
+def _post(utility, params):
+    """
+    POST de um E-utility (elink, esummary...) em ENTREZ_BASE_URL, no ritmo do
+    RateLimiter e por uma conexão reaproveitada; falhas de rede, 429 e 5xx são
+    repetidas até RETRIES vezes com espera crescente. Retorna o registro lido pelo
+    Bio.Entrez.
+    """
+    params = dict(params, tool='missense', email=settings.ENTREZ_EMAIL)
+    if settings.ENTREZ_API_KEY:
+        params['api_key'] = settings.ENTREZ_API_KEY
+    url = urlsplit(f"{settings.ENTREZ_BASE_URL.rstrip('/')}/{utility}.fcgi")
+    chave = (url.scheme, url.netloc)
+    # doseq: uma lista em 'id' vira vários parâmetros id=, como no elink do Biopython
+    corpo = urlencode(params, doseq=True).encode('utf-8')
+    for tentativa in range(RETRIES + 1):
+        limiter().acquire()
+        try:
+            dados = _request(chave, url.path, corpo)
+        except (OSError, HTTPException, EntrezError) as e:
+            if tentativa == RETRIES or isinstance(e, EntrezError) and not e.retryable:
+                raise
+            time.sleep(getattr(e, 'retry_after', None) or BACKOFF * 2 ** tentativa)
+            continue
+        return Entrez.read(io.BytesIO(dados))
+
+
+def link_genes(protein_ids):
+    """
+    {ID da proteína: ID do gene ou None} em uma única chamada ao elink. Cada ID vai
+    em um parâmetro id= próprio, de modo que a resposta tem um LinkSet por proteína,
+    na ordem enviada.
+    """
+    registro = _post('elink', {'dbfrom': 'protein', 'db': 'gene', 'id': list(protein_ids)})
+    genes = {}
+    if len(registro) == len(protein_ids):
+        pares = zip(protein_ids, registro)
+    else:
+        # Resposta sem um LinkSet por ID (IDs inválidos descartados): casa pelo IdList
+        pares = ((str(link_set['IdList'][0]), link_set) for link_set in registro if link_set.get('IdList'))
+    for protein_id, link_set in pares:
+        links = link_set.get('LinkSetDb') or []
+        genes[protein_id] = str(links[0]['Link'][0]['Id']) if links and links[0]['Link'] else None
+    return genes
+
+
+def gene_symbols(gene_ids):
+    """{ID do gene: símbolo} em uma única chamada ao esummary."""
+    registro = _post('esummary', {'db': 'gene', 'id': ','.join(gene_ids)})
+    simbolos = {}
+    if isinstance(registro, dict) and 'DocumentSummarySet' in registro:
+        # Formato 2.0 do esummary
+        for resumo in registro['DocumentSummarySet']['DocumentSummary']:
+            simbolos[str(resumo.attributes['uid'])] = str(resumo['Name'])
+    else:
+        for resumo in registro:
+            simbolos[str(resumo['Id'])] = str(resumo['Name'])
+    return simbolos
+
+
+def resolve_batch(protein_ids):
+    """
+    {ID: símbolo ou None (sem gene)} de um lote de IDs, com um elink e um esummary.
+    IDs sem resposta do Entrez ficam de fora.
+    """
+    genes = link_genes(protein_ids)
+    ids_genes = sorted({gene_id for gene_id in genes.values() if gene_id})
+    nomes = gene_symbols(ids_genes) if ids_genes else {}
+    resolvidos = {}
+    for protein_id in protein_ids:
+        gene_id = genes.get(protein_id)
+        if protein_id in genes and (gene_id is None or gene_id in nomes):
+            resolvidos[protein_id] = nomes[gene_id] if gene_id else None
+    return resolvidos
+
+
+def resolve_gene_symbols(protein_ids):
+    """
+    Símbolos dos genes de vários IDs de proteína: {ID: símbolo ou None}. Usa o cache
+    de símbolos e resolve os demais em lotes de ENTREZ_BATCH_SIZE IDs, até
+    ENTREZ_WORKERS lotes ao mesmo tempo (o RateLimiter mantém o ritmo permitido),
+    guardando os resultados no cache. IDs de um lote que falhou ou sem resposta
+    ficam None e não entram no cache.
+    """
+    protein_ids = list(dict.fromkeys(str(protein_id) for protein_id in protein_ids))
+    simbolos = gene_cache.lookup_many(protein_ids)
+    faltam = [protein_id for protein_id in protein_ids if protein_id not in simbolos]
+    if not faltam:
+        return simbolos
+    tamanho = max(1, settings.ENTREZ_BATCH_SIZE)
+    lotes = [faltam[inicio:inicio + tamanho] for inicio in range(0, len(faltam), tamanho)]
+    resolvidos = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.ENTREZ_WORKERS, len(lotes)))) as executor:
+        futuros = {executor.submit(resolve_batch, lote): lote for lote in lotes}
+        for futuro in as_completed(futuros):
+            try:
+                resolvidos.update(futuro.result())
+            except Exception as e:
+                logger.warning("Não foi possível obter genes para %d IDs: %s", len(futuros[futuro]), e)
+    # O cache (banco) é gravado só nesta thread
+    gene_cache.store_many(resolvidos)
+    simbolos.update(resolvidos)
+    for protein_id in faltam:
+        simbolos.setdefault(protein_id, None)
+    return simbolos
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import GeneSymbolCacheEntry
+
+# Retorno de lookup() para um ID sem entrada válida no cache
+MISS = object()
+# IDs por consulta em lookup_many
+LOOKUP_BATCH = 500
+
+
+def _ttl(symbol):
+    dias = settings.GENE_SYMBOL_CACHE_TTL_DAYS if symbol else settings.GENE_SYMBOL_NEGATIVE_TTL_DAYS
+    return timedelta(days=dias)
+
+
+def enabled():
+    return settings.GENE_SYMBOL_CACHE_TTL_DAYS > 0
+
+
+def lookup(accession):
+    """
+    Símbolo do gene guardado para o ID: o símbolo, None se o Entrez já respondeu que
+    não há gene (cache negativo, com validade GENE_SYMBOL_NEGATIVE_TTL_DAYS) ou MISS
+    se o ID não está no cache ou a entrada expirou.
+    """
+    if not enabled():
+        return MISS
+    entrada = GeneSymbolCacheEntry.objects.filter(pk=accession).first()
+    if entrada is None or timezone.now() - entrada.fetched_at > _ttl(entrada.symbol):
+        return MISS
+    return entrada.symbol or None
+
+
+def lookup_many(accessions):
+    """Entradas válidas de vários IDs de uma vez: {ID: símbolo ou None (sem gene)}; IDs ausentes ficam de fora."""
+    if not enabled():
+        return {}
+    agora = timezone.now()
+    accessions = list(accessions)
+    encontrados = {}
+    # Em lotes, abaixo do limite de parâmetros por consulta do SQLite
+    for inicio in range(0, len(accessions), LOOKUP_BATCH):
+        for entrada in GeneSymbolCacheEntry.objects.filter(pk__in=accessions[inicio:inicio + LOOKUP_BATCH]):
+            if agora - entrada.fetched_at <= _ttl(entrada.symbol):
+                encontrados[entrada.accession] = entrada.symbol or None
+    return encontrados
+
+
+def store(accession, symbol):
+    """Guarda o resultado de uma consulta ao Entrez (symbol None = sem gene)."""
+    if not enabled():
+        return
+    GeneSymbolCacheEntry.objects.update_or_create(
+        pk=accession, defaults={'symbol': symbol or '', 'fetched_at': timezone.now()})
+
+
+def store_many(simbolos):
+    """Guarda de uma vez vários resultados ({ID: símbolo ou None})."""
+    if not enabled() or not simbolos:
+        return
+    agora = timezone.now()
+    GeneSymbolCacheEntry.objects.bulk_create(
+        [GeneSymbolCacheEntry(accession=accession, symbol=symbol or '', fetched_at=agora)
+         for accession, symbol in simbolos.items()],
+        batch_size=LOOKUP_BATCH, update_conflicts=True, unique_fields=['accession'],
+        update_fields=['symbol', 'fetched_at'])
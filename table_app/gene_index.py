@@ -0,0 +1,112 @@
+import bz2
+import gzip
+from django.db import transaction
+from .models import ProteinGene
+
+# Colunas (a partir de 0) dos arquivos do NCBI (ftp.ncbi.nlm.nih.gov/gene/DATA)
+GENE_INFO_SYMBOL = 2
+GENE2REFSEQ_PROTEIN = 5
+GENE2REFSEQ_PROTEIN_GI = 6
+GENE2REFSEQ_SYMBOL = 15
+# Táxon padrão da importação (Homo sapiens), o mesmo do proteoma de referência
+DEFAULT_TAX_ID = 9606
+# Linhas por INSERT na importação e IDs por consulta em lookup_many
+INSERT_BATCH = 5000
+LOOKUP_BATCH = 500
+
+
+def protein_key(protein_id):
+    """Chave do índice para um ID de proteína: o GI como está, o acesso sem a versão."""
+    protein_id = str(protein_id).strip()
+    return protein_id if protein_id.isdigit() else protein_id.split('.')[0]
+
+
+def _abrir(caminho):
+    """Abre um arquivo do NCBI em modo texto, descomprimindo gzip ou bz2 (detectados pelo conteúdo)."""
+    with open(caminho, 'rb') as f:
+        inicio = f.read(3)
+    if inicio.startswith(b'\x1f\x8b'):
+        return gzip.open(caminho, 'rt')
+    if inicio == b'BZh':
+        return bz2.open(caminho, 'rt')
+    return open(caminho, 'r')
+
+
+def _linhas(caminho, tax_ids):
+    """Campos das linhas de um arquivo do NCBI (comprimido ou não), só dos táxons pedidos (None = todos)."""
+    prefixos = tuple(f'{tax_id}\t' for tax_id in tax_ids) if tax_ids else None
+    with _abrir(caminho) as f:
+        for lin in f:
+            if lin.startswith('#') or prefixos and not lin.startswith(prefixos):
+                continue
+            yield lin.rstrip('\r\n').split('\t')
+
+
+def read_gene_info(caminho, tax_ids=None):
+    """{GeneID: símbolo} do gene_info."""
+    simbolos = {}
+    for campos in _linhas(caminho, tax_ids):
+        if len(campos) > GENE_INFO_SYMBOL and campos[GENE_INFO_SYMBOL] not in ('', '-'):
+            simbolos[int(campos[1])] = campos[GENE_INFO_SYMBOL]
+    return simbolos
+
+
+def read_gene2refseq(caminho, simbolos, tax_ids=None):
+    """
+    Entradas (chave, GeneID, símbolo, táxon) do gene2refseq: cada proteína pelo GI e
+    pelo acesso sem versão. O símbolo vem do gene_info (simbolos) ou, se o gene não
+    estiver lá, da coluna Symbol das versões mais novas do gene2refseq; linhas sem
+    proteína ou sem símbolo são ignoradas.
+    """
+    for campos in _linhas(caminho, tax_ids):
+        if len(campos) <= GENE2REFSEQ_PROTEIN_GI or campos[GENE2REFSEQ_PROTEIN] == '-':
+            continue
+        gene_id = int(campos[1])
+        simbolo = simbolos.get(gene_id)
+        if simbolo is None and len(campos) > GENE2REFSEQ_SYMBOL and campos[GENE2REFSEQ_SYMBOL] not in ('', '-'):
+            simbolo = campos[GENE2REFSEQ_SYMBOL]
+        if simbolo is None:
+            continue
+        tax_id = int(campos[0])
+        yield protein_key(campos[GENE2REFSEQ_PROTEIN]), gene_id, simbolo, tax_id
+        if campos[GENE2REFSEQ_PROTEIN_GI].isdigit():
+            yield campos[GENE2REFSEQ_PROTEIN_GI], gene_id, simbolo, tax_id
+
+
+def build_index(gene2refseq, gene_info, tax_ids=None):
+    """
+    Recria o índice local dos táxons pedidos (None = todos, apagando o índice inteiro)
+    em uma única transação, de modo que as consultas veem o índice antigo até o fim da
+    importação. Uma proteína repetida no gene2refseq (uma linha por montagem do genoma)
+    fica com a primeira entrada. Retorna o número de chaves gravadas.
+    """
+    simbolos = read_gene_info(gene_info, tax_ids)
+    with transaction.atomic():
+        antigas = ProteinGene.objects.filter(tax_id__in=tax_ids) if tax_ids else ProteinGene.objects.all()
+        antigas.delete()
+        lote = {}
+        for chave, gene_id, simbolo, tax_id in read_gene2refseq(gene2refseq, simbolos, tax_ids):
+            if chave not in lote:
+                lote[chave] = ProteinGene(protein=chave, gene_id=gene_id, symbol=simbolo, tax_id=tax_id)
+            if len(lote) >= INSERT_BATCH:
+                ProteinGene.objects.bulk_create(lote.values(), ignore_conflicts=True)
+                lote = {}
+        ProteinGene.objects.bulk_create(lote.values(), ignore_conflicts=True)
+        atuais = ProteinGene.objects.filter(tax_id__in=tax_ids) if tax_ids else ProteinGene.objects.all()
+        return atuais.count()
+
+
+def lookup_many(protein_ids):
+    """Símbolos de vários IDs de proteína pelo índice local: {ID: símbolo ou None}, sem acesso à rede."""
+    chaves = {}
+    for protein_id in protein_ids:
+        chaves.setdefault(protein_key(protein_id), []).append(protein_id)
+    simbolos = {protein_id: None for ids in chaves.values() for protein_id in ids}
+    lista = list(chaves)
+    # Em lotes, abaixo do limite de parâmetros por consulta do SQLite
+    for inicio in range(0, len(lista), LOOKUP_BATCH):
+        for chave, simbolo in ProteinGene.objects.filter(pk__in=lista[inicio:inicio + LOOKUP_BATCH]).values_list(
+                'protein', 'symbol'):
+            for protein_id in chaves[chave]:
+                simbolos[protein_id] = simbolo
+    return simbolos
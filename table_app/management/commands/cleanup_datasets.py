@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from table_app import datasets
+
+class Command(BaseCommand):
+    help = 'Remove as planilhas carregadas no visualizador de tabelas (media/datasets) não acessadas há algum tempo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help='Remover datasets não acessados há mais que este número de dias '
+                                 '(padrão: a validade da sessão, SESSION_COOKIE_AGE)')
+
+    def handle(self, *args, **options):
+        dias = options['days'] if options['days'] is not None else settings.SESSION_COOKIE_AGE / 86400
+        try:
+            removidos = datasets.remove_expired(dias * 86400)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erro na limpeza de {datasets.datasets_root()}: {str(e)}'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Removidos {removidos} datasets'))
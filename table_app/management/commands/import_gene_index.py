@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+import time
+from table_app.gene_index import DEFAULT_TAX_ID, build_index
+
+class Command(BaseCommand):
+    help = 'Importa o gene2refseq e o gene_info do NCBI para o índice local de genes (GENE_ANNOTATION_BACKEND=local)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('gene2refseq', help='Arquivo gene2refseq (ou gene2refseq.gz)')
+        parser.add_argument('gene_info', help='Arquivo gene_info (ou gene_info.gz / Homo_sapiens.gene_info.gz)')
+        parser.add_argument('--tax-id', type=int, action='append', dest='tax_ids',
+                            help=f'Táxon a importar; pode ser repetido (padrão: {DEFAULT_TAX_ID})')
+        parser.add_argument('--all-taxa', action='store_true', help='Importar todos os táxons (recria o índice inteiro)')
+    
+    def handle(self, *args, **options):
+        for caminho in (options['gene2refseq'], options['gene_info']):
+            if not os.path.exists(caminho):
+                raise CommandError(f'Arquivo {caminho} não encontrado')
+        if options['all_taxa'] and options['tax_ids']:
+            raise CommandError('Use --tax-id ou --all-taxa, não os dois')
+        tax_ids = None if options['all_taxa'] else options['tax_ids'] or [DEFAULT_TAX_ID]
+        
+        inicio = time.perf_counter()
+        try:
+            total = build_index(options['gene2refseq'], options['gene_info'], tax_ids)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Erro na importação: {e}')
+        if not total:
+            self.stdout.write(self.style.WARNING('Nenhuma proteína com gene encontrada nos arquivos para os táxons pedidos'))
+        taxons = 'todos os táxons' if tax_ids is None else 'táxon ' + ', '.join(map(str, tax_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice de genes com {total} chaves de proteína ({taxons}) em {time.perf_counter() - inicio:.2f}s'))
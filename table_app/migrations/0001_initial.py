@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneSymbolCacheEntry',
+            fields=[
+                ('accession', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('symbol', models.CharField(blank=True, max_length=64)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
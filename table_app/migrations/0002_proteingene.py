@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('table_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProteinGene',
+            fields=[
+                ('protein', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('gene_id', models.PositiveIntegerField()),
+                ('symbol', models.CharField(max_length=64)),
+                ('tax_id', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -1,3 +1,28 @@
 from django.db import models
 
 # Create your models here.
+
+class GeneSymbolCacheEntry(models.Model):
+    """Símbolo do gene de um ID de proteína (GI ou acesso) obtido do Entrez; symbol vazio = sem gene."""
+
+    accession = models.CharField(max_length=64, primary_key=True)
+    symbol = models.CharField(max_length=64, blank=True)
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.accession} -> {self.symbol or "(no gene)"}'
+
+
+class ProteinGene(models.Model):
+    """
+    Gene de uma proteína no índice local montado a partir do gene2refseq e do gene_info
+    do NCBI. Cada proteína entra pelo GI e pelo acesso sem versão ('NP_000005').
+    """
+
+    protein = models.CharField(max_length=32, primary_key=True)
+    gene_id = models.PositiveIntegerField()
+    symbol = models.CharField(max_length=64)
+    tax_id = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f'{self.protein} -> {self.symbol}'
@@ -1,4 +1,195 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+import pandas as pd
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import datasets, entrez, gene_cache
 
-# Create your tests here.
+ELINK = ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+         '<!DOCTYPE eLinkResult PUBLIC "-//NLM//DTD elink 20101123//EN" '
+         '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20101123/elink.dtd">\n'
+         '<eLinkResult>{}</eLinkResult>')
+ESUMMARY = ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+            '<!DOCTYPE eSummaryResult PUBLIC "-//NLM//DTD esummary v1 20041029//EN" '
+            '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20041029/esummary-v1.dtd">\n'
+            '<eSummaryResult>{}</eSummaryResult>')
 
+
+def gene_of(protein_id):
+    """Gene do ID no servidor de teste: IDs terminados em 0 não têm gene."""
+    return None if protein_id.endswith('0') else str(500000 + int(protein_id))
+
+
+class FakeEntrez(BaseHTTPRequestHandler):
+    """
+    elink e esummary mínimos no formato do NCBI. As requisições recebidas ficam em
+    calls ((utility, parâmetros)); as próximas len(failures) respondem com os status
+    da lista.
+    """
+    protocol_version = 'HTTP/1.1'
+    calls = []
+    failures = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, corpo=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        utility = self.path.rsplit('/', 1)[-1].split('.')[0]
+        self.calls.append((utility, params))
+        if self.failures:
+            return self._reply(self.failures.pop(0))
+        if utility == 'elink':
+            link_sets = []
+            for protein_id in params['id']:
+                gene_id = gene_of(protein_id)
+                links = (f'<LinkSetDb><DbTo>gene</DbTo><LinkName>protein_gene</LinkName>'
+                         f'<Link><Id>{gene_id}</Id></Link></LinkSetDb>' if gene_id else '')
+                link_sets.append(f'<LinkSet><DbFrom>protein</DbFrom><IdList><Id>{protein_id}</Id></IdList>'
+                                 f'{links}</LinkSet>')
+            corpo = ELINK.format(''.join(link_sets))
+        else:
+            corpo = ESUMMARY.format(''.join(f'<DocSum><Id>{gene_id}</Id><Item Name="Name" Type="String">'
+                                            f'SYM{gene_id}</Item></DocSum>' for gene_id in params['id'][0].split(',')))
+        self._reply(200, corpo.encode('utf-8'))
+
+
+class EntrezTests(TestCase):
+    """resolve_gene_symbols contra um servidor local no lugar do NCBI (ENTREZ_BASE_URL)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeEntrez)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.tmp = tempfile.mkdtemp(prefix='entrez-tests-')
+        cls.settings = override_settings(
+            ENTREZ_BASE_URL=f'http://127.0.0.1:{cls.server.server_address[1]}/entrez/eutils/',
+            ENTREZ_RATE_LIMIT_FILE=f'{cls.tmp}/entrez.ratelimit', ENTREZ_BATCH_SIZE=20, ENTREZ_WORKERS=3,
+            ENTREZ_API_KEY='', ENTREZ_DELAY=0.001, GENE_SYMBOL_CACHE_TTL_DAYS=30, GENE_SYMBOL_NEGATIVE_TTL_DAYS=7)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeEntrez.calls.clear()
+        FakeEntrez.failures.clear()
+        # Sem as esperas do limite de requisições e entre tentativas
+        for nome, valor in (('RATE_LIMIT', 1000), ('BACKOFF', 0.001)):
+            patcher = mock.patch.object(entrez, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def calls(self, utility):
+        return [params for nome, params in FakeEntrez.calls if nome == utility]
+
+    def expected(self, protein_ids):
+        return {protein_id: f'SYM{gene_of(protein_id)}' if gene_of(protein_id) else None
+                for protein_id in protein_ids}
+
+    def test_batches(self):
+        ids = [str(n) for n in range(1, 46)]
+        self.assertEqual(entrez.resolve_gene_symbols(ids + ids[:5]), self.expected(ids))
+        elinks = self.calls('elink')
+        # Lotes de ENTREZ_BATCH_SIZE, com um parâmetro id= por proteína
+        self.assertEqual(sorted(len(params['id']) for params in elinks), [5, 20, 20])
+        self.assertEqual(sorted(i for params in elinks for i in params['id']), sorted(ids))
+        self.assertEqual(len(self.calls('esummary')), 3)
+        for params in self.calls('esummary'):
+            self.assertEqual(len(params['id']), 1)
+        for params in elinks:
+            self.assertEqual((params['dbfrom'], params['db']), (['protein'], ['gene']))
+
+    def test_retries_rate_limit_and_server_errors(self):
+        FakeEntrez.failures.extend([429, 503, 500])
+        with override_settings(ENTREZ_WORKERS=1):
+            self.assertEqual(entrez.resolve_gene_symbols(['11', '20']), self.expected(['11', '20']))
+        self.assertEqual(len(FakeEntrez.calls), 5)
+
+    def test_client_errors_are_not_retried(self):
+        FakeEntrez.failures.append(400)
+        with self.assertLogs('table_app.entrez', 'WARNING'):
+            self.assertEqual(entrez.resolve_gene_symbols(['11']), {'11': None})
+        self.assertEqual(len(FakeEntrez.calls), 1)
+
+    def test_failed_batch_is_not_cached(self):
+        FakeEntrez.failures.extend([503] * (entrez.RETRIES + 1))
+        with self.assertLogs('table_app.entrez', 'WARNING') as logs:
+            self.assertEqual(entrez.resolve_gene_symbols(['11', '12']), {'11': None, '12': None})
+        self.assertIn('2 IDs', logs.output[0])
+        self.assertEqual(gene_cache.lookup_many(['11', '12']), {})
+        self.assertEqual(entrez.resolve_gene_symbols(['11', '12']), self.expected(['11', '12']))
+
+    def test_negative_cache(self):
+        self.assertEqual(entrez.resolve_gene_symbols(['11', '20']), {'11': 'SYM500011', '20': None})
+        self.assertEqual(gene_cache.lookup_many(['11', '20']), {'11': 'SYM500011', '20': None})
+        # "Sem gene" também vem do cache enquanto vale
+        FakeEntrez.calls.clear()
+        self.assertEqual(entrez.resolve_gene_symbols(['11', '20']), {'11': 'SYM500011', '20': None})
+        self.assertEqual(FakeEntrez.calls, [])
+        # Expirada só a validade negativa, apenas o ID sem gene é consultado de novo
+        with override_settings(GENE_SYMBOL_NEGATIVE_TTL_DAYS=0):
+            self.assertEqual(entrez.resolve_gene_symbols(['11', '20']), {'11': 'SYM500011', '20': None})
+        self.assertEqual([params['id'] for params in self.calls('elink')], [['20']])
+        self.assertEqual(self.calls('esummary'), [])
+
+
+class DatasetViewTests(TestCase):
+    """Os filtros leem só as planilhas e colunas necessárias e devolvem só as planilhas alteradas."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp(prefix='dataset-tests-')
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        configuracoes = override_settings(MEDIA_ROOT=tmp)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+        self.dataset_id = datasets.create({
+            'proteins': pd.DataFrame({'Locus': ['P1', 'contaminant_K1'], 'Score': [1.0, 2.0]}),
+            'peptides': pd.DataFrame({'PeptideSequence': ['AAK', 'CCR'], 'TheProteinLocci': ['P1', 'contaminant_K1'],
+                                      'Score': [3.0, 4.0]}),
+            'scans': pd.DataFrame({'PeptideSequence': ['AAK', 'CCR', 'AAK'], 'ScanNumber': [1, 2, 3]}),
+        })
+        session = self.client.session
+        session['dataset_id'] = self.dataset_id
+        session.save()
+
+    def post(self, nome, **corpo):
+        return self.client.post(reverse(f'table_app:{nome}'), json.dumps(corpo), content_type='application/json').json()
+
+    def test_load_columns(self):
+        data = datasets.load(self.dataset_id, ['peptides'], {'peptides': ['TheProteinLocci', 'Missing']})
+        self.assertEqual(list(data), ['peptides'])
+        self.assertEqual(data['peptides'].columns.tolist(), ['TheProteinLocci'])
+
+    def test_remove_contaminants_returns_changed_sheets(self):
+        resposta = self.post('remove_contaminants', sheets=['scans'])
+        self.assertEqual(list(resposta['data']), ['scans'])
+        self.assertEqual(resposta['data']['scans']['data'], [{'PeptideSequence': 'AAK', 'ScanNumber': 1},
+                                                             {'PeptideSequence': 'AAK', 'ScanNumber': 3}])
+        # A planilha de peptides, lida só em parte para o mapa, não é regravada
+        self.assertEqual(datasets.load(self.dataset_id, ['peptides'])['peptides'].columns.tolist(),
+                         ['PeptideSequence', 'TheProteinLocci', 'Score'])
+
+    def test_add_protein_id_returns_scans_only(self):
+        resposta = self.post('add_protein_id')
+        self.assertEqual(list(resposta['data']), ['scans'])
+        self.assertEqual(resposta['data']['scans']['columns'], ['PeptideSequence', 'ScanNumber', 'TheProteinLocci'])
+        self.assertEqual(self.post('add_protein_id')['data'], {})
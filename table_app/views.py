@@ -1,6 +1,7 @@
 import json
+import logging
 import os
-import time
+import numpy as np
 import pandas as pd
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponse
@@ -9,16 +10,62 @@ from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from Bio import Entrez
 import io
+from . import datasets, gene_cache, gene_index
+from .entrez import resolve_batch, resolve_gene_symbols
 
-# Configure Entrez email
-Entrez.email = "giujjia@gmail.com"
+logger = logging.getLogger(__name__)
 
 def table_viewer(request):
     """Renders the main table viewer page"""
     return render(request, 'table.html')
 
+def sheet_payload(df):
+    """Planilha no formato das respostas JSON: colunas e linhas, com células vazias como ''"""
+    return {'columns': df.columns.tolist(), 'data': df.fillna('').to_dict('records')}
+
+def workbook_payload(sheets):
+    return {sheet_name: sheet_payload(df) for sheet_name, df in sheets.items()}
+
+# Colunas de peptides usadas no mapa PeptideSequence -> TheProteinLocci dos scans
+PEPTIDE_MAP_COLUMNS = ['PeptideSequence', 'TheProteinLocci']
+
+def load_selected(dataset_id, selected_sheets):
+    """
+    Lê só as planilhas selecionadas (inteiras, pois podem ser regravadas) e, com scans
+    selecionada, as colunas de peptides usadas no mapa dos scans
+    """
+    nomes = set(selected_sheets)
+    colunas = {}
+    if 'scans' in nomes and 'peptides' not in nomes:
+        nomes.add('peptides')
+        colunas['peptides'] = PEPTIDE_MAP_COLUMNS
+    return datasets.load(dataset_id, nomes, colunas)
+
+def set_dataset(request, sheets):
+    """
+    Grava as planilhas ({nome: DataFrame}) no dataset store e guarda só o ID na sessão;
+    o dataset anterior da sessão é removido
+    """
+    anterior = request.session.get('dataset_id')
+    dataset_id = datasets.create(sheets)
+    request.session['dataset_id'] = dataset_id
+    if anterior:
+        datasets.delete(anterior)
+    return dataset_id
+
+def current_dataset(request):
+    """ID do dataset da sessão (None se não há dados carregados)"""
+    dataset_id = request.session.get('dataset_id')
+    if dataset_id and datasets.exists(dataset_id):
+        return dataset_id
+    if 'current_data' in request.session:
+        # Sessão criada antes do dataset store: os registros passam para o store
+        antigos = request.session.pop('current_data')
+        return set_dataset(request, {sheet_name: pd.DataFrame(sheet['data'], columns=sheet['columns'])
+                                     for sheet_name, sheet in antigos.items()})
+    return None
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def upload_data(request):
@@ -43,21 +90,13 @@ def upload_data(request):
                 if sheet not in sheets_data:
                     return JsonResponse({'error': f'Missing required sheet: {sheet}'}, status=400)
             
-            # Convert to JSON format
-            result = {}
-            for sheet_name, df in sheets_data.items():
-                # Convert DataFrame to dict with proper handling of NaN values
-                result[sheet_name.lower()] = {
-                    'columns': df.columns.tolist(),
-                    'data': df.fillna('').to_dict('records')
-                }
-            
-            # Store in session for later use
-            request.session['current_data'] = result
+            # Store the workbook once on disk; the session keeps only its ID
+            sheets = {sheet_name.lower(): df for sheet_name, df in sheets_data.items()}
+            set_dataset(request, sheets)
             
             return JsonResponse({
                 'success': True,
-                'data': result
+                'data': workbook_payload(sheets)
             })
             
         finally:
@@ -86,62 +125,89 @@ def load_example_data(request):
         # Load Excel file
         sheets_data = pd.read_excel(example_path, sheet_name=None)
         
-        # Convert to JSON format
-        result = {}
-        for sheet_name, df in sheets_data.items():
-            result[sheet_name.lower()] = {
-                'columns': df.columns.tolist(), 
-                'data': df.fillna('').to_dict('records')
-            }
-        
-        # Store in session
-        request.session['current_data'] = result
+        # Store in the dataset store
+        sheets = {sheet_name.lower(): df for sheet_name, df in sheets_data.items()}
+        set_dataset(request, sheets)
         
         return JsonResponse({
             'success': True,
-            'data': result
+            'data': workbook_payload(sheets)
         })
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-def get_gene_symbol_from_gi(gi_id, delay=0.34):
-    """Get gene symbol from GI ID using Entrez"""
-    try:
-        handle = Entrez.elink(dbfrom="protein", db="gene", id=gi_id)
-        record = Entrez.read(handle)
-        handle.close()
-
-        if not record[0]["LinkSetDb"]:
-            return None
-        gene_id = record[0]["LinkSetDb"][0]["Link"][0]["Id"]
+def fetch_gene_symbol(gi_id):
+    """Query Entrez for the gene symbol of a GI ID (None if the protein has no linked gene)"""
+    resolvidos = resolve_batch([gi_id])
+    if gi_id not in resolvidos:
+        raise LookupError(f"sem resposta do Entrez para {gi_id}")
+    return resolvidos[gi_id]
 
-        time.sleep(delay)
-        handle = Entrez.efetch(db="gene", id=gene_id, rettype="xml")
-        gene_record = Entrez.read(handle)
-        handle.close()
-
-        gene_info = gene_record[0]
-        gene_symbol = gene_info["Entrezgene_gene"]["Gene-ref"]["Gene-ref_locus"]
+def get_gene_symbol_from_gi(gi_id):
+    """Get gene symbol from GI ID, from the local index, the local cache or else from Entrez"""
+    if settings.GENE_ANNOTATION_BACKEND == 'local':
+        return gene_index.lookup_many([gi_id])[gi_id]
+    gene_symbol = gene_cache.lookup(gi_id)
+    if gene_symbol is not gene_cache.MISS:
         return gene_symbol
-
+    try:
+        gene_symbol = fetch_gene_symbol(gi_id)
     except Exception as e:
-        print(f"[WARN] Não foi possível obter gene para ID {gi_id}: {e}")
+        # Falhas de rede não entram no cache: o ID é consultado de novo na próxima vez
+        logger.warning("Não foi possível obter gene para ID %s: %s", gi_id, e)
         return None
+    gene_cache.store(gi_id, gene_symbol)
+    return gene_symbol
+
+def split_locci(protein_locci):
+    """IDs de uma célula 'TheProteinLocci'/'Locus' (separados por '|')."""
+    if pd.isna(protein_locci) or not protein_locci:
+        return []
+    return [x.strip() for x in str(protein_locci).split('|') if x.strip()]
 
-def locci_to_gene_symbols(protein_locci):
+def locci_to_gene_symbols(protein_locci, simbolos=None):
     """
     Recebe string 'TheProteinLocci' (pode conter vários IDs separados por '|')
     e retorna string com símbolos de genes separados por ', '.
+    simbolos ({ID: símbolo ou None}), se informado, é consultado antes do cache
+    e do Entrez e recebe os IDs resolvidos, para que cada ID seja buscado uma vez.
     """
-    if pd.isna(protein_locci) or not protein_locci:
+    ids = split_locci(protein_locci)
+    if not ids:
         return "N/A"
 
-    ids = [x.strip() for x in str(protein_locci).split('|') if x.strip()]
-    genes = [get_gene_symbol_from_gi(_id) for _id in ids]
+    genes = []
+    for _id in ids:
+        if simbolos is None:
+            genes.append(get_gene_symbol_from_gi(_id))
+            continue
+        if _id not in simbolos:
+            simbolos[_id] = get_gene_symbol_from_gi(_id)
+        genes.append(simbolos[_id])
     genes = list(filter(None, genes))                    
     return ", ".join(genes) if genes else "N/A"
 
+def resolve_symbols(protein_ids):
+    """
+    {ID: símbolo ou None} de vários IDs de uma vez: pelo índice local
+    (GENE_ANNOTATION_BACKEND='local') ou pelo cache de símbolos e, para os demais,
+    Entrez em lotes concorrentes (ver resolve_gene_symbols)
+    """
+    if settings.GENE_ANNOTATION_BACKEND == 'local':
+        return gene_index.lookup_many(protein_ids)
+    return resolve_gene_symbols(protein_ids)
+
+def map_gene_symbols(locci_col, simbolos):
+    """
+    Coluna Gene para uma coluna de locci: cada valor distinto é convertido uma única
+    vez (com os símbolos já resolvidos em simbolos) e o resultado é espalhado pelas
+    linhas por índice; células vazias ficam 'N/A'.
+    """
+    codigos, valores = pd.factorize(locci_col)
+    genes = np.array([locci_to_gene_symbols(valor, simbolos) for valor in valores] + ["N/A"], dtype=object)
+    return pd.Series(genes[codigos], index=locci_col.index)
+
 def obter_mapa_peptide_to_locci(df_peptides):
     """Obtém mapeamento de PeptideSequence para TheProteinLocci"""
     return (
@@ -157,20 +223,21 @@ def adicionar_colunas_scans(df_scans, mapa_locci):
     locci_col = df_scans["PeptideSequence"].map(mapa_locci)
     df_scans.insert(pos_seq + 1, "TheProteinLocci", locci_col)
 
-    gene_col = locci_col.apply(locci_to_gene_symbols)
+    simbolos = resolve_symbols({_id for valor in locci_col.dropna().unique() for _id in split_locci(valor)})
+    gene_col = map_gene_symbols(locci_col, simbolos)
     df_scans.insert(pos_seq + 2, "Gene", gene_col)
 
     return df_scans
 
-def adicionar_apenas_gene_scans(df_scans, mapa_locci):
+def adicionar_apenas_gene_scans(df_scans, mapa_locci, simbolos=None):
     """Adiciona apenas a coluna Gene ao DataFrame de scans (quando TheProteinLocci já existe)"""
     # Se TheProteinLocci já existe, usar ela diretamente
     if 'TheProteinLocci' in df_scans.columns:
-        gene_col = df_scans['TheProteinLocci'].apply(locci_to_gene_symbols)
+        gene_col = map_gene_symbols(df_scans['TheProteinLocci'], simbolos)
     else:
         # Se não existe, mapear primeiro
         locci_col = df_scans["PeptideSequence"].map(mapa_locci)
-        gene_col = locci_col.apply(locci_to_gene_symbols)
+        gene_col = map_gene_symbols(locci_col, simbolos)
     
     # Adicionar Gene como última coluna
     df_scans['Gene'] = gene_col
@@ -181,7 +248,8 @@ def adicionar_apenas_gene_scans(df_scans, mapa_locci):
 def add_genes(request):
     """Add gene information to selected sheets"""
     try:
-        if 'current_data' not in request.session:
+        dataset_id = current_dataset(request)
+        if dataset_id is None:
             return JsonResponse({'error': 'Nenhum dado disponível'}, status=400)
         
         # Parse request body to get selected sheets
@@ -194,14 +262,24 @@ def add_genes(request):
         if not selected_sheets:
             return JsonResponse({'error': 'Nenhuma planilha selecionada'}, status=400)
         
-        data = request.session['current_data'].copy()
+        data = load_selected(dataset_id, selected_sheets)
+        alteradas = {}
         messages = []
         
+        # Todos os IDs distintos das planilhas selecionadas são resolvidos de uma vez (ver resolve_symbols)
+        locci = []
+        for sheet_name, column in (('proteins', 'Locus'), ('peptides', 'TheProteinLocci'), ('scans', 'TheProteinLocci')):
+            sheet = data.get(sheet_name)
+            if sheet is not None and column in sheet.columns and (
+                    sheet_name in selected_sheets or sheet_name == 'peptides' and 'scans' in selected_sheets):
+                locci.extend(sheet[column].dropna().unique())
+        simbolos = resolve_symbols({_id for valor in locci for _id in split_locci(valor)})
+        
         # Get peptides data for mapping if needed
         peptides_df = None
         mapa_locci = None
         if 'peptides' in data:
-            peptides_df = pd.DataFrame(data['peptides']['data'])
+            peptides_df = data['peptides']
             if 'PeptideSequence' in peptides_df.columns and 'TheProteinLocci' in peptides_df.columns:
                 mapa_locci = obter_mapa_peptide_to_locci(peptides_df)
         
@@ -209,7 +287,7 @@ def add_genes(request):
             if sheet_name not in data:
                 continue
                 
-            df = pd.DataFrame(data[sheet_name]['data'])
+            df = data[sheet_name].copy()
             
             # Check if Gene column already exists
             if 'Gene' in df.columns:
@@ -220,14 +298,11 @@ def add_genes(request):
                 # For proteins, use Locus column directly
                 if 'Locus' in df.columns:
                     # Add Gene column as last column
-                    gene_col = df['Locus'].apply(locci_to_gene_symbols)
+                    gene_col = map_gene_symbols(df['Locus'], simbolos)
                     df['Gene'] = gene_col
                     
                     # Update the data
-                    data['proteins'] = {
-                        'columns': df.columns.tolist(),
-                        'data': df.fillna('').to_dict('records')
-                    }
+                    alteradas['proteins'] = df
                     
                     messages.append(f"Informações de genes adicionadas a {sheet_name.title()}")
                 else:
@@ -237,14 +312,11 @@ def add_genes(request):
                 # For peptides, use TheProteinLocci column
                 if 'TheProteinLocci' in df.columns:
                     # Add Gene column as last column
-                    gene_col = df['TheProteinLocci'].apply(locci_to_gene_symbols)
+                    gene_col = map_gene_symbols(df['TheProteinLocci'], simbolos)
                     df['Gene'] = gene_col
                     
                     # Update the data
-                    data['peptides'] = {
-                        'columns': df.columns.tolist(),
-                        'data': df.fillna('').to_dict('records')
-                    }
+                    alteradas['peptides'] = df
                     
                     messages.append(f"Informações de genes adicionadas a {sheet_name.title()}")
                 else:
@@ -254,13 +326,10 @@ def add_genes(request):
                 # For scans, add only Gene column (not TheProteinLocci)
                 if 'PeptideSequence' in df.columns and mapa_locci is not None:
                     # Use the new function that adds only Gene column
-                    df_modified = adicionar_apenas_gene_scans(df.copy(), mapa_locci)
+                    df_modified = adicionar_apenas_gene_scans(df.copy(), mapa_locci, simbolos)
                     
                     # Update the data
-                    data['scans'] = {
-                        'columns': df_modified.columns.tolist(),
-                        'data': df_modified.fillna('').to_dict('records')
-                    }
+                    alteradas['scans'] = df_modified
                     
                     # Count lines with gene information
                     linhas_c_gene = df_modified["Gene"].ne("N/A").sum()
@@ -271,12 +340,12 @@ def add_genes(request):
                     else:
                         messages.append(f"Não foi possível adicionar genes a {sheet_name.title()}: dados de peptídeos não disponíveis")
         
-        # Save updated data
-        request.session['current_data'] = data
+        # Save updated data (only the changed sheets are rewritten and returned)
+        datasets.save(dataset_id, alteradas)
         
         return JsonResponse({
             'success': True,
-            'data': data,
+            'data': workbook_payload(alteradas),
             'message': '; '.join(messages) if messages else 'Nenhuma alteração feita'
         })
         
@@ -288,22 +357,23 @@ def add_genes(request):
 def add_protein_id(request):
     """Add protein identification from peptides to scans (as last column)"""
     try:
-        if 'current_data' not in request.session:
+        dataset_id = current_dataset(request)
+        if dataset_id is None:
             return JsonResponse({'error': 'Nenhum dado disponível'}, status=400)
         
-        data = request.session['current_data'].copy()
+        data = datasets.load(dataset_id, ['scans', 'peptides'], {'peptides': PEPTIDE_MAP_COLUMNS})
         
         # Check if TheProteinLocci column already exists in scans
-        scans_df = pd.DataFrame(data['scans']['data'])
+        scans_df = data['scans']
         if 'TheProteinLocci' in scans_df.columns:
             return JsonResponse({
                 'success': True,
-                'data': data,
+                'data': {},
                 'message': 'IDs de proteínas já estão presentes em Scans'
             })
         
         # Get peptides data to create mapping
-        peptides_df = pd.DataFrame(data['peptides']['data'])
+        peptides_df = data['peptides']
         
         # Create mapping from PeptideSequence to TheProteinLocci
         mapa_locci = obter_mapa_peptide_to_locci(peptides_df)
@@ -311,30 +381,31 @@ def add_protein_id(request):
         # Add TheProteinLocci column as the last column
         scans_df['TheProteinLocci'] = scans_df["PeptideSequence"].map(mapa_locci)
         
-        # Update the data
-        data['scans'] = {
-            'columns': scans_df.columns.tolist(),
-            'data': scans_df.fillna('').to_dict('records')
-        }
-        
         # Save updated data
-        request.session['current_data'] = data
+        datasets.save(dataset_id, {'scans': scans_df})
         
+        # Only the changed sheet goes back to the page
         return JsonResponse({
             'success': True,
-            'data': data,
+            'data': workbook_payload({'scans': scans_df}),
             'message': 'IDs de proteínas adicionados a Scans'
         })
         
     except Exception as e:
         return JsonResponse({'error': f'Erro ao adicionar IDs de proteínas: {str(e)}'}, status=500)
 
+def contaminant_mask(col):
+    """Linhas cuja coluna menciona 'contaminant' (células vazias ou numéricas não contam)"""
+    # Colunas sem nenhum texto (ex.: toda vazia) chegam do dataset store como float
+    return col.fillna('').astype(str).str.contains("contaminant", case=False)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def remove_contaminants(request):
     """Remove contaminants from selected sheets"""
     try:
-        if 'current_data' not in request.session:
+        dataset_id = current_dataset(request)
+        if dataset_id is None:
             return JsonResponse({'error': 'Nenhum dado disponível'}, status=400)
         
         # Parse request body to get selected sheets
@@ -347,15 +418,16 @@ def remove_contaminants(request):
         if not selected_sheets:
             return JsonResponse({'error': 'Nenhuma planilha selecionada'}, status=400)
         
-        data = request.session['current_data'].copy()
+        data = load_selected(dataset_id, selected_sheets)
+        alteradas = {}
         total_removed = {'proteins': 0, 'peptides': 0, 'scans': 0}
         contaminant_peptides = set()
         
         # First pass: collect contaminant peptides from peptides sheet if selected
         if 'peptides' in selected_sheets and 'peptides' in data:
-            peptides_df = pd.DataFrame(data['peptides']['data'])
+            peptides_df = data['peptides']
             if 'TheProteinLocci' in peptides_df.columns:
-                mask = peptides_df["TheProteinLocci"].str.contains("contaminant", case=False, na=False)
+                mask = contaminant_mask(peptides_df["TheProteinLocci"])
                 peptides_excluded = peptides_df[mask]
                 if 'PeptideSequence' in peptides_excluded.columns:
                     contaminant_peptides.update(peptides_excluded["PeptideSequence"].unique())
@@ -365,41 +437,35 @@ def remove_contaminants(request):
             if sheet_name not in data:
                 continue
                 
-            df = pd.DataFrame(data[sheet_name]['data'])
+            df = data[sheet_name]
             original_count = len(df)
             
             if sheet_name == 'proteins':
                 # Remove contaminants from proteins based on Locus column
                 if 'Locus' in df.columns:
-                    mask = df["Locus"].str.contains("contaminant", case=False, na=False)
+                    mask = contaminant_mask(df["Locus"])
                     df_filtered = df[~mask]
                     total_removed['proteins'] = original_count - len(df_filtered)
                     
-                    data['proteins'] = {
-                        'columns': df_filtered.columns.tolist(),
-                        'data': df_filtered.fillna('').to_dict('records')
-                    }
+                    alteradas['proteins'] = df_filtered
                     
             elif sheet_name == 'peptides':
                 # Remove contaminants from peptides based on TheProteinLocci column
                 if 'TheProteinLocci' in df.columns:
-                    mask = df["TheProteinLocci"].str.contains("contaminant", case=False, na=False)
+                    mask = contaminant_mask(df["TheProteinLocci"])
                     df_filtered = df[~mask]
                     total_removed['peptides'] = original_count - len(df_filtered)
                     
-                    data['peptides'] = {
-                        'columns': df_filtered.columns.tolist(),
-                        'data': df_filtered.fillna('').to_dict('records')
-                    }
+                    alteradas['peptides'] = df_filtered
                     
             elif sheet_name == 'scans':
                 # Remove scans based on contaminant peptides
                 if 'PeptideSequence' in df.columns:
                     # If peptides sheet wasn't processed, get contaminant peptides from it
                     if not contaminant_peptides and 'peptides' in data:
-                        peptides_df = pd.DataFrame(data['peptides']['data'])
+                        peptides_df = data['peptides']
                         if 'TheProteinLocci' in peptides_df.columns:
-                            peptides_mask = peptides_df["TheProteinLocci"].str.contains("contaminant", case=False, na=False)
+                            peptides_mask = contaminant_mask(peptides_df["TheProteinLocci"])
                             contaminant_peptides.update(peptides_df[peptides_mask]["PeptideSequence"].unique())
                     
                     if contaminant_peptides:
@@ -407,10 +473,7 @@ def remove_contaminants(request):
                         df_filtered = df[~scan_mask]
                         total_removed['scans'] = original_count - len(df_filtered)
                         
-                        data['scans'] = {
-                            'columns': df_filtered.columns.tolist(),
-                            'data': df_filtered.fillna('').to_dict('records')
-                        }
+                        alteradas['scans'] = df_filtered
         
         # Create summary message
         messages = []
@@ -423,12 +486,12 @@ def remove_contaminants(request):
         else:
             message = f"Removidos {', '.join(messages)}"
         
-        # Save updated data
-        request.session['current_data'] = data
+        # Save updated data (only the changed sheets are rewritten and returned)
+        datasets.save(dataset_id, alteradas)
         
         return JsonResponse({
             'success': True,
-            'data': data,
+            'data': workbook_payload(alteradas),
             'message': message
         })
         
@@ -439,17 +502,17 @@ def remove_contaminants(request):
 def download_data(request):
     """Download current data as Excel file"""
     try:
-        if 'current_data' not in request.session:
+        dataset_id = current_dataset(request)
+        if dataset_id is None:
             return JsonResponse({'error': 'Nenhum dado disponível'}, status=400)
         
-        data = request.session['current_data']
+        data = datasets.load(dataset_id)
         
         # Create Excel file in memory
         output = io.BytesIO()
         
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            for sheet_name, sheet_data in data.items():
-                df = pd.DataFrame(sheet_data['data'])
+            for sheet_name, df in data.items():
                 df.to_excel(writer, sheet_name=sheet_name.title(), index=False)
         
         output.seek(0)